@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-import autenticador
+from autenticacao_api import autenticador
 
 
 def autenticacao(nome_api=None, versao_api=None):
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Versões assíncronas (asyncio) dos decorators do Autenticacao, usadas automaticamente quando a view decorada é uma
+corrotina. Requer Python 3.5+.
+
+As consultas que bloqueiam (o Contrato, os repositórios de chaves em banco e os caches em um backend de rede, como o
+Redis) rodam em um pool de threads limitado, ou em uma consulta assíncrona definida pela API, para não travar o event loop.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from autenticacao_api import autenticador
+from autenticacao_api import cache
+
+# O get_running_loop só existe a partir do Python 3.7. Dentro de uma corrotina o get_event_loop retorna o mesmo loop
+_loop_atual = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+def _bloqueante(objeto):
+    return getattr(objeto, 'bloqueante', False)
+
+
+def _cronometra(metricas, estagio, corrotina):
+    # Versão do metricas.Metricas.cronometra para corrotinas, que o metricas não define por rodar no Python 2
+    histograma = metricas.histograma(estagio)
+    relogio = metricas.relogio
+
+    @wraps(corrotina)
+    async def cronometrada(*args, **kwargs):
+        inicio = relogio()
+        try:
+            return await corrotina(*args, **kwargs)
+        finally:
+            histograma.registra(relogio() - inicio)
+
+    return cronometrada
+
+
+class AutenticacaoAssincrona(object):
+    """
+    Executa a autenticação de um Autenticacao dentro de um event loop, com os mesmos caches e os mesmos erros
+    """
+
+    def __init__(self, autenticacao, maximo_threads=4, consulta_assincrona=None):
+        self.autenticacao = autenticacao
+        self.executor = ThreadPoolExecutor(max_workers=maximo_threads)
+        self.consulta_assincrona = consulta_assincrona
+        self.coalescidas = 0
+        self._consultas = {}
+        self.instrumenta()
+
+    def instrumenta(self):
+        """
+        Mede o tempo do retorna_whitelabel_id assíncrono no mesmo estágio do síncrono, enquanto as métricas do
+        Autenticacao estiverem ligadas. Chamado pelo Autenticacao.define_metricas
+        :return: None
+        """
+        self.__dict__.pop('retorna_whitelabel_id', None)
+        metricas = self.autenticacao.metricas
+        if metricas is not None:
+            self.retorna_whitelabel_id = _cronometra(metricas, 'retorna_whitelabel_id', self.retorna_whitelabel_id)
+
+    async def _executa(self, funcao, *args):
+        return await _loop_atual().run_in_executor(self.executor, funcao, *args)
+
+    def _caches_whitelabel_bloqueantes(self):
+        autenticacao = self.autenticacao
+        return autenticacao.indice_whitelabel is None and (
+            _bloqueante(autenticacao.cache_whitelabel) or _bloqueante(autenticacao.cache_negativo_whitelabel))
+
+    async def _consulta_contrato_id(self, chave_whitelabel):
+        if self.consulta_assincrona is not None:
+            return await self.consulta_assincrona(chave_whitelabel)
+        return await self._executa(self.autenticacao.consulta_contrato_id, chave_whitelabel)
+
+    async def consulta_whitelabel(self, chave_whitelabel):
+        """
+        Consulta o Contrato sem bloquear o event loop. Consultas simultâneas para a mesma chave no mesmo event loop esperam
+        a mesma consulta; cada event loop (o Flask roda cada view assíncrona no seu) tem as suas consultas em andamento
+        :param chave_whitelabel: A chave_whitelabel enviada no cabeçalho
+        :type chave_whitelabel: str
+        :return: O id do contrato ou None se a chave não existir, a consulta falhar, passar do tempo limite ou o disjuntor estiver aberto
+        """
+        loop = _loop_atual()
+        chave_consulta = (loop, chave_whitelabel)
+        futuro = self._consultas.get(chave_consulta)
+        if futuro is not None:
+            self.coalescidas += 1
+            return await asyncio.shield(futuro)
+        disjuntor_whitelabel = self.autenticacao.disjuntor_whitelabel
+        permissao = None
+        if disjuntor_whitelabel is not None:
+            permissao = disjuntor_whitelabel.permite()
+            if not permissao:
+                return None
+        futuro = self._consultas[chave_consulta] = loop.create_future()
+        tempo_limite = self.autenticacao.voo_unico_whitelabel.tempo_limite
+        try:
+            try:
+                contrato_id = await asyncio.wait_for(self._consulta_contrato_id(chave_whitelabel), tempo_limite)
+            except Exception:
+                contrato_id = None
+                if disjuntor_whitelabel is not None:
+                    disjuntor_whitelabel.falha(permissao)
+            else:
+                if disjuntor_whitelabel is not None:
+                    disjuntor_whitelabel.sucesso(permissao)
+                if self._caches_whitelabel_bloqueantes():
+                    await self._executa(self.autenticacao.guarda_whitelabel, chave_whitelabel, contrato_id)
+                else:
+                    self.autenticacao.guarda_whitelabel(chave_whitelabel, contrato_id)
+            futuro.set_result(contrato_id)
+            return contrato_id
+        finally:
+            del self._consultas[chave_consulta]
+            if not futuro.done():
+                futuro.set_result(None)
+
+    async def retorna_whitelabel_id(self, chaves):
+        """
+        Versão assíncrona do Autenticacao.retorna_whitelabel_id. Com os caches de whitelabel em um backend de rede a
+        busca nos caches também roda no pool de threads
+        :param chaves: As chaves extraídas do cabeçalho AUTHORIZATION
+        :type chaves: dict
+        :return: O id do contrato ou None se a chave não for válida
+        """
+        chave_whitelabel = chaves.get("chave_whitelabel")
+        if not chave_whitelabel:
+            return None
+        if self._caches_whitelabel_bloqueantes():
+            contrato_id = await self._executa(self.autenticacao.busca_whitelabel_em_memoria, chave_whitelabel)
+        else:
+            contrato_id = self.autenticacao.busca_whitelabel_em_memoria(chave_whitelabel)
+        if contrato_id is not cache.AUSENTE:
+            return contrato_id
+        return await self.consulta_whitelabel(chave_whitelabel)
+
+    async def autentica(self, headers, politica=None):
+        """
+        Versão assíncrona do Autenticacao.autentica. Se o repositório de chaves consultar um banco, ou o cache de
+        credenciais estiver em um backend de rede, a autenticação roda no pool de threads
+        :param headers: O cabeçalho HTTP
+        :type headers: dict
+        :param politica: A política da rota, se o requerido tiver uma
+        :type politica: politica_rota.PoliticaRota
+        :return: Uma tupla com o status (200, 400, 401 ou 429) e a identidade da credencial
+        :rtype: tuple
+        """
+        repositorio = self.autenticacao.repositorio_chaves
+        if politica is None:
+            funcao, argumentos = self.autenticacao.autentica, (headers,)
+        else:
+            funcao, argumentos = self.autenticacao.autentica_politica, (politica, headers)
+        if repositorio is not None and (repositorio.bloqueante or _bloqueante(self.autenticacao.cache_credenciais)):
+            return await self._executa(funcao, *argumentos)
+        return funcao(*argumentos)
+
+    async def autentica_whitelabel(self, headers):
+        """
+        Versão assíncrona do Autenticacao.autentica_whitelabel
+        :param headers: O cabeçalho HTTP
+        :type headers: dict
+        :return: Uma tupla com o status (200, 400, 401 ou 429) e o id do contrato whitelabel
+        :rtype: tuple
+        """
+        autenticacao = self.autenticacao
+        status, valor, chave_cache = autenticacao._prepara_whitelabel(headers)
+        if status is None:
+            status, valor = autenticacao._conclui_whitelabel(await self.retorna_whitelabel_id(valor), chave_cache)
+        return autenticacao._decide_whitelabel(status, valor, headers)
+
+    def requerido(self, function, politica=None):
+        """
+        Decorator assíncrono equivalente ao Autenticacao.requerido
+        """
+        autenticacao = self.autenticacao
+
+        @wraps(function)
+        async def decorated(*args, **kwargs):
+            status, identidade = await self.autentica(autenticador.request.headers, politica)
+            if status == 400:
+                return autenticacao.erros_http().erro_400(autenticacao.lista_chaves if politica is None else politica.chaves)
+            if status == 401:
+                return autenticacao.erros_http().erro_401()
+            if status == 429:
+                return autenticacao.erros_http().erro_429()
+            if identidade is not None:
+                kwargs['identidade'] = identidade
+            return await function(*args, **kwargs)
+
+        return decorated
+
+    def whitelabel_requerido(self, function):
+        """
+        Decorator assíncrono equivalente ao Autenticacao.whitelabel_requerido
+        """
+        autenticacao = self.autenticacao
+
+        @wraps(function)
+        async def decorated(*args, **kwargs):
+            status, contrato_id = await self.autentica_whitelabel(autenticador.request.headers)
+            if status == 400:
+                return autenticacao.erros_http().erro_400(autenticacao.valores.keys())
+            if status == 401:
+                return autenticacao.erros_http().erro_401()
+            if status == 429:
+                return autenticacao.erros_http().erro_429()
+            kwargs['contrato_id'] = contrato_id
+            return await function(*args, **kwargs)
+
+        return decorated
+
+    def token_requerido(self, function):
+        """
+        Decorator assíncrono equivalente ao Autenticacao.token_requerido. A verificação do token não faz I/O
+        """
+        autenticacao = self.autenticacao
+
+        @wraps(function)
+        async def decorated(*args, **kwargs):
+            status, contrato_id = autenticacao.autentica_token(autenticador.request.headers)
+            if status == 400:
+                return autenticacao.erros_http().erro_400(autenticador.CHAVES_TOKEN)
+            if status == 401:
+                return autenticacao.erros_http().erro_401()
+            if status == 429:
+                return autenticacao.erros_http().erro_429()
+            kwargs['contrato_id'] = contrato_id
+            return await function(*args, **kwargs)
+
+        return decorated
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Registro de auditoria das decisões de autenticação sem I/O na requisição.
+
+A requisição só monta uma tupla (momento, tipo, authorization, status, valor) e a coloca numa fila limitada, um deque
+cujo append e popleft não usam trava. Uma thread em segundo plano esvazia a fila em lotes, troca o cabeçalho
+AUTHORIZATION pelo seu hash e grava o lote na saída: um arquivo com rotação, uma tabela SQLite ou um model Django.
+Com a fila cheia o registro é descartado ou, com a política BLOQUEIA, a requisição espera a fila andar.
+"""
+
+import hashlib
+import json
+import numbers
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+DESCARTA = 'descarta'
+BLOQUEIA = 'bloqueia'
+CAMPOS = ('momento', 'tipo', 'credencial', 'status', 'valor')
+
+
+def formata(registro):
+    """
+    Converte um registro da fila no registro gravado: o cabeçalho AUTHORIZATION vira os 16 primeiros caracteres do seu
+    hash sha256, para que nenhuma chave seja gravada, e uma identidade que não seja um número vira JSON
+    :param registro: A tupla (momento, tipo, authorization, status, valor)
+    :type registro: tuple
+    :return: A tupla (momento, tipo, credencial, status, valor)
+    :rtype: tuple
+    """
+    momento, tipo, authorization, status, valor = registro
+    credencial = None
+    if authorization:
+        credencial = hashlib.sha256(authorization.encode('utf-8')).hexdigest()[:16]
+    if valor is not None and not isinstance(valor, numbers.Number):
+        valor = json.dumps(valor, sort_keys=True, default=str)
+    return momento, tipo, credencial, status, valor
+
+
+class Auditoria(object):
+    """
+    Fila limitada de registros de auditoria e a thread que grava os registros em lotes
+    """
+
+    def __init__(self, saida, capacidade=10000, tamanho_lote=500, intervalo=1.0, politica=DESCARTA,
+                 tempo_maximo_espera=None, relogio=time.time):
+        """
+        :param saida: A saída com um método grava(registros)
+        :param capacidade: Quantidade máxima de registros esperando a gravação
+        :type capacidade: int
+        :param tamanho_lote: Quantidade máxima de registros em cada gravação
+        :type tamanho_lote: int
+        :param intervalo: Segundos máximos entre as gravações. Com None a thread não é criada e a gravação é feita
+        chamando o descarrega
+        :type intervalo: float
+        :param politica: DESCARTA para descartar o registro com a fila cheia, BLOQUEIA para esperar a fila andar
+        :type politica: str
+        :param tempo_maximo_espera: Com a política BLOQUEIA, segundos máximos de espera antes de descartar o registro.
+        Com None espera o tempo que for preciso, o que exige a thread de gravação (um intervalo)
+        :type tempo_maximo_espera: float
+        """
+        if politica not in (DESCARTA, BLOQUEIA):
+            raise ValueError(u"A política deve ser {} ou {}".format(DESCARTA, BLOQUEIA))
+        if politica == BLOQUEIA and intervalo is None and tempo_maximo_espera is None:
+            raise ValueError(u"Sem a thread de gravação a política {} precisa de um tempo_maximo_espera".format(BLOQUEIA))
+        self.saida = saida
+        self.capacidade = capacidade
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self.politica = politica
+        self.tempo_maximo_espera = tempo_maximo_espera
+        self.relogio = relogio
+        self.descartados = 0
+        self.bloqueios = 0
+        self.gravados = 0
+        self.perdidos = 0
+        self.falhas_gravacao = 0
+        self._fila = deque()
+        self._ha_lote = threading.Event()
+        self._espaco_livre = threading.Event()
+        self._parada = threading.Event()
+        self._trava_gravacao = threading.Lock()
+        self._thread = None
+        if intervalo is not None:
+            self._thread = threading.Thread(target=self._grava_periodicamente)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def __len__(self):
+        return len(self._fila)
+
+    def registra(self, tipo, authorization, status, valor=None):
+        """
+        Coloca uma decisão de autenticação na fila
+        :param tipo: 'requerido', 'whitelabel' ou 'token'
+        :type tipo: str
+        :param authorization: O cabeçalho AUTHORIZATION da requisição
+        :type authorization: str
+        :param status: O status da decisão (200, 400, 401 ou 429)
+        :type status: int
+        :param valor: A identidade ou o contrato_id, quando houver
+        :return: True se o registro entrou na fila, False se foi descartado
+        :rtype: bool
+        """
+        registro = (self.relogio(), tipo, authorization, status, valor)
+        fila = self._fila
+        if len(fila) >= self.capacidade:
+            if self.politica == DESCARTA or not self._espera_espaco():
+                self.descartados += 1
+                return False
+        fila.append(registro)
+        if len(fila) >= self.tamanho_lote and not self._ha_lote.is_set():
+            self._ha_lote.set()
+        return True
+
+    def _espera_espaco(self):
+        self.bloqueios += 1
+        fim = None if self.tempo_maximo_espera is None else time.time() + self.tempo_maximo_espera
+        while len(self._fila) >= self.capacidade:
+            self._espaco_livre.clear()
+            self._ha_lote.set()
+            if len(self._fila) < self.capacidade:
+                break
+            restante = None if fim is None else fim - time.time()
+            if restante is not None and restante <= 0:
+                return False
+            self._espaco_livre.wait(restante)
+        return True
+
+    def observa(self, tipo, funcao):
+        """
+        Envolve uma função de autenticação que recebe o cabeçalho HTTP como último argumento e retorna (status, valor),
+        registrando cada decisão
+        :param tipo: 'requerido', 'whitelabel' ou 'token'
+        :type tipo: str
+        :param funcao: A função de autenticação
+        :return: A função observada
+        """
+        registra = self.registra
+
+        @wraps(funcao)
+        def observada(*args, **kwargs):
+            resultado = funcao(*args, **kwargs)
+            registra(tipo, args[-1].get('AUTHORIZATION'), resultado[0], resultado[1])
+            return resultado
+
+        return observada
+
+    def descarrega(self):
+        """
+        Grava todos os registros da fila em lotes de até tamanho_lote registros. Um lote que a saída não conseguir gravar
+        é contado em perdidos
+        :return: A quantidade de registros gravados
+        :rtype: int
+        """
+        fila = self._fila
+        gravados = 0
+        with self._trava_gravacao:
+            while fila:
+                lote = []
+                try:
+                    while len(lote) < self.tamanho_lote:
+                        lote.append(fila.popleft())
+                except IndexError:
+                    pass
+                self._espaco_livre.set()
+                try:
+                    self.saida.grava([formata(registro) for registro in lote])
+                except Exception:
+                    self.falhas_gravacao += 1
+                    self.perdidos += len(lote)
+                else:
+                    gravados += len(lote)
+            self.gravados += gravados
+        return gravados
+
+    def _grava_periodicamente(self):
+        while not self._parada.is_set():
+            self._ha_lote.wait(self.intervalo)
+            self._ha_lote.clear()
+            self.descarrega()
+
+    def fecha(self, tempo_limite=5):
+        """
+        Para a thread de gravação e grava o que ainda estiver na fila
+        :param tempo_limite: Segundos máximos de espera pela thread
+        :type tempo_limite: float
+        :return: None
+        """
+        self._parada.set()
+        self._ha_lote.set()
+        if self._thread is not None:
+            self._thread.join(tempo_limite)
+        self.descarrega()
+
+    def estatisticas(self):
+        """
+        Retorna os contadores da auditoria
+        :return: Dicionário com os registros na fila, gravados, descartados com a fila cheia, perdidos em gravações que
+        falharam, as falhas de gravação e as vezes em que uma requisição esperou a fila andar
+        :rtype: dict
+        """
+        return {
+            'na_fila': len(self._fila),
+            'gravados': self.gravados,
+            'descartados': self.descartados,
+            'perdidos': self.perdidos,
+            'falhas_gravacao': self.falhas_gravacao,
+            'bloqueios': self.bloqueios,
+        }
+
+
+class SaidaMemoria(object):
+    """
+    Guarda os registros gravados em uma lista
+    """
+
+    def __init__(self):
+        self.registros = []
+
+    def grava(self, registros):
+        self.registros.extend(registros)
+
+
+class SaidaArquivo(object):
+    """
+    Acrescenta os registros a um arquivo, um JSON por linha. Quando o arquivo passa de tamanho_maximo bytes ele é
+    renomeado para caminho.1, o caminho.1 para caminho.2 e assim por diante, mantendo até quantidade_arquivos antigos
+    """
+
+    def __init__(self, caminho, tamanho_maximo=10 * 1024 * 1024, quantidade_arquivos=5):
+        self.caminho = caminho
+        self.tamanho_maximo = tamanho_maximo
+        self.quantidade_arquivos = quantidade_arquivos
+        self._arquivo = None
+        self._tamanho = 0
+
+    def _abre(self):
+        self._arquivo = open(self.caminho, 'ab')
+        self._tamanho = os.path.getsize(self.caminho)
+
+    def _rotaciona(self):
+        self._arquivo.close()
+        self._arquivo = None
+        for indice in range(self.quantidade_arquivos - 1, 0, -1):
+            origem = '{}.{}'.format(self.caminho, indice)
+            if os.path.exists(origem):
+                destino = '{}.{}'.format(self.caminho, indice + 1)
+                if os.path.exists(destino):
+                    os.remove(destino)
+                os.rename(origem, destino)
+        if self.quantidade_arquivos > 0:
+            destino = '{}.1'.format(self.caminho)
+            if os.path.exists(destino):
+                os.remove(destino)
+            os.rename(self.caminho, destino)
+        else:
+            os.remove(self.caminho)
+        self._abre()
+
+    def grava(self, registros):
+        conteudo = u''.join(json.dumps(list(registro)) + u'\n' for registro in registros).encode('utf-8')
+        if self._arquivo is None:
+            self._abre()
+        if self._tamanho and self._tamanho + len(conteudo) > self.tamanho_maximo:
+            self._rotaciona()
+        self._arquivo.write(conteudo)
+        self._arquivo.flush()
+        self._tamanho += len(conteudo)
+
+    def fecha(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+
+class SaidaSQLite(object):
+    """
+    Insere os registros em uma tabela SQLite, um lote por transação. A conexão é aberta na thread de gravação
+    """
+
+    def __init__(self, caminho, tabela='auditoria_autenticacao'):
+        self.caminho = caminho
+        self.tabela = tabela
+        self._conexao = None
+
+    def _conecta(self):
+        self._conexao = sqlite3.connect(self.caminho)
+        self._conexao.execute(
+            'CREATE TABLE IF NOT EXISTS {} (momento REAL, tipo TEXT, credencial TEXT, status INTEGER, valor TEXT)'.format(
+                self.tabela))
+
+    def grava(self, registros):
+        if self._conexao is None:
+            self._conecta()
+        with self._conexao:
+            self._conexao.executemany(
+                'INSERT INTO {} ({}) VALUES (?, ?, ?, ?, ?)'.format(self.tabela, ', '.join(CAMPOS)), registros)
+
+
+class SaidaDjango(object):
+    """
+    Insere os registros em um model Django com bulk_create, um lote por vez
+    """
+
+    def __init__(self, modelo, campos=CAMPOS):
+        """
+        :param modelo: O model, com um campo para cada item do registro. O momento é um timestamp em segundos (float)
+        :param campos: Os nomes dos campos do model, na ordem (momento, tipo, credencial, status, valor)
+        :type campos: tuple
+        """
+        self.modelo = modelo
+        self.campos = campos
+
+    def grava(self, registros):
+        modelo = self.modelo
+        campos = self.campos
+        modelo.objects.bulk_create([modelo(**dict(zip(campos, registro))) for registro in registros])
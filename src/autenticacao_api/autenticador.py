@@ -3,20 +3,190 @@
 Funcionalidades para implementar uma autenticação via chave no header para uma API Flask
 """
 
+import hashlib
+import importlib
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict, deque
 from functools import wraps
 from flask import request, make_response
-from li_common.padroes import serializacao
-from repositories.plataforma.models import Contrato
+
+from autenticacao_api import cache
+from autenticacao_api import cache_compartilhado
+from autenticacao_api import cache_distribuido
+from autenticacao_api import disjuntor
+from autenticacao_api import filtro_bloom
+from autenticacao_api import indice_whitelabel
+from autenticacao_api import limite_requisicoes
+from autenticacao_api import middleware
+from autenticacao_api import politica_rota
+from autenticacao_api import repositorio_chaves
+from autenticacao_api import token_assinado
+from autenticacao_api import voo_unico
+
+
+def e_corrotina(funcao):
+    """
+    Verifica se a função é uma corrotina (async def). No Python 2 sempre retorna False
+    """
+    verifica = getattr(inspect, 'iscoroutinefunction', None)
+    return verifica is not None and verifica(funcao)
+
+
+class ImportacaoAdiada(object):
+    """
+    Adia a importação de um módulo, ou de um nome dentro dele, até o primeiro acesso a um atributo.
+    Assim quem só usa o requerido não carrega o Django nem o li_common ao importar o autenticador.
+    """
+
+    def __init__(self, modulo, nome=None):
+        self._modulo = modulo
+        self._nome = nome
+        self._objeto = None
+
+    def _carrega(self):
+        objeto = self._objeto
+        if objeto is None:
+            objeto = importlib.import_module(self._modulo)
+            if self._nome:
+                objeto = getattr(objeto, self._nome)
+            self._objeto = objeto
+        return objeto
+
+    def __getattr__(self, atributo):
+        return getattr(self._carrega(), atributo)
+
+
+serializacao = ImportacaoAdiada('li_common.padroes.serializacao')
+Contrato = ImportacaoAdiada('repositories.plataforma.models', 'Contrato')
+
+CABECALHOS_ERRO = {'Content-Type': 'text/json; charset=utf-8'}
+CHAVES_WHITELABEL = frozenset(['chave_whitelabel'])
+CHAVES_TOKEN = frozenset(['token_whitelabel'])
+ESTAGIOS_MEDIDOS = ('extrai_chaves', 'chaves_validas', 'retorna_identidade', 'retorna_whitelabel_id')
+AUTENTICACOES_MEDIDAS = ('autentica', 'autentica_politica', '_decide_whitelabel', 'autentica_token')
+CONSULTAS_MEDIDAS = ('consulta_contrato_id', 'consulta_contratos_ids')
+AUTENTICACOES_AUDITADAS = (
+    ('autentica', 'requerido'),
+    ('autentica_politica', 'requerido'),
+    ('_decide_whitelabel', 'whitelabel'),
+    ('autentica_token', 'token'),
+)
 
 
 class ErrosHTTP(object):
     """
-    Encapsula métodos para os dois tipos de erro, 400 e 401
+    Encapsula métodos para os dois tipos de erro, 400 e 401.
+    O conteúdo serializado de cada erro é montado uma vez e reaproveitado nas próximas respostas.
     """
 
     def __init__(self, nome_api=None, versao_api=None):
         self.nome_api = nome_api
         self.versao_api = versao_api
+        self._mensagens_400 = {}
+        self._conteudos_400 = {}
+        self._conteudo_401 = None
+        self._conteudo_429 = None
+        self._respostas_wsgi = {}
+
+    def conteudo_400(self, chaves):
+        """
+        Retorna o corpo serializado do erro 400 para as chaves passadas
+        :param chaves: As chaves necessárias para fazer a autenticação.
+        :type chaves: list
+        :return: O JSON com a mensagem de erro
+        :rtype: str
+        """
+        chaves = tuple(chaves)
+        try:
+            return self._conteudos_400[chaves]
+        except KeyError:
+            pass
+        conteudo, status = serializacao.ResultadoDeApi.resposta(self.mensagem_400(chaves), self.nome_api or 'Autenticador', self.versao_api or '0.0.1', 400)
+        self._conteudos_400[chaves] = conteudo
+        return conteudo
+
+    def mensagem_400(self, chaves):
+        """
+        Retorna a mensagem do erro 400 para as chaves passadas, ainda sem serializar. Não importa o li_common
+        :param chaves: As chaves necessárias para fazer a autenticação.
+        :type chaves: list
+        :return: O dicionário com a mensagem de erro
+        :rtype: dict
+        """
+        chaves = tuple(chaves)
+        try:
+            return self._mensagens_400[chaves]
+        except KeyError:
+            pass
+        modelos = ["{} XXXXXXXX-YYYY-ZZZZ-AAAA-BBBBBBBBBBBB".format(chave) for chave in chaves]
+        mensagem = self._mensagens_400[chaves] = {
+            'mensagem': u"Adicione um cabeçalho Authorization com {} para acessar essa api. Ex.: Authorization: {}".format(", ".join(chaves), " ".join(modelos))
+        }
+        return mensagem
+
+    def conteudo_401(self):
+        """
+        Retorna o corpo serializado do erro 401
+        :return: O JSON com a mensagem de erro
+        :rtype: str
+        """
+        if self._conteudo_401 is None:
+            conteudo = {
+                'mensagem': u"Você não está autorizado a acessar essa url."
+            }
+            self._conteudo_401, status = serializacao.ResultadoDeApi.resposta(conteudo, self.nome_api or 'Autenticador', self.versao_api or '0.0.1', 401)
+        return self._conteudo_401
+
+    def conteudo_429(self):
+        """
+        Retorna o corpo serializado do erro 429. O ResultadoDeApi do li_common não tem um resultado para o 429, então o
+        corpo é montado aqui, no mesmo formato dos erros 400 e 401
+        :return: O JSON com a mensagem de erro
+        :rtype: str
+        """
+        if self._conteudo_429 is None:
+            conteudo = OrderedDict([
+                ('metadados', OrderedDict([
+                    ('versao', self.versao_api or '0.0.1'),
+                    ('resultado', 'limite_excedido'),
+                    ('api', self.nome_api or 'Autenticador'),
+                ])),
+                ('limite_excedido', {
+                    'mensagem': u"Limite de requisições excedido. Tente novamente em alguns instantes."
+                }),
+            ])
+            self._conteudo_429 = json.dumps(conteudo)
+        return self._conteudo_429
+
+    def resposta_wsgi(self, status, chaves=()):
+        """
+        Retorna o erro pronto para ser devolvido por um app WSGI, sem passar pelo Flask
+        :param status: 400, 401 ou 429
+        :type status: int
+        :param chaves: As chaves necessárias para fazer a autenticação, usadas no erro 400
+        :type chaves: list
+        :return: Uma tupla com a linha de status, a lista de cabeçalhos e o corpo em bytes
+        :rtype: tuple
+        """
+        chave = (status, tuple(chaves))
+        try:
+            return self._respostas_wsgi[chave]
+        except KeyError:
+            pass
+        if status == 400:
+            linha_status, conteudo = '400 BAD REQUEST', self.conteudo_400(chaves)
+        elif status == 429:
+            linha_status, conteudo = '429 TOO MANY REQUESTS', self.conteudo_429()
+        else:
+            linha_status, conteudo = '401 UNAUTHORIZED', self.conteudo_401()
+        if not isinstance(conteudo, bytes):
+            conteudo = conteudo.encode('utf-8')
+        cabecalhos = list(CABECALHOS_ERRO.items()) + [('Content-Length', str(len(conteudo)))]
+        resposta = self._respostas_wsgi[chave] = (linha_status, cabecalhos, conteudo)
+        return resposta
 
     def erro_400(self, chaves):
         """
@@ -26,13 +196,7 @@ class ErrosHTTP(object):
         :return: Uma tupla com dicionário com a mensagem de erro, citando um exemplo de como fazer a requisição correta e o status code 400.
         :rtype: tuple
         """
-        modelos = ["{} XXXXXXXX-YYYY-ZZZZ-AAAA-BBBBBBBBBBBB".format(chave) for chave in chaves]
-        conteudo = {
-            'mensagem': u"Adicione um cabeçalho Authorization com {} para acessar essa api. Ex.: Authorization: {}".format(", ".join(chaves), " ".join(modelos))
-        }
-        conteudo, status = serializacao.ResultadoDeApi.resposta(conteudo, self.nome_api or 'Autenticador', self.versao_api or '0.0.1', 400)
-        headers = {'Content-Type': 'text/json; charset=utf-8'}
-        return make_response(conteudo, status, headers)
+        return make_response(self.conteudo_400(chaves), 400, CABECALHOS_ERRO)
 
     def erro_401(self):
         """
@@ -40,12 +204,14 @@ class ErrosHTTP(object):
         :return: Uma tupla com dicionário com a mensagem 'Você não está autorizado a acessar essa url.' e o status code 401.
         :rtype: tuple
         """
-        conteudo = {
-            'mensagem': u"Você não está autorizado a acessar essa url."
-        }
-        conteudo, status = serializacao.ResultadoDeApi.resposta(conteudo, self.nome_api or 'Autenticador', self.versao_api or '0.0.1', 401)
-        headers = {'Content-Type': 'text/json; charset=utf-8'}
-        return make_response(conteudo, status, headers)
+        return make_response(self.conteudo_401(), 401, CABECALHOS_ERRO)
+
+    def erro_429(self):
+        """
+        Retorna a resposta de requisição de API com a mensagem padrão de erro 429, para clientes acima do limite de requisições
+        :return: A resposta com a mensagem de limite excedido e o status code 429.
+        """
+        return make_response(self.conteudo_429(), 429, CABECALHOS_ERRO)
 
 
 class Autenticacao(object):
@@ -56,6 +222,387 @@ class Autenticacao(object):
         self.nome_api = nome_api
         self.versao_api = versao_api
         self.valores = {}
+        self.valores_aceitos = {}
+        self.politicas = []
+        self.nomes_chaves = frozenset()
+        self.lista_chaves = ()
+        self.repositorio_chaves = None
+        self.cache_credenciais = None
+        self.cache_autorizacao = None
+        self._assincrona = None
+        self._erros = None
+        self.metricas = None
+        self.auditoria = None
+        self.limite_requisicoes = None
+        # Desligado até o define_cache_whitelabel: com o cache um contrato desativado segue aceito até o ttl expirar
+        self.cache_whitelabel = cache.CacheLRU(0)
+        # Também desligado: com ele um contrato recém criado segue rejeitado até o ttl_negativo expirar
+        self.cache_negativo_whitelabel = cache.CacheLRU(0, ttl=30)
+        self.filtro_whitelabel = None
+        self.taxa_falso_positivo_whitelabel = 0.01
+        self.intervalo_filtro_whitelabel = None
+        self.falsos_positivos_filtro = 0
+        self.rejeitadas_pelo_filtro = 0
+        self._proxima_reconstrucao_filtro = None
+        self._trava_filtro = threading.Lock()
+        self.voo_unico_whitelabel = voo_unico.VooUnico()
+        self.cache_obsoleto_whitelabel = None
+        self.obsoletas_servidas = 0
+        self.threads_revalidacao = 2
+        self.maximo_revalidacoes = 1000
+        self._revalidando = set()
+        self._fila_revalidacao = deque()
+        self._ha_revalidacao = threading.Semaphore(0)
+        self._threads_revalidacao = []
+        self._trava_revalidacao = threading.Lock()
+        self.disjuntor_whitelabel = None
+        self.indice_whitelabel = None
+        self.campo_alteracao_indice = None
+        self.tamanho_lote_indice = 2000
+        self.intervalo_recarga_indice = None
+        self.tempo_carga_indice = None
+        self._ultima_carga_indice = None
+        self.sincronizacoes_indice = 0
+        self.falhas_sincronizacao_indice = 0
+        self._marca_sincronizacao = None
+        self._parada_sincronizacao = None
+        self._trava_sincronizacao = threading.Lock()
+        self.verificador_token = token_assinado.VerificadorToken()
+
+    def define_cache_whitelabel(self, tamanho_maximo=10000, ttl=300, ttl_negativo=30):
+        """
+        Liga o cache de chave_whitelabel -> contrato_id usado pelo whitelabel_requerido, desligado até este método ser
+        chamado. Um contrato desativado continua aceito até o ttl expirar, a não ser que a chave seja passada ao
+        invalida_whitelabel. Um tamanho_maximo 0 desliga o cache.
+        :param tamanho_maximo: Quantidade máxima de chaves guardadas. As usadas há mais tempo são descartadas primeiro
+        :type tamanho_maximo: int
+        :param ttl: Tempo em segundos que um contrato_id fica no cache antes de ser consultado de novo
+        :type ttl: int
+        :param ttl_negativo: Tempo em segundos que uma chave inexistente fica marcada como rejeitada sem consultar o banco.
+        Um contrato criado nesse período só é aceito depois que o ttl_negativo expira ou a chave passa pelo invalida_whitelabel
+        :type ttl_negativo: int
+        :return: None
+        """
+        self.cache_whitelabel = cache.CacheLRU(tamanho_maximo, ttl)
+        self.cache_negativo_whitelabel = cache.CacheLRU(tamanho_maximo, ttl_negativo)
+
+    def define_cache_whitelabel_compartilhado(self, caminho, capacidade=65536, ttl=300):
+        """
+        Guarda o cache de chave_whitelabel -> contrato_id em um arquivo mapeado em memória, compartilhado por todos os
+        processos (workers do gunicorn) que usarem o mesmo caminho. Uma consulta feita por um worker vale para todos.
+        :param caminho: O arquivo do cache, de preferência em um tmpfs como /dev/shm
+        :type caminho: str
+        :param capacidade: Quantidade de posições da tabela. Deve ser a mesma em todos os processos
+        :type capacidade: int
+        :param ttl: Tempo em segundos que um contrato_id fica no cache antes de ser consultado de novo
+        :type ttl: int
+        :return: None
+        """
+        self.cache_whitelabel = cache_compartilhado.CacheCompartilhado(caminho, capacidade, ttl)
+
+    def define_cache_distribuido(self, backend, ttl=300, ttl_negativo=30, ttl_credencial=300, tamanho_l1=10000, ttl_l1=5,
+                                 prefixo='autenticacao_api'):
+        """
+        Guarda os caches de whitelabel e o cache de credenciais do repositório de chaves em um backend compartilhado por
+        todas as instâncias da API, como um Redis. As chaves ficam no namespace {prefixo}:{nome_api}, para que várias APIs
+        usem o mesmo servidor, e as credenciais são guardadas pelo hash, nunca pelos valores. O cache de credenciais não é
+        limpo pelo define_repositorio_chaves, que cada instância chama ao subir: uma credencial removida do repositório
+        deve ser tirada do cache com o invalida_credencial.
+        Com tamanho_l1 maior que 0 cada processo mantém um cache local na frente do compartilhado.
+        :param backend: O backend, por exemplo cache_distribuido.BackendRedis.de_url('redis://localhost:6379/0')
+        :type backend: cache_distribuido.BackendRedis
+        :param ttl: Tempo em segundos que um contrato_id fica no cache compartilhado
+        :type ttl: int
+        :param ttl_negativo: Tempo em segundos que uma chave_whitelabel inexistente fica marcada como rejeitada
+        :type ttl_negativo: int
+        :param ttl_credencial: Tempo em segundos que a identidade de uma credencial fica no cache. Um ttl_credencial 0 não
+        guarda as credenciais. As identidades devem ser serializáveis em JSON
+        :type ttl_credencial: int
+        :param tamanho_l1: Quantidade máxima de chaves no cache local de cada cache. Um tamanho_l1 0 desliga o cache local
+        :type tamanho_l1: int
+        :param ttl_l1: Tempo em segundos de um item no cache local. Uma invalidação feita em outro processo pode levar
+        até esse tempo para valer neste
+        :type ttl_l1: int
+        :param prefixo: O início do namespace das chaves no backend
+        :type prefixo: str
+        :return: None
+        """
+        namespace = u'{}:{}'.format(prefixo, self.nome_api or '')
+
+        def cria(nome, ttl_cache):
+            compartilhado = cache_distribuido.CacheDistribuido(backend, u'{}:{}'.format(namespace, nome), ttl_cache)
+            if tamanho_l1 <= 0:
+                return compartilhado
+            return cache_distribuido.CacheDuasCamadas(cache.CacheLRU(tamanho_l1, min(ttl_l1, ttl_cache)), compartilhado)
+
+        self.cache_whitelabel = cria('whitelabel', ttl)
+        self.cache_negativo_whitelabel = cria('whitelabel_negativo', ttl_negativo)
+        self.cache_credenciais = cria('credencial', ttl_credencial) if ttl_credencial > 0 else None
+
+    def invalida_whitelabel(self, chave):
+        """
+        Remove uma chave_whitelabel dos caches, forçando uma nova consulta ao Contrato na próxima requisição.
+        Se houver um filtro de whitelabel a chave é adicionada a ele, para que um contrato recém criado não precise esperar a reconstrução.
+        :param chave: A chave_whitelabel a ser removida
+        :type chave: str
+        :return: True se a chave estava no cache
+        :rtype: bool
+        """
+        self.cache_negativo_whitelabel.invalida(chave)
+        if self.cache_obsoleto_whitelabel is not None:
+            self.cache_obsoleto_whitelabel.invalida(chave)
+        self._limpa_cache_autorizacao()
+        if self.filtro_whitelabel is not None:
+            self.filtro_whitelabel.adiciona(chave)
+        return self.cache_whitelabel.invalida(chave)
+
+    def define_tempo_limite_whitelabel(self, tempo_limite):
+        """
+        Define quanto tempo uma requisição espera pela consulta ao Contrato que outra requisição já está fazendo para a mesma chave
+        :param tempo_limite: O tempo em segundos. Se esgotar a requisição é tratada como não autorizada
+        :type tempo_limite: float
+        :return: None
+        """
+        self.voo_unico_whitelabel.tempo_limite = tempo_limite
+
+    def define_revalidacao_whitelabel(self, ttl_obsoleto=3600, tamanho_maximo=10000, threads=2, maximo_pendentes=1000):
+        """
+        Mantém os contrato_id já resolvidos por mais tempo depois de expirarem no cache de whitelabel. Uma chave expirada
+        continua sendo aceita com o contrato_id antigo enquanto uma nova consulta roda em segundo plano, e segue sendo
+        aceita se o banco estiver fora do ar ou o disjuntor de whitelabel estiver aberto.
+        :param ttl_obsoleto: Tempo em segundos que um contrato_id pode ser servido depois da última consulta. None desliga
+        :type ttl_obsoleto: int
+        :param tamanho_maximo: Quantidade máxima de chaves guardadas
+        :type tamanho_maximo: int
+        :param threads: Quantidade de threads que fazem as novas consultas em segundo plano
+        :type threads: int
+        :param maximo_pendentes: Quantidade máxima de chaves esperando ou em revalidação. Com mais chaves expiradas ao mesmo
+        tempo as demais continuam sendo servidas e são revalidadas numa próxima requisição
+        :type maximo_pendentes: int
+        :return: None
+        """
+        self.threads_revalidacao = threads
+        self.maximo_revalidacoes = maximo_pendentes
+        if ttl_obsoleto:
+            self.cache_obsoleto_whitelabel = cache.CacheLRU(tamanho_maximo, ttl_obsoleto)
+        else:
+            self.cache_obsoleto_whitelabel = None
+
+    def define_disjuntor_whitelabel(self, falhas_maximas=5, tempo_espera=30, tempo_teste=None):
+        """
+        Liga um disjuntor na consulta ao Contrato: depois de falhas_maximas falhas ou tempos esgotados seguidos as chaves
+        deixam de ser consultadas por tempo_espera segundos e só as respostas em memória são usadas
+        :param falhas_maximas: Quantidade de falhas seguidas que abre o disjuntor. None desliga
+        :type falhas_maximas: int
+        :param tempo_espera: Segundos com o disjuntor aberto antes de uma consulta de teste
+        :type tempo_espera: int
+        :param tempo_teste: Segundos que a consulta de teste tem para responder antes de contar como falha, para que uma
+        consulta travada não prenda o disjuntor meio aberto. Se não for passado é o tempo_espera
+        :type tempo_teste: int
+        :return: None
+        """
+        if falhas_maximas:
+            self.disjuntor_whitelabel = disjuntor.Disjuntor(
+                falhas_maximas, tempo_espera, self._mudanca_disjuntor, tempo_teste=tempo_teste)
+        else:
+            self.disjuntor_whitelabel = None
+
+    def _mudanca_disjuntor(self, anterior, estado):
+        if self.metricas is not None:
+            self.metricas.conta('disjuntor.{}_{}'.format(anterior, estado))
+
+    def define_indice_whitelabel(self, intervalo_sincronizacao=60, campo_alteracao=None, tamanho_lote=2000,
+                                 intervalo_recarga=3600):
+        """
+        Carrega todos os contratos whitelabel ativos em um índice em memória, com uma única consulta lida em lotes, e
+        passa a resolver as chave_whitelabel só pelo índice, sem consultar o banco a cada requisição. Uma thread em
+        segundo plano mantém o índice atualizado. Deve ser chamado na inicialização da API.
+        :param intervalo_sincronizacao: Segundos entre as sincronizações. None para não sincronizar
+        :type intervalo_sincronizacao: int
+        :param campo_alteracao: Campo do Contrato com o momento da última alteração (por exemplo 'data_modificacao').
+        Se for passado cada sincronização só lê os contratos alterados desde a anterior; se não, relê todos os contratos ativos
+        :type campo_alteracao: str
+        :param tamanho_lote: Quantidade de linhas lidas do banco de cada vez
+        :type tamanho_lote: int
+        :param intervalo_recarga: Com o campo_alteracao, segundos entre as cargas completas, que tiram do índice os
+        contratos apagados do banco. None para só fazer a carga inicial
+        :type intervalo_recarga: int
+        :return: None
+        """
+        self.desliga_indice_whitelabel()
+        self.campo_alteracao_indice = campo_alteracao
+        self.intervalo_recarga_indice = intervalo_recarga
+        self.tamanho_lote_indice = tamanho_lote
+        self.carrega_indice_whitelabel()
+        if intervalo_sincronizacao:
+            parada = self._parada_sincronizacao = threading.Event()
+            thread = threading.Thread(target=self._sincroniza_periodicamente, args=(intervalo_sincronizacao, parada))
+            thread.daemon = True
+            thread.start()
+
+    def desliga_indice_whitelabel(self):
+        """
+        Para a sincronização e volta a resolver as chave_whitelabel pelos caches e pelo banco
+        :return: None
+        """
+        if self._parada_sincronizacao is not None:
+            self._parada_sincronizacao.set()
+            self._parada_sincronizacao = None
+        self.indice_whitelabel = None
+
+    def _pares_contratos(self, filtros, campos):
+        valores = Contrato.objects.filter(**filtros).values_list(*campos)
+        try:
+            return valores.iterator(chunk_size=self.tamanho_lote_indice)
+        except TypeError:
+            # Django anterior ao 2.0, sem o chunk_size: o cursor já é lido em lotes de GET_ITERATOR_CHUNK_SIZE linhas
+            return valores.iterator()
+
+    @staticmethod
+    def _acompanha_marca(linhas, marca):
+        # A maior alteração lida fica em marca[0] e só vira a marca da sincronização depois que o índice é atualizado:
+        # uma leitura interrompida no meio não pode pular os contratos que ainda não foram lidos
+        for linha in linhas:
+            if marca[0] is None or linha[-1] > marca[0]:
+                marca[0] = linha[-1]
+            yield linha
+
+    def carrega_indice_whitelabel(self):
+        """
+        Lê todos os contratos whitelabel ativos e substitui o índice
+        :return: None
+        """
+        with self._trava_sincronizacao:
+            self._carrega_indice_whitelabel()
+
+    def _carrega_indice_whitelabel(self):
+        inicio = time.time()
+        campo = self.campo_alteracao_indice
+        marca = [None]
+        if campo is None:
+            pares = self._pares_contratos({'tipo': 'whitelabel', 'ativo': True}, ('chave', 'id'))
+        else:
+            linhas = self._acompanha_marca(
+                self._pares_contratos({'tipo': 'whitelabel', 'ativo': True}, ('chave', 'id', campo)), marca)
+            pares = ((chave, contrato_id) for chave, contrato_id, _ in linhas)
+        indice = self.indice_whitelabel or indice_whitelabel.IndiceWhitelabel()
+        indice.substitui(pares)
+        self.indice_whitelabel = indice
+        self._marca_sincronizacao = marca[0]
+        # A carga completa pode ter tirado chaves do índice que o cache de autorização ainda aceita
+        self._limpa_cache_autorizacao()
+        self._ultima_carga_indice = time.time()
+        self.tempo_carga_indice = self._ultima_carga_indice - inicio
+
+    def sincroniza_indice_whitelabel(self):
+        """
+        Atualiza o índice: com o campo_alteracao lê só os contratos alterados desde a última sincronização, de qualquer
+        tipo, e troca a chave de cada um pelo seu id; os desativados ou que deixaram de ser whitelabel são removidos. A cada
+        intervalo_recarga, e sempre sem o campo_alteracao, relê todos os contratos ativos. Uma sincronização manual espera
+        a da thread em segundo plano terminar
+        :return: None
+        """
+        with self._trava_sincronizacao:
+            campo = self.campo_alteracao_indice
+            recarga = self.intervalo_recarga_indice
+            if (campo is None or self._marca_sincronizacao is None or
+                    recarga is not None and time.time() - self._ultima_carga_indice >= recarga):
+                self._carrega_indice_whitelabel()
+            else:
+                filtros = {'{}__gte'.format(campo): self._marca_sincronizacao}
+                marca = [self._marca_sincronizacao]
+                linhas = self._acompanha_marca(
+                    self._pares_contratos(filtros, ('id', 'chave', 'tipo', 'ativo', campo)), marca)
+                alteracoes = dict((contrato_id, chave if ativo and tipo == 'whitelabel' else None)
+                                  for contrato_id, chave, tipo, ativo, _ in linhas)
+                self.indice_whitelabel.aplica(alteracoes)
+                self._marca_sincronizacao = marca[0]
+                if alteracoes:
+                    self._limpa_cache_autorizacao()
+            self.sincronizacoes_indice += 1
+
+    def _sincroniza_periodicamente(self, intervalo, parada):
+        while not parada.wait(intervalo):
+            try:
+                self.sincroniza_indice_whitelabel()
+            except Exception:
+                self.falhas_sincronizacao_indice += 1
+
+    def estatisticas_indice_whitelabel(self):
+        """
+        Retorna os números do índice de whitelabel
+        :return: Dicionário com a quantidade de contratos, os bytes ocupados, o tempo da última carga completa em segundos
+        e as sincronizações feitas e que falharam, ou None se o índice estiver desligado
+        :rtype: dict
+        """
+        indice = self.indice_whitelabel
+        if indice is None:
+            return None
+        return {
+            'quantidade': len(indice),
+            'memoria': indice.memoria(),
+            'tempo_carga': self.tempo_carga_indice,
+            'sincronizacoes': self.sincronizacoes_indice,
+            'falhas_sincronizacao': self.falhas_sincronizacao_indice,
+        }
+
+    def define_filtro_whitelabel(self, taxa_falso_positivo=0.01, intervalo_reconstrucao=None):
+        """
+        Liga um filtro de Bloom com as chaves dos contratos whitelabel ativos. Chaves fora do filtro são rejeitadas sem consultar o banco.
+        :param taxa_falso_positivo: A taxa de chaves inexistentes que ainda passam pelo filtro e são consultadas no banco
+        :type taxa_falso_positivo: float
+        :param intervalo_reconstrucao: Segundos entre reconstruções do filtro, feitas em segundo plano. None para nunca reconstruir
+        :type intervalo_reconstrucao: int
+        :return: None
+        """
+        self.taxa_falso_positivo_whitelabel = taxa_falso_positivo
+        self.intervalo_filtro_whitelabel = intervalo_reconstrucao
+        self.reconstroi_filtro_whitelabel()
+
+    def reconstroi_filtro_whitelabel(self):
+        """
+        Monta um novo filtro de whitelabel com as chaves dos contratos ativos e substitui o atual
+        :return: None
+        """
+        chaves = Contrato.objects.filter(tipo='whitelabel', ativo=True).values_list('chave', flat=True)
+        self.filtro_whitelabel = filtro_bloom.FiltroBloom.com_chaves(chaves, self.taxa_falso_positivo_whitelabel)
+        if self.intervalo_filtro_whitelabel:
+            self._proxima_reconstrucao_filtro = time.time() + self.intervalo_filtro_whitelabel
+
+    def _agenda_reconstrucao_filtro(self):
+        if self._proxima_reconstrucao_filtro is None or time.time() < self._proxima_reconstrucao_filtro:
+            return
+        if not self._trava_filtro.acquire(False):
+            return
+        self._proxima_reconstrucao_filtro = None
+
+        def reconstroi():
+            try:
+                self.reconstroi_filtro_whitelabel()
+            except Exception:
+                self._proxima_reconstrucao_filtro = time.time() + self.intervalo_filtro_whitelabel
+            finally:
+                self._trava_filtro.release()
+
+        thread = threading.Thread(target=reconstroi)
+        thread.daemon = True
+        thread.start()
+
+    def estatisticas_filtro_whitelabel(self):
+        """
+        Retorna os números do filtro de whitelabel
+        :return: Dicionário com a quantidade de chaves, a taxa de falso positivo estimada, os falsos positivos vistos e as chaves rejeitadas
+        :rtype: dict
+        """
+        filtro = self.filtro_whitelabel
+        if filtro is None:
+            return None
+        return {
+            'quantidade': filtro.quantidade,
+            'taxa_falso_positivo': filtro.taxa_falso_positivo(),
+            'falsos_positivos': self.falsos_positivos_filtro,
+            'rejeitadas': self.rejeitadas_pelo_filtro
+        }
 
     def define_valor(self, nome, valor):
         """
@@ -66,7 +613,197 @@ class Autenticacao(object):
         :type valor: str
         :return: None
         """
+        if nome not in self.valores:
+            self._erros = None
         self.valores[nome] = valor
+        self.nomes_chaves = frozenset(self.valores)
+        self.lista_chaves = tuple(self.valores)
+        self._limpa_cache_autorizacao()
+        self._compila_politicas()
+
+    def aceita_valor(self, nome, valor):
+        """
+        Passa a aceitar mais um valor para a chave, além do definido com o define_valor, para trocar uma chave sem
+        interromper os clientes: aceite o valor novo, troque o valor nos clientes e remova o antigo com o remove_valor_aceito
+        :param nome: O nome de uma chave já definida com o define_valor
+        :type nome: str
+        :param valor: O valor aceito
+        :type valor: str
+        :return: None
+        """
+        if nome not in self.valores:
+            raise ValueError(u"A chave {} deve ser definida com o define_valor antes".format(nome))
+        if valor not in self.valores_aceitos.get(nome, ()):
+            self.valores_aceitos[nome] = self.valores_aceitos.get(nome, ()) + (valor,)
+        self._compila_politicas()
+
+    def remove_valor_aceito(self, nome, valor):
+        """
+        Deixa de aceitar um valor adicionado com o aceita_valor
+        :param nome: O nome da chave
+        :type nome: str
+        :param valor: O valor que deixa de ser aceito
+        :type valor: str
+        :return: True se o valor era aceito
+        :rtype: bool
+        """
+        aceitos = self.valores_aceitos.get(nome, ())
+        if valor not in aceitos:
+            return False
+        aceitos = tuple(aceito for aceito in aceitos if aceito != valor)
+        if aceitos:
+            self.valores_aceitos[nome] = aceitos
+        else:
+            del self.valores_aceitos[nome]
+        self._limpa_cache_autorizacao()
+        self._compila_politicas()
+        return True
+
+    def politica(self, chaves=None, aceita_rotacao=True):
+        """
+        Cria a política de autenticação de uma rota. A política é montada agora e remontada sempre que um valor muda,
+        então cada requisição só compara o cabeçalho com ela. A mensagem do erro 400 da rota também é montada agora, e
+        serializada no primeiro erro, para que o li_common continue sendo importado só quando for usado.
+        :param chaves: Os nomes das chaves exigidas pela rota. Se não for passado exige todas as chaves do define_valor
+        :type chaves: list
+        :param aceita_rotacao: Se True também aceita os valores adicionados com o aceita_valor
+        :type aceita_rotacao: bool
+        :return: A política
+        :rtype: politica_rota.PoliticaRota
+        """
+        politica = politica_rota.PoliticaRota(chaves, aceita_rotacao)
+        self.politicas.append(politica)
+        self._compila_politica(politica)
+        return politica
+
+    def _compila_politica(self, politica):
+        repositorio = self.repositorio_chaves
+        politica.compila(self.valores, self.valores_aceitos, repositorio.nomes if repositorio is not None else None)
+        self.erros_http().mensagem_400(politica.chaves)
+
+    def _compila_politicas(self):
+        for politica in self.politicas:
+            self._compila_politica(politica)
+
+    def define_repositorio_chaves(self, repositorio):
+        """
+        Passa a validar as credenciais em um repositório com muitas lojas/usuários, em vez dos valores únicos do define_valor.
+        A view decorada com requerido recebe a identidade dona da credencial no argumento identidade.
+        :param repositorio: O repositório com as credenciais válidas
+        :type repositorio: repositorio_chaves.RepositorioChaves
+        :return: None
+        """
+        self.repositorio_chaves = repositorio
+        self.nomes_chaves = frozenset(repositorio.nomes)
+        self.lista_chaves = repositorio.nomes
+        self._erros = None
+        self._limpa_cache_autorizacao()
+        self._compila_politicas()
+
+    def erros_http(self):
+        """
+        Retorna o ErrosHTTP da API, criado uma vez e mantido enquanto o conjunto de chaves não mudar
+        :return: O ErrosHTTP com os conteúdos de erro já serializados
+        :rtype: ErrosHTTP
+        """
+        erros = self._erros
+        if erros is None:
+            erros = ErrosHTTP(self.nome_api, self.versao_api)
+            if self.metricas is not None:
+                for nome in ('erro_400', 'erro_401', 'erro_429', 'resposta_wsgi'):
+                    setattr(erros, nome, self.metricas.cronometra('erros_http', getattr(erros, nome)))
+            self._erros = erros
+        return erros
+
+    def define_metricas(self, metricas):
+        """
+        Liga a medição da autenticação: o tempo de cada estágio (extrai_chaves, chaves_validas, retorna_identidade,
+        retorna_whitelabel_id e a montagem dos erros), os resultados ok, 400, 401 e 429, as exceções nas consultas ao
+        Contrato, as mudanças de estado do disjuntor de whitelabel e a razão de acertos dos caches. Os métodos medidos são
+        substituídos só nesta instância enquanto as métricas estão ligadas, então desligadas elas não custam nada.
+        :param metricas: As métricas que vão receber as medidas, ou None para desligar
+        :type metricas: metricas.Metricas
+        :return: None
+        """
+        self.metricas = metricas
+        self._erros = None
+        self._instrumenta()
+        if self._assincrona is not None:
+            self._assincrona.instrumenta()
+        if metricas is None:
+            return
+        metricas.adiciona_fonte('cache_whitelabel', lambda: self.cache_whitelabel.estatisticas())
+        metricas.adiciona_fonte('cache_negativo_whitelabel', lambda: self.cache_negativo_whitelabel.estatisticas())
+        metricas.adiciona_fonte('cache_autorizacao', lambda: self._estatisticas_cache('cache_autorizacao'))
+        metricas.adiciona_fonte('cache_credenciais', lambda: self._estatisticas_cache('cache_credenciais'))
+        metricas.adiciona_fonte('cache_obsoleto_whitelabel', lambda: self._estatisticas_cache('cache_obsoleto_whitelabel'))
+
+    def define_auditoria(self, auditoria):
+        """
+        Registra cada decisão de autenticação (tipo, hash do cabeçalho, status, identidade ou contrato_id e o momento)
+        na auditoria, que grava os registros em segundo plano. Como as métricas, o registro só é ligado nesta instância.
+        :param auditoria: A auditoria, ou None para desligar
+        :type auditoria: auditoria.Auditoria
+        :return: None
+        """
+        self.auditoria = auditoria
+        self._instrumenta()
+
+    def _instrumenta(self):
+        for nome in ESTAGIOS_MEDIDOS + AUTENTICACOES_MEDIDAS + CONSULTAS_MEDIDAS:
+            self.__dict__.pop(nome, None)
+        auditoria = self.auditoria
+        if auditoria is not None:
+            for nome, tipo in AUTENTICACOES_AUDITADAS:
+                setattr(self, nome, auditoria.observa(tipo, getattr(self, nome)))
+        metricas = self.metricas
+        if metricas is None:
+            return
+        for nome in ESTAGIOS_MEDIDOS:
+            setattr(self, nome, metricas.cronometra(nome, getattr(self, nome)))
+        for nome in AUTENTICACOES_MEDIDAS:
+            setattr(self, nome, metricas.conta_resultados(getattr(self, nome)))
+        for nome in CONSULTAS_MEDIDAS:
+            setattr(self, nome, metricas.conta_excecoes('consulta.excecao', getattr(self, nome)))
+
+    def _estatisticas_cache(self, nome):
+        cache_ligado = getattr(self, nome)
+        if cache_ligado is None:
+            return None
+        return cache_ligado.estatisticas()
+
+    def define_segredo(self, id_segredo, segredo):
+        """
+        Define um segredo para assinar e verificar os tokens do token_requerido. Vários segredos podem estar ativos
+        ao mesmo tempo; os novos tokens são assinados com o último definido.
+        :param id_segredo: Identificador curto do segredo, enviado no token
+        :type id_segredo: str
+        :param segredo: O segredo
+        :type segredo: str
+        :return: None
+        """
+        self.verificador_token.adiciona_segredo(id_segredo, segredo)
+
+    def remove_segredo(self, id_segredo):
+        """
+        Remove um segredo. Os tokens assinados com ele deixam de ser aceitos
+        :param id_segredo: O identificador do segredo
+        :type id_segredo: str
+        :return: None
+        """
+        self.verificador_token.remove_segredo(id_segredo)
+
+    def gera_token_whitelabel(self, contrato_id, validade=3600):
+        """
+        Gera um token assinado para ser enviado no cabeçalho Authorization como token_whitelabel <token>
+        :param contrato_id: O id do contrato whitelabel
+        :type contrato_id: int
+        :param validade: Tempo em segundos que o token é aceito
+        :type validade: int
+        :return: O token
+        :rtype: str
+        """
+        return self.verificador_token.gera(contrato_id, validade)
 
     def chaves_validas(self, chaves):
         """
@@ -76,21 +813,70 @@ class Autenticacao(object):
         :return: True caso a chave exista e o valor seja o mesmo definido. De outro jeito, False
         :rtype: bool
         """
+        if self.repositorio_chaves is not None:
+            return self.retorna_identidade(chaves) is not None
         for chave in self.valores.keys():
             if chave not in chaves:
                 return False
-            if chaves[chave] != self.valores[chave]:
+            if chaves[chave] != self.valores[chave] and chaves[chave] not in self.valores_aceitos.get(chave, ()):
                 return False
         return True
 
+    def retorna_identidade(self, chaves):
+        """
+        Busca no repositório de chaves a identidade dona da credencial
+        :param chaves: As chaves extraídas do cabeçalho AUTHORIZATION
+        :type chaves: dict
+        :return: A identidade ou None se a credencial não existir ou não houver repositório definido
+        """
+        repositorio = self.repositorio_chaves
+        if repositorio is None:
+            return None
+        cache_credenciais = self.cache_credenciais
+        if cache_credenciais is None:
+            try:
+                return repositorio.busca(chaves)
+            except Exception:
+                return None
+        digest = repositorio.digest(chaves)
+        if digest is None:
+            return None
+        identidade = cache_credenciais.obtem(digest, None)
+        if identidade is not None:
+            return identidade
+        try:
+            identidade = repositorio.busca_por_digest(digest)
+        except Exception:
+            return None
+        if identidade is not None:
+            cache_credenciais.define(digest, identidade)
+        return identidade
+
+    def invalida_credencial(self, chaves):
+        """
+        Remove uma credencial do cache de credenciais e do cache de autenticações aceitas, para que uma credencial removida
+        do repositório deixe de valer antes de expirar
+        :param chaves: Os valores das chaves da credencial
+        :type chaves: dict
+        :return: True se a credencial estava no cache de credenciais
+        :rtype: bool
+        """
+        self._limpa_cache_autorizacao()
+        if self.cache_credenciais is None or self.repositorio_chaves is None:
+            return False
+        digest = self.repositorio_chaves.digest(chaves)
+        if digest is None:
+            return False
+        return self.cache_credenciais.invalida(digest)
+
     def extrai_chaves(self, chaves, headers):
         """
         Tenta extrair as chaves de autenticação do cabeçalho HTTP passado. O cabeçalho deve conter um elemento AUTHORIZATION
-        :param chaves: Lista com as chaves que se espera existir no cabeçalho. As mesmas definidas com o Autenticador.define_valor(nome, valor)
-        :type chaves: list
+        :param chaves: As chaves que se espera existir no cabeçalho. As mesmas definidas com o Autenticador.define_valor(nome, valor). Com um frozenset cada verificação é O(1)
+        :type chaves: frozenset
         :param headers: O cabeçalho HTTP
         :type headers: dict
-        :return: As chaves extraídas do cabeçalho como um dicionário
+        :return: As chaves extraídas do cabeçalho como um dicionário ou None se o cabeçalho não tiver exatamente as chaves esperadas
         :rtype: dict
         """
         try:
@@ -103,71 +889,614 @@ class Autenticacao(object):
         if len(authorization) != len(chaves) * 2:
             return None
         resultado = {}
-        for chave in chaves:
-            if chave in authorization:
-                indice = authorization.index(chave) + 1
-                resultado[chave] = authorization[indice]
+        pares = iter(authorization)
+        for nome in pares:
+            if nome not in chaves:
+                return None
+            resultado[nome] = next(pares)
+        if len(resultado) != len(chaves):
+            return None
         return resultado
 
+    def consulta_contrato_id(self, chave_whitelabel):
+        """
+        Consulta no banco o id do Contrato whitelabel ativo com a chave passada
+        :param chave_whitelabel: A chave_whitelabel enviada no cabeçalho
+        :type chave_whitelabel: str
+        :return: O id do contrato ou None se não existir. Outros erros do banco são propagados
+        """
+        try:
+            contrato = Contrato.objects.only("id").get(
+                chave=chave_whitelabel,
+                tipo='whitelabel',
+                ativo=True)
+        except Contrato.DoesNotExist:
+            return None
+        else:
+            return contrato.id
+
     def retorna_whitelabel_id(self, chaves):
         """
-        retorna_whitelabel_id
-        :param chaves: chaves
-        :return: id
+        Retorna o id do contrato whitelabel da chave_whitelabel. Antes de consultar o banco procura no cache,
+        no cache de chaves rejeitadas, no filtro de whitelabel e no cache de contratos expirados, se estiverem ligados.
+        Requisições simultâneas para a mesma chave compartilham uma única consulta.
+        :param chaves: As chaves extraídas do cabeçalho AUTHORIZATION
+        :type chaves: dict
+        :return: O id do contrato ou None se a chave não for válida, a consulta falhar ou o disjuntor estiver aberto
         """
-        if chaves.get("chave_whitelabel"):
-            try:
-                contrato = Contrato.objects.only("id").get(
-                    chave=chaves.get("chave_whitelabel"),
-                    tipo='whitelabel',
-                    ativo=True)
-            except:
+        chave_whitelabel = chaves.get("chave_whitelabel")
+        if not chave_whitelabel:
+            return None
+        contrato_id = self.busca_whitelabel_em_memoria(chave_whitelabel)
+        if contrato_id is not cache.AUSENTE:
+            return contrato_id
+        disjuntor_whitelabel = self.disjuntor_whitelabel
+        permissao = None
+        if disjuntor_whitelabel is not None:
+            permissao = disjuntor_whitelabel.permite()
+            if not permissao:
                 return None
+        try:
+            return self.voo_unico_whitelabel.executa(
+                chave_whitelabel, self._resolve_whitelabel, chave_whitelabel, permissao)
+        except voo_unico.TempoEsgotado as erro:
+            if disjuntor_whitelabel is not None and erro.primeira:
+                disjuntor_whitelabel.falha(permissao)
+            return None
+        except Exception:
+            return None
+
+    def consulta_contratos_ids(self, chaves_whitelabel):
+        """
+        Consulta no banco, de uma vez, os ids dos Contratos whitelabel ativos com as chaves passadas
+        :param chaves_whitelabel: As chaves_whitelabel a consultar
+        :type chaves_whitelabel: list
+        :return: Pares (chave, id) dos contratos encontrados
+        :rtype: list
+        """
+        return Contrato.objects.filter(
+            chave__in=chaves_whitelabel,
+            tipo='whitelabel',
+            ativo=True).values_list('chave', 'id')
+
+    def retorna_whitelabel_ids(self, chaves_whitelabel, tamanho_lote=500):
+        """
+        Resolve várias chaves_whitelabel com uma consulta ao Contrato por lote, em vez de uma por chave.
+        As chaves repetidas são resolvidas uma vez e as que estão nos caches, buscadas com uma leitura por cache, não são
+        consultadas. Se a consulta de um lote falhar, ou o disjuntor de whitelabel estiver aberto, as chaves do lote
+        recebem o último contrato_id conhecido.
+        :param chaves_whitelabel: As chaves_whitelabel a resolver
+        :type chaves_whitelabel: list
+        :param tamanho_lote: Quantidade máxima de chaves em cada consulta
+        :type tamanho_lote: int
+        :return: Dicionário com a chave e o id do contrato, ou None para as chaves inválidas
+        :rtype: dict
+        """
+        resultado = {}
+        validas = []
+        for chave_whitelabel in set(chaves_whitelabel):
+            if chave_whitelabel:
+                validas.append(chave_whitelabel)
+            else:
+                resultado[chave_whitelabel] = None
+        indice = self.indice_whitelabel
+        if indice is not None:
+            resultado.update((chave_whitelabel, indice.obtem(chave_whitelabel)) for chave_whitelabel in validas)
+            return resultado
+        resultado.update(self.cache_whitelabel.obtem_varios(validas))
+        restantes = [chave_whitelabel for chave_whitelabel in validas if chave_whitelabel not in resultado]
+        rejeitadas = self.cache_negativo_whitelabel.obtem_varios(restantes)
+        pendentes = []
+        for chave_whitelabel in restantes:
+            if rejeitadas.get(chave_whitelabel):
+                contrato_id = None
             else:
-                return contrato.id
+                contrato_id = self._busca_whitelabel_fora_dos_caches(chave_whitelabel, revalida=False)
+            if contrato_id is cache.AUSENTE:
+                pendentes.append(chave_whitelabel)
+            else:
+                resultado[chave_whitelabel] = contrato_id
+        disjuntor_whitelabel = self.disjuntor_whitelabel
+        for inicio in range(0, len(pendentes), tamanho_lote):
+            lote = pendentes[inicio:inicio + tamanho_lote]
+            try:
+                permissao = None
+                if disjuntor_whitelabel is not None:
+                    permissao = disjuntor_whitelabel.permite()
+                    if not permissao:
+                        raise disjuntor.DisjuntorAberto()
+                try:
+                    encontrados = dict(self.consulta_contratos_ids(lote))
+                except Exception:
+                    if disjuntor_whitelabel is not None:
+                        disjuntor_whitelabel.falha(permissao)
+                    raise
+                if disjuntor_whitelabel is not None:
+                    disjuntor_whitelabel.sucesso(permissao)
+            except Exception:
+                resultado.update((chave_whitelabel, self.busca_whitelabel_obsoleto(chave_whitelabel)) for chave_whitelabel in lote)
+                continue
+            consultados = dict((chave_whitelabel, encontrados.get(chave_whitelabel)) for chave_whitelabel in lote)
+            self.guarda_whitelabels(consultados)
+            resultado.update(consultados)
+        return resultado
+
+    def busca_whitelabel_em_memoria(self, chave_whitelabel, revalida=True):
+        """
+        Resolve a chave_whitelabel só com o que está em memória: o índice de whitelabel, que quando ligado é a única fonte,
+        ou o cache, o cache de chaves rejeitadas, o filtro de whitelabel e o cache de contratos expirados.
+        Um contrato expirado é retornado e revalidado em segundo plano
+        :param chave_whitelabel: A chave_whitelabel enviada no cabeçalho
+        :type chave_whitelabel: str
+        :param revalida: Se False um contrato expirado não é usado e a chave precisa ser consultada
+        :type revalida: bool
+        :return: O id do contrato, None se a chave já foi rejeitada ou cache.AUSENTE se for preciso consultar o banco
+        """
+        indice = self.indice_whitelabel
+        if indice is not None:
+            return indice.obtem(chave_whitelabel)
+        contrato_id = self.cache_whitelabel.obtem(chave_whitelabel, None)
+        if contrato_id is not None:
+            return contrato_id
+        if self.cache_negativo_whitelabel.obtem(chave_whitelabel, None):
+            return None
+        return self._busca_whitelabel_fora_dos_caches(chave_whitelabel, revalida)
+
+    def _busca_whitelabel_fora_dos_caches(self, chave_whitelabel, revalida):
+        filtro = self.filtro_whitelabel
+        if filtro is not None:
+            self._agenda_reconstrucao_filtro()
+            if chave_whitelabel not in filtro:
+                self.rejeitadas_pelo_filtro += 1
+                return None
+        if revalida and self.cache_obsoleto_whitelabel is not None:
+            contrato_id = self.cache_obsoleto_whitelabel.obtem(chave_whitelabel, None)
+            if contrato_id is not None:
+                self.obsoletas_servidas += 1
+                self._revalida_whitelabel(chave_whitelabel)
+                return contrato_id
+        return cache.AUSENTE
+
+    def busca_whitelabel_obsoleto(self, chave_whitelabel):
+        """
+        Retorna o último contrato_id conhecido da chave_whitelabel, mesmo expirado, para quando o banco não pode ser consultado
+        :param chave_whitelabel: A chave_whitelabel
+        :type chave_whitelabel: str
+        :return: O id do contrato ou None se não houver cache de contratos expirados ou a chave não estiver nele
+        """
+        if self.cache_obsoleto_whitelabel is None or not chave_whitelabel:
+            return None
+        return self.cache_obsoleto_whitelabel.obtem(chave_whitelabel, None)
+
+    def _revalida_whitelabel(self, chave_whitelabel):
+        with self._trava_revalidacao:
+            if chave_whitelabel in self._revalidando or len(self._revalidando) >= self.maximo_revalidacoes:
+                return
+            self._revalidando.add(chave_whitelabel)
+            if len(self._threads_revalidacao) < self.threads_revalidacao:
+                thread = threading.Thread(target=self._revalida_em_segundo_plano)
+                thread.daemon = True
+                thread.start()
+                self._threads_revalidacao.append(thread)
+        self._fila_revalidacao.append(chave_whitelabel)
+        self._ha_revalidacao.release()
+
+    def _revalida_em_segundo_plano(self):
+        while True:
+            self._ha_revalidacao.acquire()
+            chave_whitelabel = self._fila_revalidacao.popleft()
+            try:
+                disjuntor_whitelabel = self.disjuntor_whitelabel
+                permissao = None
+                if disjuntor_whitelabel is not None:
+                    permissao = disjuntor_whitelabel.permite()
+                    if not permissao:
+                        continue
+                anterior = self.busca_whitelabel_obsoleto(chave_whitelabel)
+                contrato_id = self.voo_unico_whitelabel.executa(
+                    chave_whitelabel, self._resolve_whitelabel, chave_whitelabel, permissao)
+                if contrato_id != anterior:
+                    # O contrato servido expirado foi desativado ou trocado: o cache de autorização ainda o aceita
+                    self._limpa_cache_autorizacao()
+            except Exception:
+                pass
+            finally:
+                with self._trava_revalidacao:
+                    self._revalidando.discard(chave_whitelabel)
+
+    def guarda_whitelabel(self, chave_whitelabel, contrato_id):
+        """
+        Guarda o resultado de uma consulta ao Contrato nos caches de whitelabel
+        :param chave_whitelabel: A chave_whitelabel consultada
+        :type chave_whitelabel: str
+        :param contrato_id: O id do contrato ou None se a chave não existir
+        :type contrato_id: int
+        :return: None
+        """
+        self.guarda_whitelabels({chave_whitelabel: contrato_id})
+
+    def guarda_whitelabels(self, contratos_ids):
+        """
+        Guarda o resultado de várias consultas ao Contrato nos caches de whitelabel, com uma escrita por cache
+        :param contratos_ids: Dicionário com a chave_whitelabel e o id do contrato, ou None se a chave não existir
+        :type contratos_ids: dict
+        :return: None
+        """
+        cache_obsoleto = self.cache_obsoleto_whitelabel
+        encontrados = [(chave_whitelabel, contrato_id) for chave_whitelabel, contrato_id in contratos_ids.items()
+                       if contrato_id is not None]
+        rejeitadas = [chave_whitelabel for chave_whitelabel, contrato_id in contratos_ids.items() if contrato_id is None]
+        if encontrados:
+            self.cache_whitelabel.define_varios(encontrados)
+            if cache_obsoleto is not None:
+                cache_obsoleto.define_varios(encontrados)
+        if rejeitadas:
+            if self.filtro_whitelabel is not None:
+                self.falsos_positivos_filtro += len(rejeitadas)
+            self.cache_negativo_whitelabel.define_varios((chave_whitelabel, True) for chave_whitelabel in rejeitadas)
+            if cache_obsoleto is not None:
+                for chave_whitelabel in rejeitadas:
+                    cache_obsoleto.invalida(chave_whitelabel)
+
+    def _resolve_whitelabel(self, chave_whitelabel, permissao=None):
+        disjuntor_whitelabel = self.disjuntor_whitelabel
+        try:
+            contrato_id = self.consulta_contrato_id(chave_whitelabel)
+        except Exception:
+            if disjuntor_whitelabel is not None:
+                disjuntor_whitelabel.falha(permissao)
+            raise
+        if disjuntor_whitelabel is not None:
+            disjuntor_whitelabel.sucesso(permissao)
+        self.guarda_whitelabel(chave_whitelabel, contrato_id)
+        return contrato_id
 
+    def define_limite_requisicoes(self, taxa, rajada=None, capacidade=100000):
+        """
+        Liga o limite de requisições por credencial: o hash da credencial no repositório de chaves (ou as chaves extraídas
+        do cabeçalho, sem repositório) no requerido e o contrato_id no whitelabel_requerido e no token_requerido.
+        O limite é aplicado dentro do autentica, do autentica_whitelabel e do autentica_token, que retornam o status 429
+        para as requisições acima do limite.
+        :param taxa: Requisições por segundo permitidas para cada credencial, ou None para desligar o limite
+        :type taxa: float
+        :param rajada: Quantidade de requisições seguidas aceitas antes de aplicar a taxa, pelo menos 1. Se não for passada
+        é igual à taxa, ou 1 com uma taxa menor que uma requisição por segundo
+        :type rajada: int
+        :param capacidade: Quantidade máxima de credenciais acompanhadas. Com todas ocupadas a parada há mais tempo é descartada
+        :type capacidade: int
+        :return: None
+        """
+        if taxa is None:
+            self.limite_requisicoes = None
         else:
+            self.limite_requisicoes = limite_requisicoes.LimiteRequisicoes(taxa, rajada, capacidade)
+
+    def _cliente_requerido(self, chaves):
+        repositorio = self.repositorio_chaves
+        if repositorio is not None:
+            return 'requerido', repositorio.digest(chaves)
+        return 'requerido', tuple(sorted(chaves.items()))
+
+    def _limita(self, status, valor, cliente):
+        limite = self.limite_requisicoes
+        if status == 200 and limite is not None and not limite.permite(cliente):
+            return 429, valor
+        return status, valor
+
+    def define_cache_autorizacao(self, tamanho_maximo=10000, ttl=60):
+        """
+        Liga o cache de autenticações aceitas, indexado pelo hash do cabeçalho AUTHORIZATION. Uma requisição com um cabeçalho
+        já aceito não passa pela extração nem pela validação das chaves. O cache é limpo sempre que as chaves da API mudam.
+        :param tamanho_maximo: Quantidade máxima de cabeçalhos guardados. Um tamanho_maximo 0 desliga o cache
+        :type tamanho_maximo: int
+        :param ttl: Tempo em segundos que uma autenticação aceita é reaproveitada
+        :type ttl: int
+        :return: None
+        """
+        self.cache_autorizacao = cache.CacheLRU(tamanho_maximo, ttl) if tamanho_maximo > 0 else None
+
+    def _limpa_cache_autorizacao(self):
+        if self.cache_autorizacao is not None:
+            self.cache_autorizacao.limpa()
+
+    @staticmethod
+    def _chave_cache_autorizacao(tipo, headers):
+        try:
+            authorization = headers["AUTHORIZATION"]
+        except KeyError:
+            return None
+        if not authorization:
             return None
+        return tipo, hashlib.sha256(authorization.encode('utf-8')).digest()
+
+    def autentica(self, headers):
+        """
+        Executa a autenticação do requerido sobre o cabeçalho HTTP
+        :param headers: O cabeçalho HTTP
+        :type headers: dict
+        :return: Uma tupla com o status (200, 400, 401 ou 429) e a identidade da credencial, quando houver um repositório
+        de chaves
+        :rtype: tuple
+        """
+        return self._limita(*self._verifica_requerido(headers))
+
+    def _verifica_requerido(self, headers):
+        cache_autorizacao = self.cache_autorizacao
+        chave_cache = None
+        if cache_autorizacao is not None:
+            chave_cache = self._chave_cache_autorizacao('requerido', headers)
+            aceita = cache_autorizacao.obtem(chave_cache)
+            if aceita is not cache.AUSENTE:
+                return (200,) + aceita
+        chaves = self.extrai_chaves(self.nomes_chaves, headers)
+        if not chaves:
+            return 400, None, None
+        identidade = None
+        if self.repositorio_chaves is None:
+            if not self.chaves_validas(chaves):
+                return 401, None, None
+        else:
+            identidade = self.retorna_identidade(chaves)
+            if identidade is None:
+                return 401, None, None
+        cliente = None
+        if chave_cache is not None or self.limite_requisicoes is not None:
+            cliente = self._cliente_requerido(chaves)
+        if chave_cache is not None:
+            cache_autorizacao.define(chave_cache, (identidade, cliente))
+        return 200, identidade, cliente
 
-    def requerido(self, function):
+    def autentica_politica(self, politica, headers):
         """
-        Decorator para ser usado na função que deve exigir autenticação.
+        Executa a autenticação de um requerido com política sobre o cabeçalho HTTP
+        :param politica: A política da rota
+        :type politica: politica_rota.PoliticaRota
+        :param headers: O cabeçalho HTTP
+        :type headers: dict
+        :return: Uma tupla com o status (200, 400, 401 ou 429) e a identidade da credencial, quando houver um repositório
+        de chaves
+        :rtype: tuple
         """
+        chaves = self.extrai_chaves(politica.nomes, headers)
+        if not chaves:
+            return 400, None
+        if self.repositorio_chaves is None:
+            if not politica.valida(chaves):
+                return 401, None
+            return self._limita(200, None, self._cliente_requerido(chaves))
+        identidade = self.retorna_identidade(chaves)
+        if identidade is None:
+            return 401, None
+        return self._limita(200, identidade, self._cliente_requerido(chaves))
+
+    def autentica_whitelabel(self, headers):
+        """
+        Executa a autenticação do whitelabel_requerido sobre o cabeçalho HTTP
+        :param headers: O cabeçalho HTTP
+        :type headers: dict
+        :return: Uma tupla com o status (200, 400, 401 ou 429) e o id do contrato whitelabel
+        :rtype: tuple
+        """
+        status, valor, chave_cache = self._prepara_whitelabel(headers)
+        if status is None:
+            status, valor = self._conclui_whitelabel(self.retorna_whitelabel_id(valor), chave_cache)
+        return self._decide_whitelabel(status, valor, headers)
+
+    # A decisão do whitelabel_requerido é dividida em volta da consulta do contrato_id, que a versão assíncrona espera
+    # sem bloquear o event loop: as duas versões usam os mesmos passos e passam pelo mesmo _decide_whitelabel medido
+
+    def _prepara_whitelabel(self, headers):
+        cache_autorizacao = self.cache_autorizacao
+        chave_cache = None
+        if cache_autorizacao is not None:
+            chave_cache = self._chave_cache_autorizacao('whitelabel', headers)
+            contrato_id = cache_autorizacao.obtem(chave_cache)
+            if contrato_id is not cache.AUSENTE:
+                return 200, contrato_id, None
+        chaves = self.extrai_chaves(CHAVES_WHITELABEL, headers)
+        if not chaves:
+            return 400, None, None
+        return None, chaves, chave_cache
+
+    def _conclui_whitelabel(self, contrato_id, chave_cache):
+        if contrato_id is None:
+            return 401, None
+        if chave_cache is not None:
+            self.cache_autorizacao.define(chave_cache, contrato_id)
+        return 200, contrato_id
+
+    def _decide_whitelabel(self, status, contrato_id, headers):
+        return self._limita(status, contrato_id, ('contrato', contrato_id))
+
+    def autentica_token(self, headers):
+        """
+        Executa a autenticação do token_requerido sobre o cabeçalho HTTP. Não faz nenhuma consulta ao banco
+        :param headers: O cabeçalho HTTP
+        :type headers: dict
+        :return: Uma tupla com o status (200, 400, 401 ou 429) e o id do contrato do token
+        :rtype: tuple
+        """
+        status, contrato_id = self._verifica_token(headers)
+        return self._limita(status, contrato_id, ('contrato', contrato_id))
+
+    def _verifica_token(self, headers):
+        chaves = self.extrai_chaves(CHAVES_TOKEN, headers)
+        if not chaves:
+            return 400, None
+        contrato_id = self.verificador_token.verifica(chaves['token_whitelabel'])
+        if contrato_id is None:
+            return 401, None
+        return 200, contrato_id
+
+    def valida_lote(self, authorizations, tipo='whitelabel', tamanho_lote=500):
+        """
+        Autentica vários cabeçalhos Authorization de uma vez. No tipo whitelabel as chaves são resolvidas com o
+        retorna_whitelabel_ids, com uma consulta ao Contrato por lote. Cabeçalhos repetidos são autenticados uma vez.
+        :param authorizations: Os valores dos cabeçalhos Authorization
+        :type authorizations: list
+        :param tipo: 'whitelabel', 'requerido' ou 'token'
+        :type tipo: str
+        :param tamanho_lote: Quantidade máxima de chaves em cada consulta ao Contrato
+        :type tamanho_lote: int
+        :return: Uma tupla (status, identidade ou contrato_id) para cada cabeçalho, na mesma ordem
+        :rtype: list
+        """
+        authorizations = list(authorizations)
+        resultados = dict.fromkeys(authorizations)
+        if tipo == 'whitelabel':
+            chaves_por_authorization = {}
+            for authorization in resultados:
+                chaves = self.extrai_chaves(CHAVES_WHITELABEL, {'AUTHORIZATION': authorization})
+                if chaves:
+                    chaves_por_authorization[authorization] = chaves['chave_whitelabel']
+                else:
+                    resultados[authorization] = (400, None)
+            contratos_ids = self.retorna_whitelabel_ids(chaves_por_authorization.values(), tamanho_lote)
+            for authorization, chave_whitelabel in chaves_por_authorization.items():
+                contrato_id = contratos_ids[chave_whitelabel]
+                resultados[authorization] = (401, None) if contrato_id is None else (200, contrato_id)
+        elif tipo == 'requerido':
+            for authorization in resultados:
+                resultados[authorization] = self._verifica_requerido({'AUTHORIZATION': authorization})[:2]
+        elif tipo == 'token':
+            for authorization in resultados:
+                resultados[authorization] = self._verifica_token({'AUTHORIZATION': authorization})
+        else:
+            raise ValueError(u"Tipo de autenticação desconhecido: {}".format(tipo))
+        return [resultados[authorization] for authorization in authorizations]
+
+    def define_assincrono(self, maximo_threads=4, consulta_assincrona=None):
+        """
+        Configura os decorators usados em views assíncronas (async def). Requer Python 3.5+.
+        :param maximo_threads: Quantidade de threads usadas para as consultas que bloqueiam, fora do event loop
+        :type maximo_threads: int
+        :param consulta_assincrona: Corrotina opcional que recebe a chave_whitelabel e retorna o contrato_id, ou None se
+        não existir, usada no lugar da consulta ao Contrato no pool de threads
+        :return: None
+        """
+        from autenticacao_api import assincrono
+        self._assincrona = assincrono.AutenticacaoAssincrona(self, maximo_threads, consulta_assincrona)
+
+    def assincrona(self):
+        """
+        Retorna a autenticação usada pelas views assíncronas, criando-a com a configuração padrão na primeira chamada
+        :return: A autenticação assíncrona
+        :rtype: assincrono.AutenticacaoAssincrona
+        """
+        if self._assincrona is None:
+            self.define_assincrono()
+        return self._assincrona
+
+    def como_middleware(self, app, rotas=None):
+        """
+        Envolve um app WSGI (por exemplo app_flask.wsgi_app) para autenticar as requisições antes do roteamento do Flask.
+        As requisições rejeitadas recebem o 400 ou 401 já montado sem entrar no Flask. As aceitas seguem com a identidade
+        em environ['autenticacao_api.identidade'] ou o contrato em environ['autenticacao_api.contrato_id'].
+        :param app: O app WSGI
+        :param rotas: Dicionário com o prefixo do caminho e o tipo de autenticação ('requerido', 'whitelabel' ou 'token'),
+        ou uma lista de prefixos que usam o requerido. Se não for passado todas as rotas usam o requerido
+        :type rotas: dict
+        :return: O app WSGI com a autenticação
+        :rtype: middleware.MiddlewareAutenticacao
+        """
+        return middleware.MiddlewareAutenticacao(self, app, rotas)
+
+    def requerido(self, function=None, chaves=None, aceita_rotacao=True):
+        """
+        Decorator para ser usado na função que deve exigir autenticação. Aceita também views assíncronas.
+        Usado como requerido(chaves=[...], aceita_rotacao=True) a rota ganha a sua própria política, com só as chaves
+        passadas. Com aceita_rotacao=False a rota só aceita os valores do define_valor, e não os do aceita_valor.
+        """
+        if function is None:
+            return lambda function: self._requerido_com_politica(function, self.politica(chaves, aceita_rotacao))
+        if e_corrotina(function):
+            return self.assincrona().requerido(function)
+
         @wraps(function)
         def decorated(*args, **kwargs):
             """
             Valida a autenticação para o método decorado
             """
-            chaves = self.extrai_chaves(self.valores.keys(), request.headers)
-            if not chaves:
-                return ErrosHTTP(self.nome_api, self.versao_api).erro_400(self.valores.keys())
-            if not self.chaves_validas(chaves):
-                return ErrosHTTP(self.nome_api, self.versao_api).erro_401()
+            status, identidade = self.autentica(request.headers)
+            if status == 400:
+                return self.erros_http().erro_400(self.lista_chaves)
+            if status == 401:
+                return self.erros_http().erro_401()
+            if status == 429:
+                return self.erros_http().erro_429()
+            if identidade is not None:
+                kwargs['identidade'] = identidade
+            return function(*args, **kwargs)
+
+        return decorated
+
+    def _requerido_com_politica(self, function, politica):
+        if e_corrotina(function):
+            return self.assincrona().requerido(function, politica)
+
+        @wraps(function)
+        def decorated(*args, **kwargs):
+            """
+            Valida a autenticação para o método decorado com a política da rota
+            """
+            status, identidade = self.autentica_politica(politica, request.headers)
+            if status == 400:
+                return self.erros_http().erro_400(politica.chaves)
+            if status == 401:
+                return self.erros_http().erro_401()
+            if status == 429:
+                return self.erros_http().erro_429()
+            if identidade is not None:
+                kwargs['identidade'] = identidade
             return function(*args, **kwargs)
 
         return decorated
 
     def whitelabel_requerido(self, function):
         """
-        Decorator para ser usado na função que deve exigir autenticação.
+        Decorator para ser usado na função que deve exigir autenticação. Aceita também views assíncronas.
         """
+        if e_corrotina(function):
+            return self.assincrona().whitelabel_requerido(function)
 
         @wraps(function)
         def decorated(*args, **kwargs):
             """
             Valida a autenticação para o método decorado
             """
-            chaves = self.extrai_chaves(['chave_whitelabel'], request.headers)
+            status, contrato_id = self.autentica_whitelabel(request.headers)
+            if status == 400:
+                return self.erros_http().erro_400(self.valores.keys())
+            if status == 401:
+                return self.erros_http().erro_401()
+            if status == 429:
+                return self.erros_http().erro_429()
+            kwargs['contrato_id'] = contrato_id
 
-            if not chaves:
-                return ErrosHTTP(self.nome_api, self.versao_api).erro_400(self.valores.keys())
+            return function(*args, **kwargs)
 
-            # Verifica se whitelabel esta valido
-            contrato_id = self.retorna_whitelabel_id(chaves)
+        return decorated
 
-            if contrato_id is None:
-                return ErrosHTTP(self.nome_api, self.versao_api).erro_401()
+    def token_requerido(self, function):
+        """
+        Decorator para ser usado na função que deve exigir um token_whitelabel assinado. A view recebe o contrato_id do token.
+        Aceita também views assíncronas.
+        """
+        if e_corrotina(function):
+            return self.assincrona().token_requerido(function)
 
+        @wraps(function)
+        def decorated(*args, **kwargs):
+            """
+            Valida o token para o método decorado
+            """
+            status, contrato_id = self.autentica_token(request.headers)
+            if status == 400:
+                return self.erros_http().erro_400(CHAVES_TOKEN)
+            if status == 401:
+                return self.erros_http().erro_401()
+            if status == 429:
+                return self.erros_http().erro_429()
             kwargs['contrato_id'] = contrato_id
 
             return function(*args, **kwargs)
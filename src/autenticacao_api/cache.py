@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Cache em memória usado para evitar consultas repetidas ao banco durante a autenticação
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+AUSENTE = object()
+
+
+class CacheLRU(object):
+    """
+    Cache com tempo de vida (TTL), tamanho máximo e descarte do item usado há mais tempo (LRU).
+    Seguro para uso por várias threads.
+    """
+
+    def __init__(self, tamanho_maximo=10000, ttl=300, relogio=time.time):
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self.relogio = relogio
+        self.acertos = 0
+        self.falhas = 0
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+
+    def __len__(self):
+        return len(self._itens)
+
+    def obtem(self, chave, padrao=AUSENTE):
+        """
+        Retorna o valor guardado para a chave, marcando-o como usado recentemente
+        :param chave: A chave procurada
+        :param padrao: O valor retornado caso a chave não exista ou esteja expirada
+        :return: O valor guardado ou o padrão
+        """
+        with self._trava:
+            try:
+                valor, expira_em = self._itens.pop(chave)
+            except KeyError:
+                self.falhas += 1
+                return padrao
+            if expira_em <= self.relogio():
+                self.falhas += 1
+                return padrao
+            self._itens[chave] = (valor, expira_em)
+            self.acertos += 1
+            return valor
+
+    def obtem_varios(self, chaves):
+        """
+        Busca várias chaves de uma vez
+        :param chaves: As chaves procuradas
+        :type chaves: list
+        :return: Dicionário só com as chaves encontradas
+        :rtype: dict
+        """
+        encontrados = {}
+        for chave in chaves:
+            valor = self.obtem(chave)
+            if valor is not AUSENTE:
+                encontrados[chave] = valor
+        return encontrados
+
+    def define(self, chave, valor, ttl=None):
+        """
+        Guarda um valor no cache, descartando o item usado há mais tempo se o tamanho máximo for atingido
+        :param chave: A chave do item
+        :param valor: O valor a ser guardado
+        :param ttl: Tempo de vida em segundos. Se não for passado usa o ttl do cache
+        :type ttl: int
+        :return: None
+        """
+        if self.tamanho_maximo <= 0:
+            return
+        expira_em = self.relogio() + (self.ttl if ttl is None else ttl)
+        with self._trava:
+            self._itens.pop(chave, None)
+            while len(self._itens) >= self.tamanho_maximo:
+                self._itens.popitem(last=False)
+            self._itens[chave] = (valor, expira_em)
+
+    def define_varios(self, itens, ttl=None):
+        """
+        Guarda vários valores de uma vez
+        :param itens: Pares (chave, valor)
+        :type itens: list
+        :param ttl: Tempo de vida em segundos. Se não for passado usa o ttl do cache
+        :type ttl: int
+        :return: None
+        """
+        for chave, valor in itens:
+            self.define(chave, valor, ttl)
+
+    def invalida(self, chave):
+        """
+        Remove uma chave do cache
+        :param chave: A chave a ser removida
+        :return: True se a chave existia no cache
+        :rtype: bool
+        """
+        with self._trava:
+            return self._itens.pop(chave, AUSENTE) is not AUSENTE
+
+    def limpa(self):
+        """
+        Remove todos os itens do cache sem zerar os contadores
+        """
+        with self._trava:
+            self._itens.clear()
+
+    def estatisticas(self):
+        """
+        Retorna os contadores de uso do cache
+        :return: Dicionário com acertos, falhas e tamanho atual
+        :rtype: dict
+        """
+        return {'acertos': self.acertos, 'falhas': self.falhas, 'tamanho': len(self._itens)}
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Cache de inteiros compartilhado entre processos (workers do gunicorn) em um arquivo mapeado em memória.
+
+O arquivo é uma tabela hash de tamanho fixo com endereçamento aberto. Cada posição guarda o hash da chave,
+o valor e o momento em que expira, protegidos por um contador de versão (seqlock): a leitura não usa trava,
+só confere se o contador não mudou durante a leitura. As escritas usam uma trava POSIX (lockf) no arquivo, que pertence
+ao processo: workers criados com fork depois de abrir o cache (gunicorn --preload) não compartilham a trava.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+from autenticacao_api.cache import AUSENTE
+
+
+CABECALHO = struct.Struct('<4sIQ')
+POSICAO = struct.Struct('<I4x16sqd')
+VERSAO = struct.Struct('<I')
+ASSINATURA = b'LIAC'
+VERSAO_FORMATO = 1
+MAXIMO_SONDAGENS = 16
+MAXIMO_TENTATIVAS_LEITURA = 100
+VAZIO = b'\x00' * 16
+
+
+class CacheCompartilhado(object):
+    """
+    Cache com a mesma interface do cache.CacheLRU, mas guardado em um arquivo mapeado em memória
+    e visto por todos os processos que abrirem o mesmo caminho. Os valores devem ser inteiros.
+    Quando as posições possíveis de uma chave estão ocupadas, a que expira primeiro é substituída.
+    """
+
+    def __init__(self, caminho, capacidade=65536, ttl=300, relogio=time.time):
+        self.caminho = caminho
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self.relogio = relogio
+        self.acertos = 0
+        self.falhas = 0
+        self._trava = threading.Lock()
+        tamanho = CABECALHO.size + capacidade * POSICAO.size
+        self._arquivo = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o600)
+        _trava_arquivo(self._arquivo)
+        try:
+            if os.fstat(self._arquivo).st_size == 0:
+                os.ftruncate(self._arquivo, tamanho)
+                os.write(self._arquivo, CABECALHO.pack(ASSINATURA, VERSAO_FORMATO, capacidade))
+            self._mapa = mmap.mmap(self._arquivo, tamanho)
+            assinatura, versao, capacidade_arquivo = CABECALHO.unpack_from(self._mapa, 0)
+        finally:
+            _destrava_arquivo(self._arquivo)
+        if (assinatura, versao, capacidade_arquivo) != (ASSINATURA, VERSAO_FORMATO, capacidade):
+            raise ValueError(u"O arquivo {} não é um cache compartilhado com capacidade {}".format(caminho, capacidade))
+
+    def fecha(self):
+        """
+        Desfaz o mapeamento e fecha o arquivo
+        """
+        self._mapa.close()
+        os.close(self._arquivo)
+
+    def _posicoes(self, hash_chave):
+        inicio = struct.unpack_from('<Q', hash_chave)[0] % self.capacidade
+        for sondagem in range(min(MAXIMO_SONDAGENS, self.capacidade)):
+            yield CABECALHO.size + ((inicio + sondagem) % self.capacidade) * POSICAO.size
+
+    def _le(self, posicao):
+        mapa = self._mapa
+        for _ in range(MAXIMO_TENTATIVAS_LEITURA):
+            versao, hash_chave, valor, expira_em = POSICAO.unpack_from(mapa, posicao)
+            if versao & 1:
+                continue
+            if VERSAO.unpack_from(mapa, posicao)[0] == versao:
+                return hash_chave, valor, expira_em
+        return None, None, 0
+
+    def _escreve(self, posicao, hash_chave, valor, expira_em):
+        versao = (VERSAO.unpack_from(self._mapa, posicao)[0] | 1) & 0xFFFFFFFF
+        POSICAO.pack_into(self._mapa, posicao, versao, hash_chave, valor, expira_em)
+        VERSAO.pack_into(self._mapa, posicao, (versao + 1) & 0xFFFFFFFF)
+
+    @staticmethod
+    def _hash(chave):
+        if not isinstance(chave, bytes):
+            chave = chave.encode('utf-8')
+        return hashlib.md5(chave).digest()
+
+    def obtem(self, chave, padrao=AUSENTE):
+        """
+        Retorna o valor guardado para a chave sem usar trava
+        :param chave: A chave procurada
+        :param padrao: O valor retornado caso a chave não exista ou esteja expirada
+        :return: O valor guardado ou o padrão
+        """
+        hash_chave = self._hash(chave)
+        for posicao in self._posicoes(hash_chave):
+            hash_posicao, valor, expira_em = self._le(posicao)
+            if hash_posicao == hash_chave:
+                if expira_em > self.relogio():
+                    self.acertos += 1
+                    return valor
+                break
+            if hash_posicao == VAZIO:
+                break
+        self.falhas += 1
+        return padrao
+
+    def obtem_varios(self, chaves):
+        """
+        Busca várias chaves de uma vez
+        :param chaves: As chaves procuradas
+        :type chaves: list
+        :return: Dicionário só com as chaves encontradas
+        :rtype: dict
+        """
+        encontrados = {}
+        for chave in chaves:
+            valor = self.obtem(chave)
+            if valor is not AUSENTE:
+                encontrados[chave] = valor
+        return encontrados
+
+    def define(self, chave, valor, ttl=None):
+        """
+        Guarda um valor inteiro para a chave
+        :param chave: A chave do item
+        :param valor: O valor a ser guardado
+        :type valor: int
+        :param ttl: Tempo de vida em segundos. Se não for passado usa o ttl do cache
+        :type ttl: int
+        :return: None
+        """
+        agora = self.relogio()
+        self._grava(self._hash(chave), valor, agora + (self.ttl if ttl is None else ttl), agora)
+
+    def define_varios(self, itens, ttl=None):
+        """
+        Guarda vários valores inteiros de uma vez
+        :param itens: Pares (chave, valor)
+        :type itens: list
+        :param ttl: Tempo de vida em segundos. Se não for passado usa o ttl do cache
+        :type ttl: int
+        :return: None
+        """
+        for chave, valor in itens:
+            self.define(chave, valor, ttl)
+
+    def invalida(self, chave):
+        """
+        Marca a chave como expirada para todos os processos
+        :param chave: A chave a ser removida
+        :return: True se a chave existia no cache
+        :rtype: bool
+        """
+        hash_chave = self._hash(chave)
+        with self._trava_escrita():
+            for posicao in self._posicoes(hash_chave):
+                hash_posicao, valor, expira_em = self._le(posicao)
+                if hash_posicao == hash_chave:
+                    self._escreve(posicao, hash_chave, valor, 0)
+                    return expira_em > self.relogio()
+                if hash_posicao == VAZIO:
+                    break
+        return False
+
+    def limpa(self):
+        """
+        Remove todos os itens do cache para todos os processos
+        """
+        with self._trava_escrita():
+            for indice in range(self.capacidade):
+                self._escreve(CABECALHO.size + indice * POSICAO.size, VAZIO, 0, 0)
+
+    def _grava(self, hash_chave, valor, expira_em, agora):
+        with self._trava_escrita():
+            escolhida = None
+            expira_escolhida = None
+            for posicao in self._posicoes(hash_chave):
+                hash_posicao, _, expira_posicao = self._le(posicao)
+                if hash_posicao == hash_chave:
+                    escolhida = posicao
+                    break
+                if hash_posicao == VAZIO:
+                    if escolhida is None or expira_escolhida > agora:
+                        escolhida = posicao
+                    break
+                if escolhida is None or expira_posicao < expira_escolhida:
+                    escolhida, expira_escolhida = posicao, expira_posicao
+            self._escreve(escolhida, hash_chave, valor, expira_em)
+
+    def _trava_escrita(self):
+        return _TravaArquivo(self._trava, self._arquivo)
+
+    def estatisticas(self):
+        """
+        Retorna os contadores de uso deste processo e a quantidade de itens válidos no arquivo
+        :return: Dicionário com acertos, falhas e tamanho atual
+        :rtype: dict
+        """
+        agora = self.relogio()
+        tamanho = 0
+        for indice in range(self.capacidade):
+            hash_posicao, _, expira_em = self._le(CABECALHO.size + indice * POSICAO.size)
+            if hash_posicao != VAZIO and expira_em > agora:
+                tamanho += 1
+        return {'acertos': self.acertos, 'falhas': self.falhas, 'tamanho': tamanho}
+
+
+def _trava_arquivo(arquivo):
+    import fcntl
+    fcntl.lockf(arquivo, fcntl.LOCK_EX)
+
+
+def _destrava_arquivo(arquivo):
+    import fcntl
+    fcntl.lockf(arquivo, fcntl.LOCK_UN)
+
+
+class _TravaArquivo(object):
+    """
+    Trava as outras threads do processo e os outros processos durante uma escrita
+    """
+
+    def __init__(self, trava, arquivo):
+        self.trava = trava
+        self.arquivo = arquivo
+
+    def __enter__(self):
+        self.trava.acquire()
+        _trava_arquivo(self.arquivo)
+
+    def __exit__(self, *args):
+        _destrava_arquivo(self.arquivo)
+        self.trava.release()
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Caches compartilhados por todos os processos e máquinas da API, para que uma chave resolvida por um servidor valha
+para os outros e um servidor novo não comece com o cache vazio.
+
+Os backends guardam textos com tempo de vida: o BackendMemoria, dentro do processo, e o BackendRedis, que usa um
+cliente compatível com o redis-py. O CacheDistribuido dá a eles a mesma interface do cache.CacheLRU, com as chaves
+guardadas pelo hash e prefixadas pelo namespace e os valores em JSON, e o CacheDuasCamadas coloca um cache local na
+frente de um compartilhado.
+"""
+
+import binascii
+import hashlib
+import json
+import re
+import threading
+import time
+
+from autenticacao_api.cache import AUSENTE
+
+
+def texto_chave(chave):
+    """
+    Converte uma chave de cache em texto. As tuplas viram as partes separadas por ':' e os bytes viram hexadecimal
+    :param chave: A chave
+    :return: A chave em texto
+    :rtype: str
+    """
+    if isinstance(chave, tuple):
+        return ':'.join(texto_chave(parte) for parte in chave)
+    if isinstance(chave, bytes):
+        return binascii.hexlify(chave).decode('ascii')
+    return u'{}'.format(chave)
+
+
+# Caracteres especiais nos padrões do SCAN do Redis, escapados com a barra invertida
+_ESPECIAIS_GLOB = re.compile(r'([\\*?\[\]])')
+
+
+class BackendMemoria(object):
+    """
+    Backend em um dicionário do processo. Serve para testes e para APIs de um processo só
+    """
+    bloqueante = False
+
+    def __init__(self, relogio=time.time):
+        self.relogio = relogio
+        self._itens = {}
+        self._trava = threading.Lock()
+
+    def obtem_varios(self, chaves):
+        """
+        :param chaves: As chaves completas, com o namespace
+        :type chaves: list
+        :return: Os valores na mesma ordem das chaves, com None para as que não existem
+        :rtype: list
+        """
+        agora = self.relogio()
+        resultado = []
+        with self._trava:
+            for chave in chaves:
+                valor, expira_em = self._itens.get(chave, (None, 0))
+                resultado.append(valor if expira_em > agora else None)
+        return resultado
+
+    def define_varios(self, itens, ttl):
+        """
+        :param itens: Pares (chave, valor) com os valores já serializados
+        :type itens: list
+        :param ttl: Tempo de vida em segundos
+        :type ttl: float
+        :return: None
+        """
+        expira_em = self.relogio() + ttl
+        with self._trava:
+            for chave, valor in itens:
+                self._itens[chave] = (valor, expira_em)
+
+    def remove(self, chaves):
+        with self._trava:
+            for chave in chaves:
+                self._itens.pop(chave, None)
+
+    def remove_prefixo(self, prefixo):
+        with self._trava:
+            for chave in [chave for chave in self._itens if chave.startswith(prefixo)]:
+                del self._itens[chave]
+
+
+class BackendRedis(object):
+    """
+    Backend em um Redis, usando um cliente compatível com o redis-py. As leituras de várias chaves são um único MGET
+    e as escritas de várias chaves um único pipeline. Cada operação vai pela rede e, nos decorators assíncronos, roda
+    fora do event loop
+    """
+    bloqueante = True
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    @classmethod
+    def de_url(cls, url, **opcoes):
+        """
+        Cria o backend com um cliente do redis-py, que só é importado aqui
+        :param url: A url do Redis, por exemplo redis://localhost:6379/0
+        :type url: str
+        :return: O backend
+        :rtype: BackendRedis
+        """
+        import redis
+        return cls(redis.StrictRedis.from_url(url, **opcoes))
+
+    def obtem_varios(self, chaves):
+        if not chaves:
+            return []
+        return [None if valor is None else valor.decode('utf-8') if isinstance(valor, bytes) else valor
+                for valor in self.cliente.mget(chaves)]
+
+    def define_varios(self, itens, ttl):
+        pipeline = self.cliente.pipeline(transaction=False)
+        for chave, valor in itens:
+            pipeline.set(chave, valor, px=max(1, int(ttl * 1000)))
+        pipeline.execute()
+
+    def remove(self, chaves):
+        if chaves:
+            self.cliente.delete(*chaves)
+
+    def remove_prefixo(self, prefixo):
+        chaves = list(self.cliente.scan_iter(match=_ESPECIAIS_GLOB.sub(r'\\\1', prefixo) + '*', count=1000))
+        for inicio in range(0, len(chaves), 1000):
+            self.cliente.delete(*chaves[inicio:inicio + 1000])
+
+
+class CacheDistribuido(object):
+    """
+    Cache com a interface do cache.CacheLRU sobre um backend compartilhado. Os valores devem ser serializáveis em JSON.
+    As chaves são guardadas pelo hash, para que as chave_whitelabel não fiquem legíveis no backend.
+    Um erro no backend é tratado como falha de cache e contado em erros, para que a autenticação siga pelo banco.
+    """
+
+    def __init__(self, backend, namespace, ttl=300):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.acertos = 0
+        self.falhas = 0
+        self.erros = 0
+
+    @property
+    def bloqueante(self):
+        return self.backend.bloqueante
+
+    def _chave(self, chave):
+        return u'{}:{}'.format(self.namespace, hashlib.sha256(texto_chave(chave).encode('utf-8')).hexdigest())
+
+    def obtem(self, chave, padrao=AUSENTE):
+        """
+        Retorna o valor guardado para a chave
+        :param chave: A chave procurada
+        :param padrao: O valor retornado caso a chave não exista, esteja expirada ou o backend falhe
+        :return: O valor guardado ou o padrão
+        """
+        return self.obtem_varios([chave]).get(chave, padrao)
+
+    def obtem_varios(self, chaves):
+        """
+        Busca várias chaves de uma vez
+        :param chaves: As chaves procuradas
+        :type chaves: list
+        :return: Dicionário só com as chaves encontradas
+        :rtype: dict
+        """
+        chaves = list(chaves)
+        try:
+            valores = self.backend.obtem_varios([self._chave(chave) for chave in chaves])
+        except Exception:
+            self.erros += 1
+            self.falhas += len(chaves)
+            return {}
+        encontrados = dict((chave, json.loads(valor)) for chave, valor in zip(chaves, valores) if valor is not None)
+        self.acertos += len(encontrados)
+        self.falhas += len(chaves) - len(encontrados)
+        return encontrados
+
+    def define(self, chave, valor, ttl=None):
+        """
+        Guarda um valor para a chave
+        :param chave: A chave do item
+        :param valor: O valor, serializável em JSON
+        :param ttl: Tempo de vida em segundos. Se não for passado usa o ttl do cache
+        :type ttl: int
+        :return: None
+        """
+        self.define_varios([(chave, valor)], ttl)
+
+    def define_varios(self, itens, ttl=None):
+        """
+        Guarda vários valores de uma vez
+        :param itens: Pares (chave, valor)
+        :type itens: list
+        :param ttl: Tempo de vida em segundos. Se não for passado usa o ttl do cache
+        :type ttl: int
+        :return: None
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        try:
+            self.backend.define_varios([(self._chave(chave), json.dumps(valor)) for chave, valor in itens], ttl)
+        except Exception:
+            self.erros += 1
+
+    def invalida(self, chave):
+        """
+        Remove uma chave do cache
+        :param chave: A chave a ser removida
+        :return: True se a chave existia no cache
+        :rtype: bool
+        """
+        try:
+            existia = self.backend.obtem_varios([self._chave(chave)])[0] is not None
+            self.backend.remove([self._chave(chave)])
+        except Exception:
+            self.erros += 1
+            return False
+        return existia
+
+    def limpa(self):
+        """
+        Remove todos os itens do namespace
+        """
+        try:
+            self.backend.remove_prefixo(u'{}:'.format(self.namespace))
+        except Exception:
+            self.erros += 1
+
+    def estatisticas(self):
+        """
+        Retorna os contadores de uso deste processo
+        :return: Dicionário com acertos, falhas e erros do backend
+        :rtype: dict
+        """
+        return {'acertos': self.acertos, 'falhas': self.falhas, 'erros': self.erros}
+
+
+class CacheDuasCamadas(object):
+    """
+    Cache local (L1) na frente de um cache compartilhado (L2). Um acerto no L2 é copiado para o L1, e as escritas e
+    invalidações vão para os dois. O L1 deve ter um ttl curto, porque a invalidação feita por outro processo só chega
+    ao L2.
+    """
+
+    def __init__(self, local, compartilhado):
+        self.local = local
+        self.compartilhado = compartilhado
+
+    @property
+    def bloqueante(self):
+        return self.compartilhado.bloqueante
+
+    def obtem(self, chave, padrao=AUSENTE):
+        valor = self.local.obtem(chave)
+        if valor is not AUSENTE:
+            return valor
+        valor = self.compartilhado.obtem(chave)
+        if valor is AUSENTE:
+            return padrao
+        self.local.define(chave, valor)
+        return valor
+
+    def obtem_varios(self, chaves):
+        encontrados = self.local.obtem_varios(chaves)
+        faltando = [chave for chave in chaves if chave not in encontrados]
+        if faltando:
+            do_compartilhado = self.compartilhado.obtem_varios(faltando)
+            self.local.define_varios(do_compartilhado.items())
+            encontrados.update(do_compartilhado)
+        return encontrados
+
+    def define(self, chave, valor, ttl=None):
+        self.local.define(chave, valor)
+        self.compartilhado.define(chave, valor, ttl)
+
+    def define_varios(self, itens, ttl=None):
+        itens = list(itens)
+        self.local.define_varios(itens)
+        self.compartilhado.define_varios(itens, ttl)
+
+    def invalida(self, chave):
+        local = self.local.invalida(chave)
+        return self.compartilhado.invalida(chave) or local
+
+    def limpa(self):
+        self.local.limpa()
+        self.compartilhado.limpa()
+
+    def estatisticas(self):
+        """
+        Retorna os contadores das duas camadas. Os acertos somam os das duas e as falhas são as do L2, em que nenhuma
+        das camadas tinha a chave
+        :return: Dicionário com acertos, falhas, e as estatísticas do l1 e do l2
+        :rtype: dict
+        """
+        local = self.local.estatisticas()
+        compartilhado = self.compartilhado.estatisticas()
+        return {
+            'acertos': local['acertos'] + compartilhado['acertos'],
+            'falhas': compartilhado['falhas'],
+            'l1': local,
+            'l2': compartilhado,
+        }
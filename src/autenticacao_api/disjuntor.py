@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Disjuntor (circuit breaker) para consultas a um serviço que pode ficar lento ou fora do ar
+"""
+
+import threading
+import time
+
+
+FECHADO = 'fechado'
+ABERTO = 'aberto'
+MEIO_ABERTO = 'meio_aberto'
+
+
+class DisjuntorAberto(Exception):
+    """
+    Lançada por quem desiste de uma consulta porque o disjuntor está aberto
+    """
+
+
+class Disjuntor(object):
+    """
+    Depois de falhas_maximas falhas seguidas o disjuntor abre e deixa de permitir consultas por tempo_espera segundos.
+    Passado esse tempo ele fica meio aberto e permite uma única consulta de teste: se ela der certo o disjuntor fecha,
+    se falhar, ou não responder em tempo_teste segundos, ele abre de novo. Cada abertura começa uma nova geração: o resultado de uma consulta permitida antes do
+    disjuntor abrir não muda mais o seu estado.
+    """
+
+    def __init__(self, falhas_maximas=5, tempo_espera=30, ao_mudar=None, relogio=time.time, tempo_teste=None):
+        self.falhas_maximas = falhas_maximas
+        self.tempo_espera = tempo_espera
+        self.tempo_teste = tempo_espera if tempo_teste is None else tempo_teste
+        self.ao_mudar = ao_mudar
+        self.relogio = relogio
+        self.estado = FECHADO
+        self.falhas_seguidas = 0
+        self.rejeitadas = 0
+        self.transicoes = {}
+        self._reabre_em = 0
+        self._geracao = 1
+        self._em_teste = False
+        self._teste_expira_em = 0
+        self._trava = threading.Lock()
+
+    def _muda(self, estado):
+        anterior = self.estado
+        if anterior == estado:
+            return
+        self.estado = estado
+        transicao = '{}_{}'.format(anterior, estado)
+        self.transicoes[transicao] = self.transicoes.get(transicao, 0) + 1
+        if self.ao_mudar is not None:
+            self.ao_mudar(anterior, estado)
+
+    def permite(self):
+        """
+        Verifica se uma consulta pode ser feita. Quem recebe a permissão deve passá-la ao sucesso ou à falha depois da
+        consulta
+        :return: A geração do disjuntor, sempre maior que zero, se o disjuntor está fechado ou se esta é a consulta de
+        teste do disjuntor meio aberto. False se a consulta não pode ser feita
+        :rtype: int
+        """
+        if self.estado == FECHADO:
+            return self._geracao
+        with self._trava:
+            agora = self.relogio()
+            if self.estado == MEIO_ABERTO and self._em_teste and agora >= self._teste_expira_em:
+                # A consulta de teste travou: conta como falha, e o resultado que ela trouxer depois é de outra geração
+                self._abre(agora)
+            if self.estado == ABERTO and agora >= self._reabre_em:
+                self._muda(MEIO_ABERTO)
+            if self.estado == MEIO_ABERTO and not self._em_teste:
+                self._em_teste = True
+                self._teste_expira_em = agora + self.tempo_teste
+                return self._geracao
+            if self.estado == FECHADO:
+                return self._geracao
+            self.rejeitadas += 1
+            return False
+
+    def sucesso(self, permissao=None):
+        """
+        Registra uma consulta que deu certo, fechando o disjuntor
+        :param permissao: O retorno do permite que liberou a consulta. Se for de uma geração anterior, permitida antes do
+        disjuntor abrir, o sucesso é ignorado
+        :type permissao: int
+        :return: None
+        """
+        if self.estado == FECHADO and not self.falhas_seguidas:
+            return
+        with self._trava:
+            if permissao is not None and permissao != self._geracao:
+                return
+            self.falhas_seguidas = 0
+            self._em_teste = False
+            self._muda(FECHADO)
+
+    def falha(self, permissao=None):
+        """
+        Registra uma consulta que falhou ou esgotou o tempo, abrindo o disjuntor se for preciso
+        :param permissao: O retorno do permite que liberou a consulta. Se for de uma geração anterior, permitida antes do
+        disjuntor abrir, a falha é ignorada
+        :type permissao: int
+        :return: None
+        """
+        with self._trava:
+            if permissao is not None and permissao != self._geracao:
+                return
+            self.falhas_seguidas += 1
+            if self.estado == ABERTO:
+                return
+            if self.estado == MEIO_ABERTO or self.falhas_seguidas >= self.falhas_maximas:
+                self._abre(self.relogio())
+
+    def _abre(self, agora):
+        self._em_teste = False
+        self._reabre_em = agora + self.tempo_espera
+        self._geracao += 1
+        self._muda(ABERTO)
+
+    def estatisticas(self):
+        """
+        Retorna o estado e os contadores do disjuntor
+        :return: Dicionário com o estado, as falhas seguidas, as consultas rejeitadas e as transições de estado
+        :rtype: dict
+        """
+        return {
+            'estado': self.estado,
+            'falhas_seguidas': self.falhas_seguidas,
+            'rejeitadas': self.rejeitadas,
+            'transicoes': dict(self.transicoes),
+        }
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Filtro de Bloom para rejeitar chaves desconhecidas sem consultar o banco
+"""
+
+import hashlib
+import math
+import struct
+
+
+def _em_bytes(valor):
+    if isinstance(valor, bytes):
+        return valor
+    return valor.encode('utf-8')
+
+
+class FiltroBloom(object):
+    """
+    Conjunto probabilístico: se diz que uma chave não existe, ela com certeza não existe.
+    Se diz que existe, pode ser um falso positivo com a taxa configurada.
+    """
+
+    def __init__(self, capacidade, taxa_falso_positivo=0.01):
+        capacidade = max(int(capacidade), 1)
+        self.capacidade = capacidade
+        self.taxa_falso_positivo_desejada = taxa_falso_positivo
+        self.total_bits = max(int(-capacidade * math.log(taxa_falso_positivo) / (math.log(2) ** 2)), 8)
+        self.total_hashes = max(int(round(float(self.total_bits) / capacidade * math.log(2))), 1)
+        self.quantidade = 0
+        self._bits = bytearray((self.total_bits + 7) // 8)
+
+    @classmethod
+    def com_chaves(cls, chaves, taxa_falso_positivo=0.01):
+        """
+        Cria um filtro dimensionado para as chaves passadas e já preenchido com elas
+        :param chaves: As chaves que devem ser reconhecidas pelo filtro
+        :type chaves: list
+        :param taxa_falso_positivo: A taxa de falsos positivos aceitável
+        :type taxa_falso_positivo: float
+        :return: O filtro preenchido
+        :rtype: FiltroBloom
+        """
+        chaves = list(chaves)
+        filtro = cls(len(chaves), taxa_falso_positivo)
+        for chave in chaves:
+            filtro.adiciona(chave)
+        return filtro
+
+    def _posicoes(self, chave):
+        primeiro, segundo = struct.unpack('<QQ', hashlib.md5(_em_bytes(chave)).digest())
+        return [(primeiro + indice * segundo) % self.total_bits for indice in range(self.total_hashes)]
+
+    def adiciona(self, chave):
+        """
+        Adiciona uma chave ao filtro
+        :param chave: A chave a ser adicionada
+        :type chave: str
+        :return: None
+        """
+        for posicao in self._posicoes(chave):
+            self._bits[posicao >> 3] |= 1 << (posicao & 7)
+        self.quantidade += 1
+
+    def __contains__(self, chave):
+        bits = self._bits
+        for posicao in self._posicoes(chave):
+            if not bits[posicao >> 3] & (1 << (posicao & 7)):
+                return False
+        return True
+
+    def taxa_falso_positivo(self):
+        """
+        Estima a taxa de falsos positivos atual a partir da proporção de bits ligados
+        :return: A probabilidade de uma chave inexistente ser aceita pelo filtro
+        :rtype: float
+        """
+        ligados = sum(bin(byte).count('1') for byte in self._bits)
+        return (float(ligados) / self.total_bits) ** self.total_hashes
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Índice compacto em memória de chave_whitelabel -> contrato_id.
+
+As chaves não são guardadas: cada uma é representada pelo seu hash md5 de 16 bytes, dividido em um prefixo de 4 bytes,
+num array ordenado onde a busca é binária, e os 12 bytes restantes, confirmados depois. Junto com o array de ids cada
+contrato ocupa cerca de 24 bytes, algo como 2,4 MB para 100 mil contratos.
+
+As alterações montam tabelas novas, trocadas de uma vez: as leituras nunca usam trava nem veem uma tabela pela metade.
+"""
+
+import bisect
+import hashlib
+import struct
+from array import array
+
+PREFIXO = struct.Struct('>I')
+TAMANHO_SUFIXO = 12
+
+
+def _digest(chave):
+    if not isinstance(chave, bytes):
+        chave = chave.encode('utf-8')
+    return hashlib.md5(chave).digest()
+
+
+def _monta(entradas):
+    entradas = sorted(entradas)
+    prefixos = array('I', (PREFIXO.unpack_from(digest)[0] for digest, _ in entradas))
+    sufixos = b''.join(digest[4:] for digest, _ in entradas)
+    ids = array('l', (contrato_id for _, contrato_id in entradas))
+    return prefixos, sufixos, ids
+
+
+class IndiceWhitelabel(object):
+    """
+    Índice de chave_whitelabel -> contrato_id dos contratos ativos
+    """
+
+    def __init__(self, pares=()):
+        self._tabela = _monta((_digest(chave), contrato_id) for chave, contrato_id in pares)
+
+    def __len__(self):
+        return len(self._tabela[0])
+
+    def obtem(self, chave):
+        """
+        Procura o contrato da chave
+        :param chave: A chave_whitelabel
+        :type chave: str
+        :return: O id do contrato ou None se a chave não estiver no índice
+        :rtype: int
+        """
+        prefixos, sufixos, ids = self._tabela
+        digest = _digest(chave)
+        prefixo = PREFIXO.unpack_from(digest)[0]
+        sufixo = digest[4:]
+        posicao = bisect.bisect_left(prefixos, prefixo)
+        while posicao < len(prefixos) and prefixos[posicao] == prefixo:
+            inicio = posicao * TAMANHO_SUFIXO
+            if sufixos[inicio:inicio + TAMANHO_SUFIXO] == sufixo:
+                return ids[posicao]
+            posicao += 1
+        return None
+
+    def _entradas(self):
+        prefixos, sufixos, ids = self._tabela
+        for posicao, prefixo in enumerate(prefixos):
+            inicio = posicao * TAMANHO_SUFIXO
+            yield PREFIXO.pack(prefixo) + sufixos[inicio:inicio + TAMANHO_SUFIXO], ids[posicao]
+
+    def substitui(self, pares):
+        """
+        Troca todo o conteúdo do índice
+        :param pares: Pares (chave, contrato_id) dos contratos ativos. Pode ser um iterador, lido uma única vez
+        :return: None
+        """
+        self._tabela = _monta((_digest(chave), contrato_id) for chave, contrato_id in pares)
+
+    def aplica(self, alteracoes):
+        """
+        Aplica alterações de contratos. A chave antiga de cada contrato alterado sai do índice, mesmo que tenha mudado
+        :param alteracoes: Dicionário com o contrato_id e a sua chave atual, ou None para remover o contrato
+        :type alteracoes: dict
+        :return: None
+        """
+        if not alteracoes:
+            return
+        novas = dict((_digest(chave), contrato_id) for contrato_id, chave in alteracoes.items() if chave is not None)
+        entradas = [(digest, contrato_id) for digest, contrato_id in self._entradas()
+                    if contrato_id not in alteracoes and digest not in novas]
+        entradas.extend(novas.items())
+        self._tabela = _monta(entradas)
+
+    def memoria(self):
+        """
+        Retorna o tamanho das tabelas do índice
+        :return: A quantidade de bytes usada pelos arrays do índice
+        :rtype: int
+        """
+        prefixos, sufixos, ids = self._tabela
+        return len(prefixos) * prefixos.itemsize + len(sufixos) + len(ids) * ids.itemsize
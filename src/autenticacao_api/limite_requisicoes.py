@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Limite de requisições por credencial com token bucket.
+
+Os baldes ficam em arrays de tamanho fixo (fichas e momento da última atualização) indexados por posição, e um
+dicionário liga cada cliente à sua posição. A ordem de uso é uma lista duplamente ligada também em arrays, então
+cada requisição é O(1) e, com todas as posições ocupadas, o cliente parado há mais tempo perde a sua. A memória
+fica limitada pela capacidade, qualquer que seja a quantidade de clientes distintos.
+"""
+
+import threading
+import time
+from array import array
+
+
+class LimiteRequisicoes(object):
+    """
+    Token bucket por cliente: cada cliente tem até rajada fichas, repostas na taxa por segundo, e cada requisição gasta uma
+    """
+
+    def __init__(self, taxa, rajada=None, capacidade=100000, relogio=time.time):
+        if taxa <= 0:
+            raise ValueError(u"A taxa deve ser maior que zero")
+        if rajada is not None and rajada < 1:
+            raise ValueError(u"A rajada deve ser de pelo menos uma requisição")
+        self.taxa = float(taxa)
+        self.rajada = float(rajada if rajada is not None else max(1.0, taxa))
+        self.capacidade = capacidade
+        self.relogio = relogio
+        self.rejeitadas = 0
+        self.descartados = 0
+        self._fichas = array('d', [0.0]) * capacidade
+        self._atualizado_em = array('d', [0.0]) * capacidade
+        self._anteriores = array('l', [-1]) * capacidade
+        self._proximos = array('l', [-1]) * capacidade
+        self._clientes = [None] * capacidade
+        self._posicoes = {}
+        self._inicio = -1
+        self._fim = -1
+        self._trava = threading.Lock()
+
+    def __len__(self):
+        return len(self._posicoes)
+
+    def _desliga(self, posicao):
+        anterior = self._anteriores[posicao]
+        proximo = self._proximos[posicao]
+        if anterior == -1:
+            self._inicio = proximo
+        else:
+            self._proximos[anterior] = proximo
+        if proximo == -1:
+            self._fim = anterior
+        else:
+            self._anteriores[proximo] = anterior
+
+    def _liga_no_inicio(self, posicao):
+        self._anteriores[posicao] = -1
+        self._proximos[posicao] = self._inicio
+        if self._inicio != -1:
+            self._anteriores[self._inicio] = posicao
+        self._inicio = posicao
+        if self._fim == -1:
+            self._fim = posicao
+
+    def _reserva(self, cliente, agora):
+        quantidade = len(self._posicoes)
+        if quantidade < self.capacidade:
+            posicao = quantidade
+        else:
+            posicao = self._fim
+            self._desliga(posicao)
+            del self._posicoes[self._clientes[posicao]]
+            self.descartados += 1
+        self._posicoes[cliente] = posicao
+        self._clientes[posicao] = cliente
+        self._fichas[posicao] = self.rajada
+        self._atualizado_em[posicao] = agora
+        self._liga_no_inicio(posicao)
+        return posicao
+
+    def permite(self, cliente):
+        """
+        Gasta uma ficha do cliente
+        :param cliente: A credencial já resolvida (chave, identidade ou contrato_id)
+        :return: True se a requisição está dentro do limite
+        :rtype: bool
+        """
+        agora = self.relogio()
+        with self._trava:
+            posicao = self._posicoes.get(cliente)
+            if posicao is None:
+                posicao = self._reserva(cliente, agora)
+            elif posicao != self._inicio:
+                self._desliga(posicao)
+                self._liga_no_inicio(posicao)
+            fichas = self._fichas[posicao] + (agora - self._atualizado_em[posicao]) * self.taxa
+            if fichas > self.rajada:
+                fichas = self.rajada
+            self._atualizado_em[posicao] = agora
+            if fichas < 1:
+                self._fichas[posicao] = fichas
+                self.rejeitadas += 1
+                return False
+            self._fichas[posicao] = fichas - 1
+            return True
+
+    def estatisticas(self):
+        """
+        Retorna os contadores do limite
+        :return: Dicionário com os clientes acompanhados, as requisições rejeitadas e os clientes descartados por falta de espaço
+        :rtype: dict
+        """
+        return {'clientes': len(self._posicoes), 'rejeitadas': self.rejeitadas, 'descartados': self.descartados}
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas da autenticação: histogramas de latência com faixas fixas, contadores de resultado e as estatísticas dos caches.
+As métricas podem ser lidas em memória ou publicadas em StatsD e no formato texto do Prometheus.
+
+Os contadores são atualizados sem trava para não pesar nas requisições; com várias threads algum incremento
+pode se perder, o que não muda as proporções medidas.
+"""
+
+import bisect
+import socket
+import threading
+import time
+from functools import wraps
+
+FAIXAS_PADRAO = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+NOMES_RESULTADO = {200: 'resultado.ok', 400: 'resultado.400', 401: 'resultado.401', 429: 'resultado.429'}
+
+relogio_padrao = getattr(time, 'perf_counter', time.time)
+
+
+class Histograma(object):
+    """
+    Histograma com faixas fixas. Cada registro é uma busca binária e um incremento
+    """
+
+    def __init__(self, faixas=FAIXAS_PADRAO):
+        self.faixas = tuple(faixas)
+        self.contagens = [0] * (len(self.faixas) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def registra(self, valor):
+        """
+        Registra uma medida
+        :param valor: A medida, em segundos
+        :type valor: float
+        :return: None
+        """
+        self.contagens[bisect.bisect_left(self.faixas, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def acumulado(self):
+        """
+        Retorna as contagens acumuladas por faixa, como no Prometheus. A última faixa é a infinita
+        :return: Lista de tuplas (limite, contagem acumulada)
+        :rtype: list
+        """
+        resultado = []
+        acumulado = 0
+        for limite, contagem in zip(self.faixas + (float('inf'),), self.contagens):
+            acumulado += contagem
+            resultado.append((limite, acumulado))
+        return resultado
+
+    def instantaneo(self):
+        return {'faixas': self.acumulado(), 'soma': self.soma, 'total': self.total}
+
+
+class Metricas(object):
+    """
+    Guarda os histogramas por estágio, os contadores e as fontes de estatísticas de cache, e publica tudo nas saídas definidas
+    """
+
+    def __init__(self, faixas=FAIXAS_PADRAO, saidas=None, relogio=relogio_padrao):
+        self.faixas = faixas
+        self.relogio = relogio
+        self.saidas = list(saidas or [])
+        self.histogramas = {}
+        self.contadores = {}
+        self.fontes = {}
+
+    def histograma(self, estagio):
+        """
+        Retorna o histograma do estágio, criando-o se ainda não existir
+        :param estagio: O nome do estágio
+        :type estagio: str
+        :return: O histograma
+        :rtype: Histograma
+        """
+        histograma = self.histogramas.get(estagio)
+        if histograma is None:
+            histograma = self.histogramas[estagio] = Histograma(self.faixas)
+        return histograma
+
+    def conta(self, nome, quantidade=1):
+        """
+        Incrementa um contador
+        :param nome: O nome do contador
+        :type nome: str
+        :param quantidade: O incremento
+        :type quantidade: int
+        :return: None
+        """
+        self.contadores[nome] = self.contadores.get(nome, 0) + quantidade
+
+    def conta_resultado(self, status):
+        """
+        Conta o resultado de uma autenticação
+        :param status: O status da autenticação (200, 400 ou 401)
+        :type status: int
+        :return: None
+        """
+        self.conta(NOMES_RESULTADO.get(status, 'resultado.outro'))
+
+    def adiciona_fonte(self, nome, estatisticas):
+        """
+        Adiciona uma fonte de estatísticas de cache, lida a cada instantâneo
+        :param nome: O nome da fonte
+        :type nome: str
+        :param estatisticas: Função que retorna um dicionário com acertos e falhas, ou None se a fonte estiver desligada
+        :return: None
+        """
+        self.fontes[nome] = estatisticas
+
+    def cronometra(self, estagio, funcao):
+        """
+        Envolve a função registrando o tempo de cada chamada no histograma do estágio
+        :param estagio: O nome do estágio
+        :type estagio: str
+        :param funcao: A função a ser medida
+        :return: A função medida
+        """
+        histograma = self.histograma(estagio)
+        relogio = self.relogio
+
+        @wraps(funcao)
+        def cronometrada(*args, **kwargs):
+            inicio = relogio()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                histograma.registra(relogio() - inicio)
+
+        return cronometrada
+
+    def conta_excecoes(self, nome, funcao):
+        """
+        Envolve a função contando as exceções lançadas por ela. As exceções continuam sendo lançadas
+        :param nome: O nome do contador
+        :type nome: str
+        :param funcao: A função a ser observada
+        :return: A função observada
+        """
+        conta = self.conta
+
+        @wraps(funcao)
+        def observada(*args, **kwargs):
+            try:
+                return funcao(*args, **kwargs)
+            except Exception:
+                conta(nome)
+                raise
+
+        return observada
+
+    def conta_resultados(self, funcao):
+        """
+        Envolve uma função de autenticação que retorna (status, valor), contando os resultados ok, 400 e 401
+        :param funcao: A função de autenticação
+        :return: A função observada
+        """
+        conta_resultado = self.conta_resultado
+
+        @wraps(funcao)
+        def observada(*args, **kwargs):
+            resultado = funcao(*args, **kwargs)
+            conta_resultado(resultado[0])
+            return resultado
+
+        return observada
+
+    def instantaneo(self):
+        """
+        Retorna uma cópia das métricas atuais
+        :return: Dicionário com os histogramas, os contadores e as estatísticas dos caches, incluindo a razão de acertos
+        :rtype: dict
+        """
+        caches = {}
+        for nome, estatisticas in self.fontes.items():
+            valores = estatisticas()
+            if valores is None:
+                continue
+            valores = dict(valores)
+            consultas = valores.get('acertos', 0) + valores.get('falhas', 0)
+            valores['razao_acertos'] = float(valores.get('acertos', 0)) / consultas if consultas else 0.0
+            caches[nome] = valores
+        return {
+            'histogramas': dict((estagio, histograma.instantaneo()) for estagio, histograma in self.histogramas.items()),
+            'contadores': dict(self.contadores),
+            'caches': caches,
+        }
+
+    def publica(self):
+        """
+        Envia o instantâneo atual para todas as saídas
+        :return: None
+        """
+        instantaneo = self.instantaneo()
+        for saida in self.saidas:
+            saida.publica(instantaneo)
+
+    def publica_periodicamente(self, intervalo):
+        """
+        Publica as métricas a cada intervalo em uma thread em segundo plano
+        :param intervalo: Segundos entre as publicações
+        :type intervalo: float
+        :return: A thread
+        :rtype: threading.Thread
+        """
+        def publica():
+            while True:
+                time.sleep(intervalo)
+                try:
+                    self.publica()
+                except Exception:
+                    pass
+
+        thread = threading.Thread(target=publica)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+class SaidaMemoria(object):
+    """
+    Guarda o último instantâneo publicado
+    """
+
+    def __init__(self):
+        self.ultimo = None
+
+    def publica(self, instantaneo):
+        self.ultimo = instantaneo
+
+
+class SaidaStatsD(object):
+    """
+    Envia as métricas em linhas no formato do StatsD por UDP. Contadores e quantidades de chamadas são enviados como a
+    diferença desde a última publicação; a latência de cada estágio como a média do intervalo em milissegundos.
+    """
+
+    def __init__(self, host='localhost', porta=8125, prefixo='autenticador', envia=None):
+        self.endereco = (host, porta)
+        self.prefixo = prefixo
+        self.envia = envia or self._envia_udp
+        self._anteriores = {}
+        self._socket = None
+
+    def _envia_udp(self, linhas):
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.sendto('\n'.join(linhas).encode('utf-8'), self.endereco)
+
+    def _diferenca(self, nome, valor):
+        anterior = self._anteriores.get(nome, 0)
+        self._anteriores[nome] = valor
+        return valor - anterior
+
+    def linhas(self, instantaneo):
+        """
+        Monta as linhas StatsD do instantâneo
+        :param instantaneo: O instantâneo das métricas
+        :type instantaneo: dict
+        :return: As linhas
+        :rtype: list
+        """
+        linhas = []
+        for nome, valor in sorted(instantaneo['contadores'].items()):
+            diferenca = self._diferenca(nome, valor)
+            if diferenca:
+                linhas.append('{}.{}:{}|c'.format(self.prefixo, nome, diferenca))
+        for estagio, histograma in sorted(instantaneo['histogramas'].items()):
+            chamadas = self._diferenca(estagio + '.total', histograma['total'])
+            soma = self._diferenca(estagio + '.soma', histograma['soma'])
+            if chamadas:
+                linhas.append('{}.estagio.{}.chamadas:{}|c'.format(self.prefixo, estagio, chamadas))
+                linhas.append('{}.estagio.{}:{:.4f}|ms'.format(self.prefixo, estagio, soma / chamadas * 1000))
+        for nome, valores in sorted(instantaneo['caches'].items()):
+            linhas.append('{}.cache.{}.razao_acertos:{:.4f}|g'.format(self.prefixo, nome, valores['razao_acertos']))
+        return linhas
+
+    def publica(self, instantaneo):
+        linhas = self.linhas(instantaneo)
+        if linhas:
+            self.envia(linhas)
+
+
+class SaidaPrometheus(object):
+    """
+    Mantém o texto no formato de exposição do Prometheus, para ser devolvido por uma rota /metrics
+    """
+
+    def __init__(self, prefixo='autenticador'):
+        self.prefixo = prefixo
+        self.texto = ''
+
+    def formata(self, instantaneo):
+        """
+        Monta o texto do Prometheus para o instantâneo
+        :param instantaneo: O instantâneo das métricas
+        :type instantaneo: dict
+        :return: O texto
+        :rtype: str
+        """
+        prefixo = self.prefixo
+        linhas = ['# TYPE {}_estagio_segundos histogram'.format(prefixo)]
+        for estagio, histograma in sorted(instantaneo['histogramas'].items()):
+            for limite, acumulado in histograma['faixas']:
+                le = '+Inf' if limite == float('inf') else repr(limite)
+                linhas.append('{}_estagio_segundos_bucket{{estagio="{}",le="{}"}} {}'.format(prefixo, estagio, le, acumulado))
+            linhas.append('{}_estagio_segundos_sum{{estagio="{}"}} {!r}'.format(prefixo, estagio, histograma['soma']))
+            linhas.append('{}_estagio_segundos_count{{estagio="{}"}} {}'.format(prefixo, estagio, histograma['total']))
+        linhas.append('# TYPE {}_eventos_total counter'.format(prefixo))
+        for nome, valor in sorted(instantaneo['contadores'].items()):
+            linhas.append('{}_eventos_total{{evento="{}"}} {}'.format(prefixo, nome, valor))
+        linhas.append('# TYPE {}_cache_razao_acertos gauge'.format(prefixo))
+        for nome, valores in sorted(instantaneo['caches'].items()):
+            linhas.append('{}_cache_razao_acertos{{cache="{}"}} {!r}'.format(prefixo, nome, valores['razao_acertos']))
+        return '\n'.join(linhas) + '\n'
+
+    def publica(self, instantaneo):
+        self.texto = self.formata(instantaneo)
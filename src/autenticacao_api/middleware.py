@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Middleware WSGI que autentica as requisições antes de o Flask montar o contexto da requisição e fazer o roteamento
+"""
+
+CHAVE_IDENTIDADE = 'autenticacao_api.identidade'
+CHAVE_CONTRATO_ID = 'autenticacao_api.contrato_id'
+
+
+class _Regra(object):
+    __slots__ = ('prefixo', 'raiz', 'inicio', 'tipo', 'metodo', 'chaves_erro', 'chave_environ')
+
+    def __init__(self, prefixo, tipo, metodo, chaves_erro, chave_environ):
+        self.prefixo = prefixo
+        # O prefixo vale por segmentos do caminho: /api cobre /api e /api/pedidos, mas não /apiv2
+        self.raiz = prefixo.rstrip('/')
+        self.inicio = self.raiz + '/'
+        self.tipo = tipo
+        self.metodo = metodo
+        self.chaves_erro = chaves_erro
+        self.chave_environ = chave_environ
+
+
+class MiddlewareAutenticacao(object):
+    """
+    Aplica a mesma extração e validação dos decorators do Autenticacao direto sobre o environ do WSGI.
+    As rotas são testadas pelo prefixo do PATH_INFO, segmento a segmento, na ordem do prefixo mais longo para o mais curto.
+    O método de autenticação é buscado a cada requisição, para seguir as métricas ligadas depois da criação do middleware.
+    """
+
+    def __init__(self, autenticacao, app, rotas=None):
+        self.autenticacao = autenticacao
+        self.app = app
+        if rotas is None:
+            rotas = {'': 'requerido'}
+        elif not isinstance(rotas, dict):
+            rotas = dict((prefixo, 'requerido') for prefixo in rotas)
+        self.regras = tuple(
+            self._cria_regra(prefixo, rotas[prefixo]) for prefixo in sorted(rotas, key=len, reverse=True)
+        )
+
+    def _cria_regra(self, prefixo, tipo):
+        autenticacao = self.autenticacao
+        if tipo == 'requerido':
+            return _Regra(prefixo, tipo, 'autentica', lambda: autenticacao.lista_chaves, CHAVE_IDENTIDADE)
+        if tipo == 'whitelabel':
+            return _Regra(prefixo, tipo, 'autentica_whitelabel', lambda: autenticacao.valores.keys(), CHAVE_CONTRATO_ID)
+        if tipo == 'token':
+            return _Regra(prefixo, tipo, 'autentica_token', lambda: ('token_whitelabel',), CHAVE_CONTRATO_ID)
+        raise ValueError(u"Tipo de autenticação desconhecido: {}".format(tipo))
+
+    def regra(self, caminho):
+        """
+        Retorna a regra de autenticação do caminho
+        :param caminho: O PATH_INFO da requisição
+        :type caminho: str
+        :return: A regra ou None se o caminho não exigir autenticação
+        """
+        for regra in self.regras:
+            if caminho.startswith(regra.inicio) or caminho == regra.raiz:
+                return regra
+        return None
+
+    def __call__(self, environ, start_response):
+        regra = self.regra(environ.get('PATH_INFO', ''))
+        if regra is None:
+            return self.app(environ, start_response)
+        authorization = environ.get('HTTP_AUTHORIZATION')
+        headers = {'AUTHORIZATION': authorization} if authorization is not None else {}
+        autenticacao = self.autenticacao
+        status, valor = getattr(autenticacao, regra.metodo)(headers)
+        if status != 200:
+            linha_status, cabecalhos, corpo = autenticacao.erros_http().resposta_wsgi(status, regra.chaves_erro())
+            start_response(linha_status, list(cabecalhos))
+            return [corpo]
+        environ[regra.chave_environ] = valor
+        return self.app(environ, start_response)
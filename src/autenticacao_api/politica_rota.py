@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Políticas de autenticação por rota, montadas quando o decorator é aplicado.
+
+Cada política guarda o conjunto de chaves exigido pela rota, extraídas do cabeçalho AUTHORIZATION pelo
+Autenticacao.extrai_chaves, e os valores aceitos de cada chave. O estado compilado fica numa única tupla, trocada de uma
+vez quando os valores mudam, então uma requisição nunca vê uma política pela metade.
+"""
+
+
+class PoliticaRota(object):
+    """
+    Chaves e valores aceitos por uma rota decorada com Autenticacao.requerido(chaves=[...])
+    """
+
+    def __init__(self, chaves=None, aceita_rotacao=True):
+        """
+        :param chaves: Os nomes das chaves exigidas pela rota. Se não for passado a rota exige todas as chaves definidas
+        com o define_valor, inclusive as definidas depois, ou as do repositório de chaves, se houver um
+        :type chaves: list
+        :param aceita_rotacao: Se True também aceita os valores adicionados com Autenticacao.aceita_valor
+        :type aceita_rotacao: bool
+        """
+        self.chaves_fixas = tuple(chaves) if chaves is not None else None
+        self.aceita_rotacao = aceita_rotacao
+        self._estado = ((), frozenset(), {})
+
+    @property
+    def chaves(self):
+        return self._estado[0]
+
+    @property
+    def nomes(self):
+        return self._estado[1]
+
+    def compila(self, valores, valores_aceitos, nomes=None):
+        """
+        Monta os valores aceitos de cada chave da política
+        :param valores: Os valores definidos com o define_valor
+        :type valores: dict
+        :param valores_aceitos: Os valores adicionais de cada chave, usados durante a troca de uma chave
+        :type valores_aceitos: dict
+        :param nomes: Os nomes das chaves do repositório de chaves, exigidos no lugar das chaves do define_valor quando a
+        política não tem as suas próprias chaves
+        :type nomes: tuple
+        :return: None
+        """
+        if self.chaves_fixas is not None:
+            chaves = self.chaves_fixas
+        else:
+            chaves = tuple(nomes if nomes is not None else valores)
+        aceitos = {}
+        for nome in chaves:
+            valores_nome = set(valores_aceitos.get(nome, ())) if self.aceita_rotacao else set()
+            if nome in valores:
+                valores_nome.add(valores[nome])
+            aceitos[nome] = frozenset(valores_nome)
+        self._estado = (chaves, frozenset(chaves), aceitos)
+
+    def valida(self, chaves):
+        """
+        Verifica se os valores das chaves extraídas estão entre os aceitos
+        :param chaves: As chaves extraídas com o Autenticacao.extrai_chaves(politica.nomes, headers)
+        :type chaves: dict
+        :return: True se todos os valores são aceitos
+        :rtype: bool
+        """
+        aceitos = self._estado[2]
+        for nome, valor in chaves.items():
+            if valor not in aceitos.get(nome, ()):
+                return False
+        return True
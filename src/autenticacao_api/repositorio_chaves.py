@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Repositórios de credenciais para APIs com muitas lojas e usuários. Cada credencial é indexada pelo hash
+dos seus valores, então a validação é uma única busca, qualquer que seja a quantidade de credenciais.
+"""
+
+import hashlib
+import json
+import os
+
+
+def digest_credencial(nomes, chaves):
+    """
+    Calcula o hash que identifica uma credencial
+    :param nomes: Os nomes das chaves que compõem a credencial, na ordem usada pelo repositório
+    :type nomes: tuple
+    :param chaves: Os valores das chaves, como extraídos do cabeçalho AUTHORIZATION
+    :type chaves: dict
+    :return: O hash sha256 em hexadecimal ou None se faltar alguma chave
+    :rtype: str
+    """
+    try:
+        texto = u'\x00'.join(chaves[nome] for nome in nomes)
+    except KeyError:
+        return None
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+class RepositorioChaves(object):
+    """
+    Interface dos repositórios de credenciais usados pelo Autenticacao.define_repositorio_chaves. Cada repositório
+    implementa busca_por_digest(digest), que retorna a identidade da credencial com o hash passado ou None.
+    Repositórios bloqueantes fazem I/O na busca e rodam fora do event loop nos decorators assíncronos.
+    """
+    bloqueante = False
+
+    def __init__(self, nomes):
+        self.nomes = tuple(sorted(nomes))
+
+    def digest(self, chaves):
+        """
+        Calcula o hash da credencial com os nomes de chave do repositório
+        :param chaves: Os valores das chaves
+        :type chaves: dict
+        :return: O hash da credencial ou None se faltar alguma chave
+        :rtype: str
+        """
+        return digest_credencial(self.nomes, chaves)
+
+    def busca(self, chaves):
+        """
+        Procura a identidade da credencial
+        :param chaves: As chaves extraídas do cabeçalho AUTHORIZATION
+        :type chaves: dict
+        :return: A identidade (loja, usuário etc.) dona da credencial ou None se a credencial não existir
+        """
+        digest = self.digest(chaves)
+        if digest is None:
+            return None
+        return self.busca_por_digest(digest)
+
+
+class RepositorioChavesMemoria(RepositorioChaves):
+    """
+    Guarda as credenciais em um dicionário indexado pelo hash
+    """
+
+    def __init__(self, nomes):
+        super(RepositorioChavesMemoria, self).__init__(nomes)
+        self.identidades = {}
+
+    def __len__(self):
+        return len(self.identidades)
+
+    def adiciona(self, chaves, identidade):
+        """
+        Adiciona ou substitui uma credencial
+        :param chaves: Os valores das chaves da credencial
+        :type chaves: dict
+        :param identidade: A identidade que será passada para a view quando a credencial for usada
+        :return: None
+        :raises ValueError: Se faltar alguma das chaves do repositório
+        """
+        digest = self.digest(chaves)
+        if digest is None:
+            raise ValueError(u"A credencial deve ter as chaves {}".format(', '.join(self.nomes)))
+        self.identidades[digest] = identidade
+
+    def remove(self, chaves):
+        """
+        Remove uma credencial
+        :param chaves: Os valores das chaves da credencial
+        :type chaves: dict
+        :return: True se a credencial existia
+        :rtype: bool
+        """
+        return self.identidades.pop(self.digest(chaves), None) is not None
+
+    def busca_por_digest(self, digest):
+        return self.identidades.get(digest)
+
+
+class RepositorioChavesArquivo(RepositorioChavesMemoria):
+    """
+    Mantém as credenciais em memória a partir de um arquivo JSON com {hash: identidade}
+    """
+
+    def __init__(self, nomes, caminho):
+        super(RepositorioChavesArquivo, self).__init__(nomes)
+        self.caminho = caminho
+        if os.path.exists(caminho):
+            self.recarrega()
+
+    def recarrega(self):
+        """
+        Lê o arquivo e substitui as credenciais em memória
+        :return: None
+        """
+        with open(self.caminho) as arquivo:
+            self.identidades = json.load(arquivo)
+
+    def salva(self):
+        """
+        Grava as credenciais em memória no arquivo. A gravação é feita em um arquivo temporário renomeado no final,
+        para que outro processo nunca leia um arquivo pela metade.
+        :return: None
+        """
+        temporario = '{}.tmp'.format(self.caminho)
+        with open(temporario, 'w') as arquivo:
+            json.dump(self.identidades, arquivo)
+        os.rename(temporario, self.caminho)
+
+
+class RepositorioChavesDjango(RepositorioChaves):
+    """
+    Busca as credenciais em um model Django com um campo indexado guardando o hash da credencial
+    """
+    bloqueante = True
+
+    def __init__(self, nomes, modelo, campo_digest='digest', campo_identidade='id'):
+        super(RepositorioChavesDjango, self).__init__(nomes)
+        self.modelo = modelo
+        self.campo_digest = campo_digest
+        self.campo_identidade = campo_identidade
+
+    def busca_por_digest(self, digest):
+        filtro = {self.campo_digest: digest}
+        identidades = list(self.modelo.objects.filter(**filtro).values_list(self.campo_identidade, flat=True)[:1])
+        if not identidades:
+            return None
+        return identidades[0]
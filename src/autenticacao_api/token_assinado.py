@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Tokens assinados com HMAC que carregam o contrato_id, permitindo autenticar um whitelabel sem consultar o banco.
+
+Formato: v1.<contrato_id>.<expira_em>.<id_segredo>.<assinatura>, onde a assinatura é o HMAC-SHA256 em base64
+(url safe, sem o =) de "v1.<contrato_id>.<expira_em>.<id_segredo>".
+"""
+
+import base64
+import hashlib
+import hmac
+import time
+
+
+VERSAO_TOKEN = 'v1'
+
+
+def _em_bytes(valor):
+    if isinstance(valor, bytes):
+        return valor
+    return valor.encode('utf-8')
+
+
+def assina(segredo, conteudo):
+    """
+    Calcula a assinatura do conteúdo do token
+    :param segredo: O segredo do servidor, ou um hmac já iniciado com ele, que é copiado em vez de recalculado
+    :type segredo: str
+    :param conteudo: O conteúdo do token sem a assinatura
+    :type conteudo: str
+    :return: A assinatura em base64 url safe, sem o =
+    :rtype: bytes
+    """
+    if isinstance(segredo, (bytes, type(u''))):
+        assinatura = hmac.new(_em_bytes(segredo), digestmod=hashlib.sha256)
+    else:
+        assinatura = segredo.copy()
+    assinatura.update(_em_bytes(conteudo))
+    return base64.urlsafe_b64encode(assinatura.digest()).rstrip(b'=')
+
+
+class VerificadorToken(object):
+    """
+    Gera e verifica tokens com vários segredos ativos ao mesmo tempo, para permitir a troca de segredo sem invalidar
+    os tokens já emitidos. Os tokens novos são assinados com o último segredo adicionado.
+    """
+
+    def __init__(self, relogio=time.time):
+        self.relogio = relogio
+        self.segredos = {}
+        self.id_segredo_atual = None
+
+    def adiciona_segredo(self, id_segredo, segredo):
+        """
+        Adiciona um segredo ativo, que passa a ser usado para assinar os novos tokens
+        :param id_segredo: Identificador curto do segredo, enviado no token. Não pode ter ponto
+        :type id_segredo: str
+        :param segredo: O segredo
+        :type segredo: str
+        :return: None
+        """
+        if '.' in id_segredo:
+            raise ValueError(u"O id do segredo não pode ter ponto")
+        self.segredos[id_segredo] = hmac.new(_em_bytes(segredo), digestmod=hashlib.sha256)
+        self.id_segredo_atual = id_segredo
+
+    def remove_segredo(self, id_segredo):
+        """
+        Remove um segredo. Os tokens assinados com ele deixam de ser aceitos
+        :param id_segredo: O identificador do segredo
+        :type id_segredo: str
+        :return: None
+        """
+        self.segredos.pop(id_segredo, None)
+        if self.id_segredo_atual == id_segredo:
+            self.id_segredo_atual = None
+
+    def gera(self, contrato_id, validade):
+        """
+        Gera um token para o contrato
+        :param contrato_id: O id do contrato whitelabel
+        :type contrato_id: int
+        :param validade: Tempo em segundos que o token é aceito
+        :type validade: int
+        :return: O token
+        :rtype: str
+        """
+        if self.id_segredo_atual is None:
+            raise ValueError(u"Nenhum segredo definido para assinar o token")
+        conteudo = '{}.{}.{}.{}'.format(VERSAO_TOKEN, int(contrato_id), int(self.relogio() + validade), self.id_segredo_atual)
+        return '{}.{}'.format(conteudo, assina(self.segredos[self.id_segredo_atual], conteudo).decode('ascii'))
+
+    def verifica(self, token):
+        """
+        Verifica a assinatura e a validade do token
+        :param token: O token enviado no cabeçalho
+        :type token: str
+        :return: O contrato_id do token ou None se o token for inválido, expirado ou assinado com um segredo desconhecido
+        :rtype: int
+        """
+        partes = token.split('.')
+        if len(partes) != 5 or partes[0] != VERSAO_TOKEN:
+            return None
+        segredo = self.segredos.get(partes[3])
+        if segredo is None:
+            return None
+        conteudo, assinatura = token.rsplit('.', 1)
+        if not hmac.compare_digest(assina(segredo, conteudo), _em_bytes(assinatura)):
+            return None
+        try:
+            contrato_id = int(partes[1])
+            expira_em = int(partes[2])
+        except ValueError:
+            return None
+        if expira_em <= self.relogio():
+            return None
+        return contrato_id
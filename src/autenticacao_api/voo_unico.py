@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Agrupa chamadas concorrentes para a mesma chave em uma única execução (single-flight)
+"""
+
+import threading
+
+
+class TempoEsgotado(Exception):
+    """
+    Lançada quando a execução em andamento para a chave não termina dentro do tempo limite. O atributo primeira é True
+    só para a primeira espera da execução que esgotou o tempo, para que uma execução lenta seja contada uma única vez
+    """
+
+    def __init__(self, mensagem, primeira=True):
+        super(TempoEsgotado, self).__init__(mensagem)
+        self.primeira = primeira
+
+
+class _Chamada(object):
+    __slots__ = ('evento', 'resultado', 'erro', 'esgotada')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+        self.esgotada = False
+
+
+class VooUnico(object):
+    """
+    Garante que só exista uma execução em andamento por chave. As threads que pedirem a mesma chave
+    enquanto ela executa esperam e recebem o mesmo resultado, ou o mesmo erro.
+    Usa apenas as primitivas de threading, então também funciona com o gevent usando monkey patch.
+    """
+
+    def __init__(self, tempo_limite=5):
+        self.tempo_limite = tempo_limite
+        self.executadas = 0
+        self.coalescidas = 0
+        self.tempos_esgotados = 0
+        self._chamadas = {}
+        self._trava = threading.Lock()
+
+    def executa(self, chave, funcao, *args, **kwargs):
+        """
+        Executa a função para a chave, ou espera a execução que já estiver em andamento para ela
+        :param chave: A chave que identifica a execução
+        :param funcao: A função a ser executada
+        :return: O resultado da função
+        :raises TempoEsgotado: Se a execução em andamento não terminar dentro do tempo limite
+        """
+        with self._trava:
+            chamada = self._chamadas.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = self._chamadas[chave] = _Chamada()
+                self.executadas += 1
+            else:
+                self.coalescidas += 1
+        if not lider:
+            return self._espera(chave, chamada)
+        try:
+            chamada.resultado = funcao(*args, **kwargs)
+        except Exception as erro:
+            chamada.erro = erro
+            raise
+        finally:
+            with self._trava:
+                del self._chamadas[chave]
+            chamada.evento.set()
+        return chamada.resultado
+
+    def _espera(self, chave, chamada):
+        if not chamada.evento.wait(self.tempo_limite):
+            with self._trava:
+                self.tempos_esgotados += 1
+                primeira = not chamada.esgotada
+                chamada.esgotada = True
+            raise TempoEsgotado(u"A execução para {} não terminou em {} segundos".format(chave, self.tempo_limite),
+                                primeira)
+        if chamada.erro is not None:
+            raise chamada.erro
+        return chamada.resultado
+
+    def estatisticas(self):
+        """
+        Retorna os contadores de execução
+        :return: Dicionário com as execuções feitas, as chamadas agrupadas e as esperas que esgotaram o tempo
+        :rtype: dict
+        """
+        return {'executadas': self.executadas, 'coalescidas': self.coalescidas, 'tempos_esgotados': self.tempos_esgotados}
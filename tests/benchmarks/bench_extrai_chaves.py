@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Compara o Autenticacao.extrai_chaves com a implementação anterior, que procurava cada chave na lista do cabeçalho
+e recebia a lista de chaves montada com self.valores.keys() a cada requisição.
+
+Uso: python -m tests.benchmarks.bench_extrai_chaves
+"""
+
+import timeit
+
+from autenticacao_api import autenticador
+
+
+def extrai_chaves_anterior(chaves, headers):
+    try:
+        authorization = headers["AUTHORIZATION"]
+    except KeyError:
+        return None
+    if not authorization:
+        return None
+    authorization = authorization.split()
+    if len(authorization) != len(chaves) * 2:
+        return None
+    resultado = {}
+    for chave in chaves:
+        if chave in authorization:
+            indice = authorization.index(chave) + 1
+            resultado[chave] = authorization[indice]
+    return resultado
+
+
+def monta_cenario(quantidade_chaves):
+    autenticacao = autenticador.Autenticacao()
+    for indice in range(quantidade_chaves):
+        autenticacao.define_valor('chave_{}'.format(indice), 'XXXXXXXX-YYYY-ZZZZ-AAAA-{:012d}'.format(indice))
+    headers = {'AUTHORIZATION': ' '.join('{} {}'.format(nome, valor) for nome, valor in autenticacao.valores.items())}
+    return autenticacao, headers
+
+
+def executa(repeticoes=200000):
+    for quantidade_chaves in (1, 3, 10):
+        autenticacao, headers = monta_cenario(quantidade_chaves)
+        nomes = autenticacao.nomes_chaves
+        valores = autenticacao.valores
+        assert autenticacao.extrai_chaves(nomes, headers) == extrai_chaves_anterior(list(valores.keys()), headers)
+        atual = min(timeit.repeat(lambda: autenticacao.extrai_chaves(nomes, headers), number=repeticoes, repeat=5))
+        anterior = min(timeit.repeat(lambda: extrai_chaves_anterior(list(valores.keys()), headers), number=repeticoes, repeat=5))
+        print('{:>2} chaves: anterior {:.3f}us, atual {:.3f}us, {:.2f}x'.format(
+            quantidade_chaves, anterior / repeticoes * 1e6, atual / repeticoes * 1e6, anterior / atual))
+
+
+if __name__ == '__main__':
+    executa()
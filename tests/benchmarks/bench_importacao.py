@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Mede o tempo de importação do autenticacao_api com python -X importtime (Python 3.7+), em um processo novo,
+e o tempo acumulado dos módulos carregados por ele. O li_common e o Django só devem aparecer se forem
+importados por quem usa o pacote.
+
+Uso: python -m tests.benchmarks.bench_importacao [modulo]
+"""
+
+import re
+import subprocess
+import sys
+
+LINHA = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def mede(modulo='autenticacao_api'):
+    """
+    Importa o módulo em um processo novo e retorna o tempo acumulado de cada módulo importado
+    :param modulo: O módulo a ser importado
+    :type modulo: str
+    :return: Dicionário com o nome do módulo e o tempo acumulado em microssegundos
+    :rtype: dict
+    """
+    processo = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(modulo)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    _, saida = processo.communicate()
+    tempos = {}
+    for linha in saida.splitlines():
+        encontrado = LINHA.match(linha)
+        if encontrado:
+            tempos[encontrado.group(4)] = int(encontrado.group(2))
+    return tempos
+
+
+def executa(modulo='autenticacao_api'):
+    tempos = mede(modulo)
+    pesados = sorted(
+        (nome for nome in tempos if nome.split('.')[0] in ('django', 'li_common', 'repositories', 'flask')),
+        key=lambda nome: -tempos[nome])
+    print('{}: {:.1f}ms'.format(modulo, tempos.get(modulo, 0) / 1000.0))
+    for nome in pesados[:10]:
+        print('  {}: {:.1f}ms'.format(nome, tempos[nome] / 1000.0))
+
+
+if __name__ == '__main__':
+    executa(*sys.argv[1:])
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Mede a carga do índice de whitelabel com 100 mil contratos (um SQLite em memória), a memória ocupada pelo índice e a
+autenticação whitelabel resolvida pelo índice, comparada com a consulta ao Contrato sem cache.
+
+Uso: python -m tests.benchmarks.bench_indice_whitelabel
+"""
+
+import timeit
+
+from mock import patch
+
+from autenticacao_api import autenticador
+from tests.unitarios import contrato_sqlite
+
+
+def executa(quantidade=100000, repeticoes=20000):
+    headers = {'AUTHORIZATION': 'chave_whitelabel chave-{}'.format(quantidade // 2)}
+    with patch('autenticacao_api.autenticador.Contrato', contrato_sqlite.cria_contrato(quantidade)):
+        sem_indice = autenticador.Autenticacao()
+        sem_indice.define_cache_whitelabel(tamanho_maximo=0)
+        com_indice = autenticador.Autenticacao()
+        com_indice.define_indice_whitelabel(intervalo_sincronizacao=None)
+        assert com_indice.autentica_whitelabel(headers) == sem_indice.autentica_whitelabel(headers)
+        banco = min(timeit.repeat(lambda: sem_indice.autentica_whitelabel(headers), number=repeticoes, repeat=5))
+        indice = min(timeit.repeat(lambda: com_indice.autentica_whitelabel(headers), number=repeticoes, repeat=5))
+    estatisticas = com_indice.estatisticas_indice_whitelabel()
+    print('{} contratos: carga {:.3f}s, {:.2f} MB'.format(
+        estatisticas['quantidade'], estatisticas['tempo_carga'], estatisticas['memoria'] / 1024.0 / 1024))
+    print('consulta ao Contrato: {:.2f}us, índice: {:.2f}us, {:.2f}x'.format(
+        banco / repeticoes * 1e6, indice / repeticoes * 1e6, banco / indice))
+
+
+if __name__ == '__main__':
+    executa()
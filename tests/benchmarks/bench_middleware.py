@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Compara o custo de rejeitar uma requisição (401) com o decorator requerido, que roda dentro do Flask, e com o
+Autenticacao.como_middleware, que responde antes do roteamento e da criação do contexto da requisição.
+
+Uso: python -m tests.benchmarks.bench_middleware
+"""
+
+import timeit
+
+from flask import Flask
+from werkzeug.test import EnvironBuilder
+
+from autenticacao_api import autenticador
+
+
+def cria_app(autenticacao):
+    app = Flask('bench_middleware')
+
+    @app.route('/recurso')
+    @autenticacao.requerido
+    def recurso():
+        return 'ok'
+
+    return app
+
+
+def start_response(status, cabecalhos):
+    pass
+
+
+def chama(app, environ):
+    resposta = app(dict(environ), start_response)
+    for _ in resposta:
+        pass
+    if hasattr(resposta, 'close'):
+        resposta.close()
+
+
+def executa(repeticoes=20000):
+    autenticacao = autenticador.Autenticacao()
+    autenticacao.define_valor('chave_api', 'a-chave-api-eh-essa')
+    app = cria_app(autenticacao)
+    com_middleware = autenticacao.como_middleware(app.wsgi_app)
+    environ = EnvironBuilder(path='/recurso', headers={'Authorization': 'chave_api chave-errada'}).get_environ()
+    decorator = min(timeit.repeat(lambda: chama(app.wsgi_app, environ), number=repeticoes, repeat=5))
+    middleware = min(timeit.repeat(lambda: chama(com_middleware, environ), number=repeticoes, repeat=5))
+    print('401 com decorator: {:.2f}us, com middleware: {:.2f}us, {:.2f}x'.format(
+        decorator / repeticoes * 1e6, middleware / repeticoes * 1e6, decorator / middleware))
+
+
+if __name__ == '__main__':
+    executa()
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Compara o token_requerido, que só verifica a assinatura do token, com o whitelabel_requerido consultando o Contrato
+(um SQLite em memória, sem o cache de whitelabel). Em produção a consulta ainda soma a latência de rede até o banco.
+
+Uso: python -m tests.benchmarks.bench_token_assinado
+"""
+
+import timeit
+
+from mock import patch
+
+from autenticacao_api import autenticador
+from tests.unitarios import contrato_sqlite
+
+
+def executa(repeticoes=20000):
+    autenticacao = autenticador.Autenticacao()
+    autenticacao.define_cache_whitelabel(tamanho_maximo=0)
+    autenticacao.define_segredo('s1', 'segredo-do-benchmark')
+    headers_token = {'AUTHORIZATION': 'token_whitelabel {}'.format(autenticacao.gera_token_whitelabel(500))}
+    headers_whitelabel = {'AUTHORIZATION': 'chave_whitelabel chave-499'}
+    with patch('autenticacao_api.autenticador.Contrato', contrato_sqlite.cria_contrato(10000)):
+        assert autenticacao.autentica_token(headers_token) == (200, 500)
+        assert autenticacao.autentica_whitelabel(headers_whitelabel) == (200, 500)
+        token = min(timeit.repeat(lambda: autenticacao.autentica_token(headers_token), number=repeticoes, repeat=5))
+        banco = min(timeit.repeat(lambda: autenticacao.autentica_whitelabel(headers_whitelabel), number=repeticoes, repeat=5))
+    print('token assinado: {:.2f}us, consulta ao Contrato: {:.2f}us, {:.2f}x'.format(
+        token / repeticoes * 1e6, banco / repeticoes * 1e6, banco / token))
+
+
+if __name__ == '__main__':
+    executa()
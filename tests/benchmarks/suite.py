@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Suíte de benchmarks dos caminhos quentes da autenticação: extrai_chaves, chaves_validas, o requerido (com e sem
+política por rota) e o whitelabel_requerido pelo test client do Flask (o whitelabel com o Contrato em SQLite, com e
+sem cache) e as rejeições 400 e 401.
+
+Cada cenário é medido em amostras de um lote de chamadas. O resultado tem as operações por segundo e os percentis
+de latência de cada cenário, em JSON, e pode ser comparado com uma linha de base gravada: um cenário com menos
+operações por segundo que a linha de base menos a tolerância é uma regressão e o processo termina com erro.
+
+Uso:
+    python -m tests.benchmarks.suite --saida resultado.json
+    python -m tests.benchmarks.suite --compara tests/benchmarks/linha_de_base.json
+    python -m tests.benchmarks.suite --saida tests/benchmarks/linha_de_base.json  # atualiza a linha de base
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+from flask import Flask
+from mock import patch
+
+from autenticacao_api import autenticador
+from tests.unitarios import contrato_sqlite
+
+relogio = getattr(time, 'perf_counter', time.time)
+
+QUANTIDADE_CONTRATOS = 10000
+TAMANHOS_VALOR = (('curto', 36), ('longo', 512))
+
+
+class Cenario(object):
+    """
+    Uma operação medida. O lote é a quantidade de chamadas em cada amostra, para que operações muito rápidas
+    não sejam dominadas pelo custo de ler o relógio
+    """
+
+    def __init__(self, nome, funcao, lote=1):
+        self.nome = nome
+        self.funcao = funcao
+        self.lote = lote
+
+
+def percentil(ordenados, fracao):
+    indice = min(len(ordenados) - 1, int(round(fracao * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def mede(cenario, amostras, aquecimento=0.1):
+    """
+    Mede o cenário
+    :param cenario: O cenário
+    :type cenario: Cenario
+    :param amostras: Quantidade de amostras
+    :type amostras: int
+    :param aquecimento: Fração das amostras executadas antes da medição e descartadas
+    :type aquecimento: float
+    :return: Dicionário com as operações por segundo e os percentis 50, 90 e 99 da latência em microssegundos
+    :rtype: dict
+    """
+    funcao = cenario.funcao
+    repeticoes = range(cenario.lote)
+    for _ in range(int(amostras * aquecimento)):
+        for _ in repeticoes:
+            funcao()
+    tempos = []
+    for _ in range(amostras):
+        inicio = relogio()
+        for _ in repeticoes:
+            funcao()
+        tempos.append((relogio() - inicio) / cenario.lote)
+    tempos.sort()
+    return {
+        'ops_por_segundo': round(len(tempos) / sum(tempos), 1),
+        'p50_us': round(percentil(tempos, 0.5) * 1e6, 3),
+        'p90_us': round(percentil(tempos, 0.9) * 1e6, 3),
+        'p99_us': round(percentil(tempos, 0.99) * 1e6, 3),
+    }
+
+
+def valor_chave(indice, tamanho):
+    return '{:0{}d}'.format(indice, tamanho)
+
+
+def cenarios_extrai_chaves():
+    cenarios = []
+    for quantidade_chaves in (1, 3, 10):
+        for nome_tamanho, tamanho in TAMANHOS_VALOR:
+            autenticacao = autenticador.Autenticacao()
+            for indice in range(quantidade_chaves):
+                autenticacao.define_valor('chave_{}'.format(indice), valor_chave(indice, tamanho))
+            headers = {'AUTHORIZATION': ' '.join('{} {}'.format(nome, valor) for nome, valor in autenticacao.valores.items())}
+            assert autenticacao.extrai_chaves(autenticacao.nomes_chaves, headers) == autenticacao.valores
+            cenarios.append(Cenario(
+                'extrai_chaves.{}_chaves.{}'.format(quantidade_chaves, nome_tamanho),
+                lambda autenticacao=autenticacao, headers=headers: autenticacao.extrai_chaves(autenticacao.nomes_chaves, headers),
+                lote=100))
+    return cenarios
+
+
+def cenarios_chaves_validas():
+    cenarios = []
+    for quantidade_chaves in (1, 3, 10):
+        autenticacao = autenticador.Autenticacao()
+        for indice in range(quantidade_chaves):
+            autenticacao.define_valor('chave_{}'.format(indice), valor_chave(indice, 36))
+        chaves = dict(autenticacao.valores)
+        assert autenticacao.chaves_validas(chaves)
+        cenarios.append(Cenario(
+            'chaves_validas.{}_chaves'.format(quantidade_chaves),
+            lambda autenticacao=autenticacao, chaves=chaves: autenticacao.chaves_validas(chaves),
+            lote=100))
+    return cenarios
+
+
+def cria_app(autenticacao):
+    app = Flask('benchmarks')
+
+    @app.route('/requerido')
+    @autenticacao.requerido
+    def requerido():
+        return 'ok'
+
+    @app.route('/politica')
+    @autenticacao.requerido(chaves=['chave_api'])
+    def politica():
+        return 'ok'
+
+    @app.route('/whitelabel')
+    @autenticacao.whitelabel_requerido
+    def whitelabel(contrato_id):
+        return str(contrato_id)
+
+    return app.test_client()
+
+
+def cenario_requisicao(nome, cliente, caminho, authorization, status_esperado):
+    headers = {'Authorization': authorization} if authorization is not None else {}
+    status = cliente.get(caminho, headers=headers).status_code
+    assert status == status_esperado, '{}: status {} em vez de {}'.format(nome, status, status_esperado)
+    return Cenario(nome, lambda: cliente.get(caminho, headers=headers))
+
+
+def cenarios_requerido():
+    autenticacao = autenticador.Autenticacao()
+    autenticacao.define_valor('chave_api', valor_chave(1, 36))
+    autenticacao.define_valor('chave_loja', valor_chave(2, 36))
+    cliente = cria_app(autenticacao)
+    authorization = 'chave_api {} chave_loja {}'.format(valor_chave(1, 36), valor_chave(2, 36))
+    return [
+        cenario_requisicao('requerido.200', cliente, '/requerido', authorization, 200),
+        cenario_requisicao('requerido.400', cliente, '/requerido', None, 400),
+        cenario_requisicao('requerido.401', cliente, '/requerido', 'chave_api errada chave_loja errada', 401),
+        cenario_requisicao('requerido.politica.200', cliente, '/politica', 'chave_api {}'.format(valor_chave(1, 36)), 200),
+        cenario_requisicao('requerido.politica.400', cliente, '/politica', authorization, 400),
+    ]
+
+
+def cenarios_whitelabel():
+    cenarios = []
+    for nome_cache, tamanho_cache in (('com_cache', 10000), ('sem_cache', 0)):
+        autenticacao = autenticador.Autenticacao()
+        autenticacao.define_cache_whitelabel(tamanho_maximo=tamanho_cache)
+        cliente = cria_app(autenticacao)
+        cenarios.extend([
+            cenario_requisicao('whitelabel.{}.200'.format(nome_cache), cliente, '/whitelabel', 'chave_whitelabel chave-5000', 200),
+            cenario_requisicao('whitelabel.{}.401'.format(nome_cache), cliente, '/whitelabel', 'chave_whitelabel nao-existe', 401),
+        ])
+    return cenarios
+
+
+def executa(amostras=2000, filtro=None):
+    """
+    Executa todos os cenários
+    :param amostras: Quantidade de amostras de cada cenário
+    :type amostras: int
+    :param filtro: Se passado, só executa os cenários cujo nome começa com ele
+    :type filtro: str
+    :return: Dicionário com a plataforma e o resultado de cada cenário
+    :rtype: dict
+    """
+    with patch('autenticacao_api.autenticador.Contrato', contrato_sqlite.cria_contrato(QUANTIDADE_CONTRATOS)):
+        cenarios = cenarios_extrai_chaves() + cenarios_chaves_validas() + cenarios_requerido() + cenarios_whitelabel()
+        resultados = {}
+        for cenario in cenarios:
+            if filtro and not cenario.nome.startswith(filtro):
+                continue
+            resultados[cenario.nome] = mede(cenario, amostras)
+    return {
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cenarios': resultados,
+    }
+
+
+def compara(resultado, linha_de_base, tolerancia):
+    """
+    Compara as operações por segundo de cada cenário com a linha de base
+    :param resultado: O resultado do executa
+    :type resultado: dict
+    :param linha_de_base: Um resultado gravado anteriormente
+    :type linha_de_base: dict
+    :param tolerancia: A fração de queda aceita, por exemplo 0.3 para 30% mais lento
+    :type tolerancia: float
+    :return: Lista de tuplas (cenário, ops/s atual, ops/s da linha de base) dos cenários que ficaram mais lentos
+    :rtype: list
+    """
+    regressoes = []
+    base = linha_de_base['cenarios']
+    for nome, medida in sorted(resultado['cenarios'].items()):
+        if nome not in base:
+            continue
+        esperado = base[nome]['ops_por_segundo']
+        if medida['ops_por_segundo'] < esperado * (1 - tolerancia):
+            regressoes.append((nome, medida['ops_por_segundo'], esperado))
+    return regressoes
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description=u'Benchmarks da autenticação')
+    parser.add_argument('--amostras', type=int, default=2000)
+    parser.add_argument('--filtro', help=u'Executa só os cenários que começam com o filtro')
+    parser.add_argument('--saida', help=u'Arquivo onde gravar o resultado em JSON')
+    parser.add_argument('--compara', help=u'Linha de base em JSON para comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.3)
+    argumentos = parser.parse_args(argumentos)
+
+    resultado = executa(argumentos.amostras, argumentos.filtro)
+    texto = json.dumps(resultado, indent=2, sort_keys=True)
+    if argumentos.saida:
+        with open(argumentos.saida, 'w') as arquivo:
+            arquivo.write(texto + '\n')
+    else:
+        print(texto)
+
+    if argumentos.compara:
+        with open(argumentos.compara) as arquivo:
+            linha_de_base = json.load(arquivo)
+        regressoes = compara(resultado, linha_de_base, argumentos.tolerancia)
+        for nome, atual, esperado in regressoes:
+            sys.stderr.write('REGRESSAO {}: {:.0f} ops/s, linha de base {:.0f} ops/s ({:+.0%})\n'.format(
+                nome, atual, esperado, atual / esperado - 1))
+        if regressoes:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
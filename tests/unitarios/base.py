@@ -14,3 +14,17 @@ class ValidandoPython(unittest.TestCase, verificadores.TestValidacaoPython):
             '--max-attributes=20',
             '--min-public-methods=0'
         ])
+
+
+class RelogioFalso(object):
+    """
+    Relógio dos testes: retorna o momento em agora, que o teste avança, somado do passo a cada leitura
+    """
+
+    def __init__(self, agora=1000.0, passo=0.0):
+        self.agora = agora
+        self.passo = passo
+
+    def __call__(self):
+        self.agora += self.passo
+        return self.agora
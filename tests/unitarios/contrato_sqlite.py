@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Substituto do repositories.plataforma.models.Contrato guardado em um SQLite em memória, com a parte da API
+do Django usada pelo autenticador. Usado pelos testes do índice de whitelabel e da validação em lote, e pelos
+benchmarks para medir o caminho com consulta ao banco.
+"""
+
+import sqlite3
+import threading
+
+
+class ContratoNaoExiste(Exception):
+    pass
+
+
+class ValoresContrato(list):
+    def iterator(self, chunk_size=2000):
+        return iter(self)
+
+
+class ContratoSQLite(object):
+    def __init__(self, id):
+        self.id = id
+
+
+class ConsultaContrato(object):
+    def __init__(self, conexao, trava, filtros=None):
+        self.conexao = conexao
+        self.trava = trava
+        self.filtros = filtros or {}
+
+    def _executa(self, campos, filtros):
+        condicoes = []
+        parametros = []
+        for nome, valor in sorted(filtros.items()):
+            if nome.endswith('__in'):
+                valor = list(valor)
+                condicoes.append('{} IN ({})'.format(nome[:-4], ', '.join('?' * len(valor))))
+                parametros.extend(valor)
+            elif nome.endswith('__gte'):
+                condicoes.append('{} >= ?'.format(nome[:-5]))
+                parametros.append(valor)
+            else:
+                condicoes.append('{} = ?'.format(nome))
+                parametros.append(valor)
+        sql = 'SELECT {} FROM contrato'.format(', '.join(campos))
+        if condicoes:
+            sql += ' WHERE ' + ' AND '.join(condicoes)
+        with self.trava:
+            return self.conexao.execute(sql, parametros).fetchall()
+
+    def only(self, *campos):
+        return self
+
+    def filter(self, **filtros):
+        combinados = dict(self.filtros)
+        combinados.update(filtros)
+        return ConsultaContrato(self.conexao, self.trava, combinados)
+
+    def get(self, **filtros):
+        combinados = dict(self.filtros)
+        combinados.update(filtros)
+        linhas = self._executa(['id'], combinados)
+        if not linhas:
+            raise ContratoNaoExiste()
+        return ContratoSQLite(linhas[0][0])
+
+    def values_list(self, *campos, **opcoes):
+        linhas = self._executa(campos, self.filtros)
+        if opcoes.get('flat'):
+            return ValoresContrato(linha[0] for linha in linhas)
+        return ValoresContrato(linhas)
+
+    def iterator(self, chunk_size=2000):
+        return iter(self._executa(['chave', 'id'], self.filtros))
+
+
+def cria_contrato(quantidade, tipo='whitelabel'):
+    """
+    Cria um model Contrato com a quantidade de contratos ativos passada, com as chaves chave-0, chave-1...
+    A conexão fica em Contrato.conexao, para os testes alterarem os contratos.
+    :param quantidade: Quantidade de contratos
+    :type quantidade: int
+    :return: Uma classe com objects e DoesNotExist como o model do Django
+    """
+    conexao = sqlite3.connect(':memory:', check_same_thread=False)
+    conexao.execute('CREATE TABLE contrato (id INTEGER PRIMARY KEY, chave TEXT, tipo TEXT, ativo INTEGER, alterado_em INTEGER DEFAULT 0)')
+    conexao.execute('CREATE INDEX contrato_chave ON contrato (chave)')
+    conexao.executemany(
+        'INSERT INTO contrato (id, chave, tipo, ativo) VALUES (?, ?, ?, 1)',
+        ((indice + 1, 'chave-{}'.format(indice), tipo) for indice in range(quantidade)))
+    conexao.commit()
+
+    class Contrato(object):
+        DoesNotExist = ContratoNaoExiste
+        objects = ConsultaContrato(conexao, threading.Lock())
+
+    Contrato.conexao = conexao
+
+    return Contrato
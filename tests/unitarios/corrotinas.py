@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Corrotinas usadas pelo test_assincrono. Ficam em um módulo separado porque só podem ser lidas no Python 3.5+.
+"""
+
+import asyncio
+
+
+def cria_view(decorator):
+    @decorator
+    async def view(**kwargs):
+        return kwargs
+
+    return view
+
+
+def cria_consulta_lenta(resultado, chamadas, espera=0.01):
+    async def consulta(chave_whitelabel):
+        chamadas.append(chave_whitelabel)
+        await asyncio.sleep(espera)
+        return resultado
+
+    return consulta
+
+
+async def junta(*corrotinas):
+    return await asyncio.gather(*corrotinas)
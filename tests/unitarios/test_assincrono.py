@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import threading
+import time
+import unittest
+from mock import patch
+
+from autenticacao_api import auditoria
+from autenticacao_api import autenticador
+from autenticacao_api import cache_distribuido
+from autenticacao_api import metricas
+from tests.unitarios import base
+
+PYTHON_ASSINCRONO = sys.version_info >= (3, 5)
+
+if PYTHON_ASSINCRONO:
+    import asyncio
+    from autenticacao_api import assincrono
+    from tests.unitarios import corrotinas
+
+
+class ContratoNaoExiste(Exception):
+    pass
+
+
+class RequestMockWhitelabel(object):
+    headers = {"AUTHORIZATION": "chave_whitelabel chave-wl"}
+
+
+class RequestMockChaveApi(object):
+    headers = {"AUTHORIZATION": "chave_api a-chave-api-eh-essa"}
+
+
+@unittest.skipUnless(PYTHON_ASSINCRONO, u"Requer Python 3.5+")
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_assincrono(self):
+        arquivo = assincrono.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+@unittest.skipUnless(PYTHON_ASSINCRONO, u"Requer Python 3.5+")
+class TestAssincrono(unittest.TestCase):
+    def setUp(self):
+        self.autenticacao = autenticador.Autenticacao()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        patcher = patch("autenticacao_api.autenticador.Contrato")
+        self.contrato_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.contrato_mock.DoesNotExist = ContratoNaoExiste
+        self.get_mock = self.contrato_mock.objects.only.return_value.get
+        self.get_mock.return_value.id = 42
+
+    def executa(self, corrotina):
+        return self.loop.run_until_complete(corrotina)
+
+    def test_decorator_detecta_view_assincrona(self):
+        view = corrotinas.cria_view(self.autenticacao.whitelabel_requerido)
+        autenticador.e_corrotina(view).should.be.true
+
+    @patch("autenticacao_api.autenticador.request", RequestMockWhitelabel)
+    def test_whitelabel_requerido_consulta_fora_do_event_loop(self):
+        threads = []
+
+        def consulta(**kwargs):
+            threads.append(threading.current_thread())
+            return self.get_mock.return_value
+
+        self.get_mock.side_effect = consulta
+        view = corrotinas.cria_view(self.autenticacao.whitelabel_requerido)
+        self.executa(view()).should.be.equal({'contrato_id': 42})
+        threads.shouldnt.contain(threading.current_thread())
+
+    @patch("autenticacao_api.autenticador.request", RequestMockWhitelabel)
+    def test_cache_distribuido_e_lido_e_gravado_fora_do_event_loop(self):
+        threads = []
+
+        class BackendRede(cache_distribuido.BackendMemoria):
+            bloqueante = True
+
+            def obtem_varios(self, chaves):
+                threads.append(threading.current_thread())
+                return super(BackendRede, self).obtem_varios(chaves)
+
+            def define_varios(self, itens, ttl):
+                threads.append(threading.current_thread())
+                super(BackendRede, self).define_varios(itens, ttl)
+
+        self.autenticacao.define_cache_distribuido(BackendRede(), tamanho_l1=0)
+        view = corrotinas.cria_view(self.autenticacao.whitelabel_requerido)
+        self.executa(view()).should.be.equal({'contrato_id': 42})
+        self.executa(view()).should.be.equal({'contrato_id': 42})
+        self.get_mock.call_count.should.be.equal(1)
+        len(threads).should.be.greater_than(2)
+        threads.shouldnt.contain(threading.current_thread())
+
+    @patch("autenticacao_api.autenticador.request", RequestMockWhitelabel)
+    def test_whitelabel_requerido_usa_o_cache(self):
+        self.autenticacao.define_cache_whitelabel()
+        view = corrotinas.cria_view(self.autenticacao.whitelabel_requerido)
+        self.executa(view())
+        self.executa(view())
+        self.get_mock.call_count.should.be.equal(1)
+
+    @patch("autenticacao_api.autenticador.request", RequestMockWhitelabel)
+    @patch("autenticacao_api.autenticador.make_response")
+    def test_whitelabel_requerido_retorna_401(self, response_mock):
+        response_mock.return_value = 'ERRO 401'
+        self.get_mock.side_effect = ContratoNaoExiste
+        view = corrotinas.cria_view(self.autenticacao.whitelabel_requerido)
+        self.executa(view()).should.be.equal('ERRO 401')
+
+    def test_consulta_assincrona_substitui_o_pool_de_threads(self):
+        chamadas = []
+        self.autenticacao.define_assincrono(consulta_assincrona=corrotinas.cria_consulta_lenta(7, chamadas))
+        assincrona = self.autenticacao.assincrona()
+        self.executa(assincrona.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})).should.be.equal(7)
+        chamadas.should.be.equal(['chave-wl'])
+        self.get_mock.called.should.be.false
+
+    def test_consultas_simultaneas_da_mesma_chave_fazem_uma_consulta(self):
+        chamadas = []
+        self.autenticacao.define_assincrono(consulta_assincrona=corrotinas.cria_consulta_lenta(7, chamadas))
+        assincrona = self.autenticacao.assincrona()
+        resultados = self.executa(corrotinas.junta(*[
+            assincrona.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}) for _ in range(5)
+        ]))
+        list(resultados).should.be.equal([7] * 5)
+        chamadas.should.have.length_of(1)
+        assincrona.coalescidas.should.be.equal(4)
+
+    def test_consultas_simultaneas_em_event_loops_de_threads_diferentes(self):
+        chamadas = []
+        self.autenticacao.define_assincrono(consulta_assincrona=corrotinas.cria_consulta_lenta(7, chamadas, espera=0.1))
+        assincrona = self.autenticacao.assincrona()
+        resultados = []
+
+        def autentica_em_outro_loop():
+            loop = asyncio.new_event_loop()
+            try:
+                resultados.append(loop.run_until_complete(
+                    assincrona.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})))
+            except Exception as erro:
+                resultados.append(erro)
+            finally:
+                loop.close()
+
+        threads = [threading.Thread(target=autentica_em_outro_loop) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        resultados.should.be.equal([7, 7, 7])
+        assincrona._consultas.should.be.empty
+
+    def test_consulta_lenta_nao_trava_o_event_loop(self):
+        self.get_mock.side_effect = lambda **kwargs: time.sleep(0.2) or self.get_mock.return_value
+        assincrona = self.autenticacao.assincrona()
+        chamadas = []
+        inicio = time.time()
+        resultados = self.executa(corrotinas.junta(
+            assincrona.retorna_whitelabel_id({'chave_whitelabel': 'chave-lenta'}),
+            corrotinas.cria_consulta_lenta(1, chamadas, espera=0)('outra')
+        ))
+        list(resultados).should.be.equal([42, 1])
+        (time.time() - inicio).should.be.lower_than(1)
+
+    def test_tempo_limite_retorna_none(self):
+        chamadas = []
+        self.autenticacao.define_tempo_limite_whitelabel(0.01)
+        self.autenticacao.define_assincrono(consulta_assincrona=corrotinas.cria_consulta_lenta(7, chamadas, espera=1))
+        self.executa(self.autenticacao.assincrona().retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})).should.be.none
+        self.autenticacao.assincrona()._consultas.should.be.empty
+
+    @patch("autenticacao_api.autenticador.request", RequestMockChaveApi)
+    def test_requerido_assincrono(self):
+        self.autenticacao.define_valor('chave_api', 'a-chave-api-eh-essa')
+        view = corrotinas.cria_view(self.autenticacao.requerido)
+        self.executa(view()).should.be.equal({})
+
+    @patch("autenticacao_api.autenticador.request", RequestMockChaveApi)
+    def test_requerido_assincrono_com_politica(self):
+        self.autenticacao.define_valor('chave_api', 'a-chave-api-eh-essa')
+        self.autenticacao.define_valor('chave_loja', 'a-chave-da-loja-1')
+        view = corrotinas.cria_view(self.autenticacao.requerido(chaves=['chave_api']))
+        self.executa(view()).should.be.equal({})
+
+    @patch("autenticacao_api.autenticador.request", RequestMockWhitelabel)
+    def test_whitelabel_requerido_assincrono_registra_na_auditoria(self):
+        saida = auditoria.SaidaMemoria()
+        registro = auditoria.Auditoria(saida, intervalo=None)
+        self.autenticacao.define_auditoria(registro)
+        view = corrotinas.cria_view(self.autenticacao.whitelabel_requerido)
+        self.executa(view())
+        registro.descarrega()
+        [(tipo, status, valor) for _, tipo, _, status, valor in saida.registros].should.be.equal([('whitelabel', 200, 42)])
+
+    @patch("autenticacao_api.autenticador.request", RequestMockWhitelabel)
+    def test_whitelabel_requerido_assincrono_e_medido(self):
+        self.autenticacao.assincrona()
+        registro = metricas.Metricas()
+        self.autenticacao.define_metricas(registro)
+        view = corrotinas.cria_view(self.autenticacao.whitelabel_requerido)
+        self.executa(view())
+        registro.histograma('retorna_whitelabel_id').total.should.be.equal(1)
+        registro.instantaneo()['contadores'].should.contain('resultado.ok')
+        self.autenticacao.define_metricas(None)
+        self.autenticacao.assincrona().__dict__.shouldnt.contain('retorna_whitelabel_id')
+
+    def test_token_requerido_assincrono(self):
+        self.autenticacao.define_segredo('s1', 'segredo')
+        token = self.autenticacao.gera_token_whitelabel(9)
+
+        class RequestMockToken(object):
+            headers = {"AUTHORIZATION": "token_whitelabel {}".format(token)}
+
+        view = corrotinas.cria_view(self.autenticacao.token_requerido)
+        with patch("autenticacao_api.autenticador.request", RequestMockToken):
+            self.executa(view()).should.be.equal({'contrato_id': 9})
+
+    def test_consulta_respeita_o_disjuntor(self):
+        self.autenticacao.define_cache_whitelabel(ttl_negativo=0)
+        self.autenticacao.define_disjuntor_whitelabel(falhas_maximas=1, tempo_espera=60)
+        self.get_mock.side_effect = Exception('banco fora')
+        assincrona = self.autenticacao.assincrona()
+        self.executa(assincrona.consulta_whitelabel('chave-wl')).should.be.none
+        self.executa(assincrona.consulta_whitelabel('chave-wl')).should.be.none
+        self.get_mock.call_count.should.be.equal(1)
+        self.autenticacao.disjuntor_whitelabel.estado.should.be.equal('aberto')
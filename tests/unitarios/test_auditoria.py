@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from mock import Mock
+
+from autenticacao_api import auditoria
+from tests.unitarios import base
+
+
+class SaidaLenta(object):
+    def __init__(self):
+        self.registros = []
+        self.liberada = threading.Event()
+
+    def grava(self, registros):
+        self.liberada.wait(5)
+        self.registros.extend(registros)
+
+
+class SaidaQuebrada(object):
+    def grava(self, registros):
+        raise IOError('disco cheio')
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_auditoria(self):
+        arquivo = auditoria.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class TestFormata(unittest.TestCase):
+    def test_troca_authorization_pelo_hash(self):
+        registro = auditoria.formata((1000.0, 'requerido', 'chave_api segredo', 200, 7))
+        registro[2].should.have.length_of(16)
+        registro[2].should_not.contain('segredo')
+        registro.should.be.equal((1000.0, 'requerido', registro[2], 200, 7))
+
+    def test_identidade_vira_json(self):
+        auditoria.formata((1000.0, 'requerido', None, 200, {'loja_id': 1})).should.be.equal(
+            (1000.0, 'requerido', None, 200, '{"loja_id": 1}'))
+
+
+class TestAuditoria(unittest.TestCase):
+    def setUp(self):
+        self.saida = auditoria.SaidaMemoria()
+        self.auditoria = auditoria.Auditoria(self.saida, capacidade=3, tamanho_lote=2, intervalo=None,
+                                             relogio=lambda: 1000.0)
+
+    def test_registra_na_fila_sem_gravar(self):
+        self.auditoria.registra('whitelabel', 'chave_whitelabel chave-wl', 200, 42).should.be.true
+        len(self.auditoria).should.be.equal(1)
+        self.saida.registros.should.be.empty
+
+    def test_descarrega_em_lotes(self):
+        saida = Mock()
+        self.auditoria.saida = saida
+        for _ in range(3):
+            self.auditoria.registra('whitelabel', None, 401)
+        self.auditoria.descarrega().should.be.equal(3)
+        saida.grava.call_count.should.be.equal(2)
+        self.auditoria.estatisticas()['gravados'].should.be.equal(3)
+        len(self.auditoria).should.be.equal(0)
+
+    def test_fila_cheia_descarta(self):
+        for _ in range(4):
+            self.auditoria.registra('requerido', None, 400)
+        self.auditoria.registra('requerido', None, 400).should.be.false
+        self.auditoria.estatisticas()['descartados'].should.be.equal(2)
+        self.auditoria.descarrega().should.be.equal(3)
+
+    def test_falha_na_saida_conta_perdidos(self):
+        self.auditoria.saida = SaidaQuebrada()
+        self.auditoria.registra('requerido', None, 400)
+        self.auditoria.descarrega().should.be.equal(0)
+        estatisticas = self.auditoria.estatisticas()
+        estatisticas['perdidos'].should.be.equal(1)
+        estatisticas['falhas_gravacao'].should.be.equal(1)
+
+    def test_observa_registra_a_decisao(self):
+        autentica = self.auditoria.observa('requerido', lambda headers: (200, 5))
+        autentica({'AUTHORIZATION': 'chave_api x'}).should.be.equal((200, 5))
+        self.auditoria.descarrega()
+        momento, tipo, credencial, status, valor = self.saida.registros[0]
+        (momento, tipo, status, valor).should.be.equal((1000.0, 'requerido', 200, 5))
+
+    def test_politica_invalida(self):
+        (lambda: auditoria.Auditoria(self.saida, intervalo=None, politica='outra')).should.throw(ValueError)
+
+    def test_bloqueia_sem_thread_exige_tempo_maximo_espera(self):
+        (lambda: auditoria.Auditoria(self.saida, intervalo=None, politica=auditoria.BLOQUEIA)).should.throw(ValueError)
+        auditoria.Auditoria(self.saida, intervalo=None, politica=auditoria.BLOQUEIA, tempo_maximo_espera=0.1)
+
+
+class TestAuditoriaEmSegundoPlano(unittest.TestCase):
+    def test_grava_em_segundo_plano(self):
+        saida = auditoria.SaidaMemoria()
+        registro = auditoria.Auditoria(saida, tamanho_lote=2, intervalo=5)
+        self.addCleanup(registro.fecha)
+        registro.registra('requerido', None, 401)
+        registro.registra('requerido', None, 401)
+        for _ in range(500):
+            if len(saida.registros) == 2:
+                break
+            threading.Event().wait(0.01)
+        len(saida.registros).should.be.equal(2)
+
+    def test_bloqueia_ate_a_fila_andar(self):
+        saida = SaidaLenta()
+        registro = auditoria.Auditoria(saida, capacidade=1, tamanho_lote=1, intervalo=0.01,
+                                       politica=auditoria.BLOQUEIA, tempo_maximo_espera=5)
+        self.addCleanup(registro.fecha)
+        self.addCleanup(saida.liberada.set)
+        registro.registra('requerido', None, 200)
+        for _ in range(500):
+            if len(registro) == 0:
+                break
+            threading.Event().wait(0.01)
+        registro.registra('requerido', None, 200)
+        resultados = []
+        thread = threading.Thread(target=lambda: resultados.append(registro.registra('requerido', None, 200)))
+        thread.start()
+        threading.Event().wait(0.05)
+        resultados.should.be.empty
+        saida.liberada.set()
+        thread.join(5)
+        resultados.should.be.equal([True])
+        registro.fecha()
+        registro.estatisticas()['bloqueios'].should.be.equal(1)
+        len(saida.registros).should.be.equal(3)
+
+    def test_bloqueio_com_tempo_esgotado_descarta(self):
+        registro = auditoria.Auditoria(auditoria.SaidaMemoria(), capacidade=1, intervalo=None,
+                                       politica=auditoria.BLOQUEIA, tempo_maximo_espera=0.01)
+        registro.registra('requerido', None, 200).should.be.true
+        registro.registra('requerido', None, 200).should.be.false
+        estatisticas = registro.estatisticas()
+        estatisticas['bloqueios'].should.be.equal(1)
+        estatisticas['descartados'].should.be.equal(1)
+
+
+class TestSaidas(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio)
+        self.registros = [(1000.0, 'whitelabel', 'abc', 200, 42), (1001.0, 'requerido', None, 401, None)]
+
+    def test_arquivo_acrescenta_um_json_por_linha(self):
+        caminho = os.path.join(self.diretorio, 'auditoria.log')
+        saida = auditoria.SaidaArquivo(caminho)
+        self.addCleanup(saida.fecha)
+        saida.grava(self.registros)
+        saida.grava(self.registros[:1])
+        with open(caminho) as arquivo:
+            linhas = [json.loads(linha) for linha in arquivo]
+        linhas.should.be.equal([[1000.0, 'whitelabel', 'abc', 200, 42], [1001.0, 'requerido', None, 401, None],
+                                [1000.0, 'whitelabel', 'abc', 200, 42]])
+
+    def test_arquivo_rotaciona(self):
+        caminho = os.path.join(self.diretorio, 'auditoria.log')
+        saida = auditoria.SaidaArquivo(caminho, tamanho_maximo=60, quantidade_arquivos=2)
+        self.addCleanup(saida.fecha)
+        for _ in range(5):
+            saida.grava(self.registros[:1])
+        sorted(os.listdir(self.diretorio)).should.be.equal(['auditoria.log', 'auditoria.log.1', 'auditoria.log.2'])
+        os.path.getsize(caminho).should.be.lower_than(61)
+
+    def test_sqlite_insere_o_lote(self):
+        caminho = os.path.join(self.diretorio, 'auditoria.db')
+        saida = auditoria.SaidaSQLite(caminho)
+        saida.grava(self.registros)
+        conexao = sqlite3.connect(caminho)
+        self.addCleanup(conexao.close)
+        conexao.execute('SELECT tipo, status, valor FROM auditoria_autenticacao ORDER BY momento').fetchall().should.be.equal(
+            [('whitelabel', 200, '42'), ('requerido', 401, None)])
+
+    def test_django_usa_bulk_create(self):
+        modelo = Mock(side_effect=lambda **campos: campos)
+        auditoria.SaidaDjango(modelo).grava(self.registros[:1])
+        modelo.objects.bulk_create.assert_called_once_with(
+            [{'momento': 1000.0, 'tipo': 'whitelabel', 'credencial': 'abc', 'status': 200, 'valor': 42}])
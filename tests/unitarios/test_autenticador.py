@@ -1,10 +1,22 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
 from mock import patch
 from py_inspector import verificadores
 
+from autenticacao_api import auditoria
 from autenticacao_api import autenticador
+from autenticacao_api import cache_distribuido
+from autenticacao_api import metricas
+from autenticacao_api import repositorio_chaves
+from tests.unitarios import contrato_sqlite
 from tests.unitarios import base
 
 
@@ -96,6 +108,26 @@ class TestRetornaChaves(TestBase):
         chaves = self.autenticacao.extrai_chaves(["chave_api"], header)
         chaves.should.be.equal(None)
 
+    def test_retorna_none_se_tiver_chave_nao_esperada(self):
+        header = {"AUTHORIZATION": "chave_api a-chave-api-e-essa chave_outra a-chave-outra-e-essa"}
+        chaves = self.autenticacao.extrai_chaves(["chave_api", "chave_loja"], header)
+        chaves.should.be.equal(None)
+
+    def test_retorna_none_se_tiver_chave_repetida(self):
+        header = {"AUTHORIZATION": "chave_api a-chave-api-e-essa chave_api a-chave-api-e-outra"}
+        chaves = self.autenticacao.extrai_chaves(["chave_api", "chave_loja"], header)
+        chaves.should.be.equal(None)
+
+    def test_retorna_none_se_nome_da_chave_estiver_na_posicao_do_valor(self):
+        header = {"AUTHORIZATION": "a-chave-api-e-essa chave_api"}
+        chaves = self.autenticacao.extrai_chaves(["chave_api"], header)
+        chaves.should.be.equal(None)
+
+    def test_aceita_frozenset_de_chaves(self):
+        header = {"AUTHORIZATION": "chave_loja a-chave-loja-e-essa chave_api a-chave-api-e-essa"}
+        chaves = self.autenticacao.extrai_chaves(frozenset(["chave_api", "chave_loja"]), header)
+        chaves.should.be.equal({"chave_api": "a-chave-api-e-essa", "chave_loja": "a-chave-loja-e-essa"})
+
 
 class TestComparaChaves(TestBase):
     def test_define_chave(self):
@@ -103,6 +135,12 @@ class TestComparaChaves(TestBase):
         self.autenticacao.define_valor('ZAS', 'Valor Zas')
         self.autenticacao.valores.should.be.equal({'ZAS': 'Valor Zas'})
 
+    def test_define_chave_atualiza_nomes_das_chaves(self):
+        self.autenticacao.nomes_chaves.should.be.equal(frozenset())
+        self.autenticacao.define_valor('chave_api', 'valor')
+        self.autenticacao.define_valor('chave_loja', 'valor')
+        self.autenticacao.nomes_chaves.should.be.equal(frozenset(['chave_api', 'chave_loja']))
+
     def test_chaves_nao_possui_todos_os_itens(self):
         self.autenticacao.define_valor("teste-1", "valor-teste-1")
         self.autenticacao.define_valor("teste-2", "valor-teste-2")
@@ -255,3 +293,1142 @@ class TestUsandoDecorator(TestBase):
             400,
             {'Content-Type': 'text/json; charset=utf-8'}
         )
+
+
+class ContratoMock(object):
+    id = 42
+
+
+class ContratoNaoExiste(Exception):
+    pass
+
+
+class TestWhitelabelBase(TestBase):
+    def setUp(self):
+        super(TestWhitelabelBase, self).setUp()
+        patcher = patch("autenticacao_api.autenticador.Contrato")
+        self.contrato_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.contrato_mock.DoesNotExist = ContratoNaoExiste
+        self.get_mock = self.contrato_mock.objects.only.return_value.get
+        self.get_mock.return_value = ContratoMock
+
+
+class TestRetornaWhitelabelId(TestWhitelabelBase):
+    def test_retorna_id_do_contrato(self):
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.equal(42)
+        self.get_mock.assert_called_with(chave='chave-wl', tipo='whitelabel', ativo=True)
+
+    def test_retorna_none_se_contrato_nao_existir(self):
+        self.get_mock.side_effect = ContratoNaoExiste
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.none
+
+    def test_retorna_none_se_consulta_falhar(self):
+        self.get_mock.side_effect = Exception('banco fora')
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.none
+
+    def test_retorna_none_sem_chave_whitelabel(self):
+        self.autenticacao.retorna_whitelabel_id({}).should.be.none
+
+    def test_usa_cache_na_segunda_chamada(self):
+        self.autenticacao.define_cache_whitelabel()
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.equal(42)
+        self.get_mock.call_count.should.be.equal(1)
+        self.autenticacao.cache_whitelabel.acertos.should.be.equal(1)
+
+    def test_invalida_whitelabel_forca_nova_consulta(self):
+        self.autenticacao.define_cache_whitelabel()
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.autenticacao.invalida_whitelabel('chave-wl').should.be.true
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.get_mock.call_count.should.be.equal(2)
+
+    def test_sem_define_cache_whitelabel_consulta_sempre(self):
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.get_mock.call_count.should.be.equal(2)
+
+    def test_define_cache_whitelabel_com_tamanho_zero_desliga_o_cache(self):
+        self.autenticacao.define_cache_whitelabel(tamanho_maximo=0)
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.get_mock.call_count.should.be.equal(2)
+
+
+class TestCacheNegativoWhitelabel(TestWhitelabelBase):
+    def test_nao_consulta_de_novo_chave_rejeitada(self):
+        self.autenticacao.define_cache_whitelabel()
+        self.get_mock.side_effect = ContratoNaoExiste
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.none
+        self.get_mock.call_count.should.be.equal(1)
+        len(self.autenticacao.cache_whitelabel).should.be.equal(0)
+
+    def test_nao_guarda_falha_do_banco_como_rejeitada(self):
+        self.get_mock.side_effect = Exception('banco fora')
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.get_mock.call_count.should.be.equal(2)
+
+    def test_sem_define_cache_whitelabel_consulta_de_novo_chave_rejeitada(self):
+        self.get_mock.side_effect = ContratoNaoExiste
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.get_mock.side_effect = None
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.equal(42)
+
+    def test_invalida_whitelabel_remove_chave_rejeitada(self):
+        self.autenticacao.define_cache_whitelabel()
+        self.get_mock.side_effect = ContratoNaoExiste
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.get_mock.side_effect = None
+        self.autenticacao.invalida_whitelabel('chave-wl')
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.equal(42)
+
+
+class TestFiltroWhitelabel(TestWhitelabelBase):
+    def setUp(self):
+        super(TestFiltroWhitelabel, self).setUp()
+        self.values_list_mock = self.contrato_mock.objects.filter.return_value.values_list
+        self.values_list_mock.return_value = ['chave-wl', 'outra-chave']
+        self.autenticacao.define_filtro_whitelabel()
+
+    def test_monta_filtro_com_contratos_ativos(self):
+        self.contrato_mock.objects.filter.assert_called_with(tipo='whitelabel', ativo=True)
+        self.values_list_mock.assert_called_with('chave', flat=True)
+        self.autenticacao.estatisticas_filtro_whitelabel()['quantidade'].should.be.equal(2)
+
+    def test_rejeita_chave_fora_do_filtro_sem_consultar(self):
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'desconhecida'}).should.be.none
+        self.get_mock.called.should.be.false
+        self.autenticacao.rejeitadas_pelo_filtro.should.be.equal(1)
+
+    def test_consulta_chave_que_esta_no_filtro(self):
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.equal(42)
+        self.get_mock.called.should.be.true
+
+    def test_conta_falso_positivo(self):
+        self.get_mock.side_effect = ContratoNaoExiste
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'outra-chave'})
+        self.autenticacao.estatisticas_filtro_whitelabel()['falsos_positivos'].should.be.equal(1)
+
+    def test_invalida_whitelabel_adiciona_chave_ao_filtro(self):
+        self.autenticacao.invalida_whitelabel('nova-chave')
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'nova-chave'}).should.be.equal(42)
+
+    def test_reconstroi_filtro_com_novos_contratos(self):
+        self.values_list_mock.return_value = ['nova-chave']
+        self.autenticacao.reconstroi_filtro_whitelabel()
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'nova-chave'}).should.be.equal(42)
+
+    def test_sem_filtro_nao_tem_estatisticas(self):
+        autenticador.Autenticacao().estatisticas_filtro_whitelabel().should.be.none
+
+
+class TestVooUnicoWhitelabel(TestWhitelabelBase):
+    def test_consultas_simultaneas_da_mesma_chave_fazem_uma_consulta(self):
+        liberar = threading.Event()
+
+        def consulta_lenta(**kwargs):
+            liberar.wait(5)
+            return ContratoMock
+
+        self.get_mock.side_effect = consulta_lenta
+        resultados = []
+
+        def requisicao():
+            resultados.append(self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}))
+
+        threads = [threading.Thread(target=requisicao) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        voo = self.autenticacao.voo_unico_whitelabel
+        while voo.executadas + voo.coalescidas < 5:
+            threading.Event().wait(0.001)
+        liberar.set()
+        for thread in threads:
+            thread.join()
+        resultados.should.be.equal([42] * 5)
+        self.get_mock.call_count.should.be.equal(1)
+        voo.coalescidas.should.be.equal(4)
+
+    def test_define_tempo_limite_whitelabel(self):
+        self.autenticacao.define_tempo_limite_whitelabel(0.5)
+        self.autenticacao.voo_unico_whitelabel.tempo_limite.should.be.equal(0.5)
+
+
+class TestErrosHTTP(unittest.TestCase):
+    def setUp(self):
+        self.erros = autenticador.ErrosHTTP('api-teste', '1.0')
+
+    @patch("autenticacao_api.autenticador.serializacao.ResultadoDeApi.resposta")
+    def test_serializa_conteudo_401_uma_vez(self, resposta_mock):
+        resposta_mock.return_value = ('CONTEUDO 401', 401)
+        self.erros.conteudo_401().should.be.equal('CONTEUDO 401')
+        self.erros.conteudo_401().should.be.equal('CONTEUDO 401')
+        resposta_mock.call_count.should.be.equal(1)
+
+    @patch("autenticacao_api.autenticador.serializacao.ResultadoDeApi.resposta")
+    def test_serializa_conteudo_400_uma_vez_por_conjunto_de_chaves(self, resposta_mock):
+        resposta_mock.return_value = ('CONTEUDO 400', 400)
+        self.erros.conteudo_400(['chave_api'])
+        self.erros.conteudo_400(['chave_api'])
+        resposta_mock.call_count.should.be.equal(1)
+        self.erros.conteudo_400(['chave_api', 'chave_loja'])
+        resposta_mock.call_count.should.be.equal(2)
+
+    @patch("autenticacao_api.autenticador.serializacao.ResultadoDeApi.resposta")
+    def test_conteudo_429_nao_depende_do_li_common(self, resposta_mock):
+        self.erros.conteudo_429().should.be.equal(
+            '{"metadados": {"versao": "1.0", "resultado": "limite_excedido", "api": "api-teste"}, "limite_excedido": {"mensagem": "Limite de requisi\\u00e7\\u00f5es excedido. Tente novamente em alguns instantes."}}')
+        resposta_mock.called.should.be.false
+
+
+class TestErrosHTTPDaAutenticacao(TestBase):
+    def test_reaproveita_erros_http(self):
+        self.autenticacao.define_valor('chave_api', 'valor')
+        self.autenticacao.erros_http().should.be(self.autenticacao.erros_http())
+
+    def test_nova_chave_recria_erros_http(self):
+        self.autenticacao.define_valor('chave_api', 'valor')
+        erros = self.autenticacao.erros_http()
+        self.autenticacao.define_valor('chave_loja', 'valor')
+        self.autenticacao.erros_http().shouldnt.be(erros)
+
+    def test_mudar_valor_de_chave_existente_mantem_erros_http(self):
+        self.autenticacao.define_valor('chave_api', 'valor')
+        erros = self.autenticacao.erros_http()
+        self.autenticacao.define_valor('chave_api', 'outro-valor')
+        self.autenticacao.erros_http().should.be(erros)
+
+
+class RequestMockComLoja(object):
+    headers = {"AUTHORIZATION": "chave_api a-chave-api-eh-essa chave_loja a-chave-da-loja-1"}
+
+
+class TestRepositorioChaves(TestBase):
+    def setUp(self):
+        super(TestRepositorioChaves, self).setUp()
+        self.repositorio = repositorio_chaves.RepositorioChavesMemoria(['chave_api', 'chave_loja'])
+        self.repositorio.adiciona({'chave_api': 'a-chave-api-eh-essa', 'chave_loja': 'a-chave-da-loja-1'}, {'loja_id': 1})
+        self.autenticacao.define_repositorio_chaves(self.repositorio)
+
+    def test_usa_nomes_do_repositorio(self):
+        self.autenticacao.nomes_chaves.should.be.equal(frozenset(['chave_api', 'chave_loja']))
+
+    def test_retorna_identidade(self):
+        chaves = {'chave_api': 'a-chave-api-eh-essa', 'chave_loja': 'a-chave-da-loja-1'}
+        self.autenticacao.retorna_identidade(chaves).should.be.equal({'loja_id': 1})
+        self.autenticacao.chaves_validas(chaves).should.be.true
+
+    def test_credencial_desconhecida_nao_e_valida(self):
+        self.autenticacao.chaves_validas({'chave_api': 'a-chave-api-eh-essa', 'chave_loja': 'outra'}).should.be.false
+
+    def test_retorna_none_se_repositorio_falhar(self):
+        self.repositorio.busca = lambda chaves: 1 / 0
+        self.autenticacao.retorna_identidade({'chave_api': 'x', 'chave_loja': 'y'}).should.be.none
+
+    @patch("autenticacao_api.autenticador.request", RequestMockComLoja)
+    def test_decorator_passa_identidade_para_a_view(self):
+        @self.autenticacao.requerido
+        def requer_autenticacao(identidade):
+            return identidade
+
+        requer_autenticacao().should.be.equal({'loja_id': 1})
+
+    @patch("autenticacao_api.autenticador.request", RequestMockComLoja)
+    @patch("autenticacao_api.autenticador.make_response")
+    def test_decorator_retorna_401_para_credencial_desconhecida(self, response_mock):
+        response_mock.return_value = 'ERRO 401'
+        self.repositorio.remove({'chave_api': 'a-chave-api-eh-essa', 'chave_loja': 'a-chave-da-loja-1'})
+
+        @self.autenticacao.requerido
+        def requer_autenticacao(identidade):
+            return identidade
+
+        requer_autenticacao().should.be.equal('ERRO 401')
+
+
+class TestCacheAutorizacao(TestWhitelabelBase):
+    def setUp(self):
+        super(TestCacheAutorizacao, self).setUp()
+        self.autenticacao.define_valor('chave_api', 'a-chave-api-eh-essa')
+        self.autenticacao.define_cache_autorizacao()
+        self.headers = {"AUTHORIZATION": "chave_api a-chave-api-eh-essa"}
+
+    def test_desligado_por_padrao(self):
+        autenticador.Autenticacao().cache_autorizacao.should.be.none
+
+    def test_autenticacao_aceita_nao_extrai_chaves_de_novo(self):
+        self.autenticacao.autentica(self.headers).should.be.equal((200, None))
+        with patch.object(self.autenticacao, 'extrai_chaves') as extrai_mock:
+            self.autenticacao.autentica(self.headers).should.be.equal((200, None))
+            extrai_mock.called.should.be.false
+
+    def test_nao_guarda_autenticacao_rejeitada(self):
+        self.autenticacao.autentica({"AUTHORIZATION": "chave_api outra"}).should.be.equal((401, None))
+        self.autenticacao.autentica({}).should.be.equal((400, None))
+        len(self.autenticacao.cache_autorizacao).should.be.equal(0)
+
+    def test_define_valor_limpa_o_cache(self):
+        self.autenticacao.autentica(self.headers)
+        self.autenticacao.define_valor('chave_api', 'nova-chave')
+        self.autenticacao.autentica(self.headers).should.be.equal((401, None))
+
+    def test_guarda_identidade_do_repositorio(self):
+        repositorio = repositorio_chaves.RepositorioChavesMemoria(['chave_api'])
+        repositorio.adiciona({'chave_api': 'a-chave-api-eh-essa'}, 5)
+        self.autenticacao.define_repositorio_chaves(repositorio)
+        self.autenticacao.autentica(self.headers)
+        repositorio.remove({'chave_api': 'a-chave-api-eh-essa'})
+        self.autenticacao.autentica(self.headers).should.be.equal((200, 5))
+
+    def test_guarda_contrato_id_do_whitelabel(self):
+        headers = {"AUTHORIZATION": "chave_whitelabel chave-wl"}
+        self.autenticacao.autentica_whitelabel(headers).should.be.equal((200, 42))
+        self.autenticacao.cache_whitelabel.limpa()
+        self.autenticacao.autentica_whitelabel(headers).should.be.equal((200, 42))
+        self.get_mock.call_count.should.be.equal(1)
+
+    def test_mesmo_cabecalho_nao_mistura_requerido_e_whitelabel(self):
+        self.autenticacao.autentica(self.headers)
+        self.autenticacao.autentica_whitelabel(self.headers).should.be.equal((400, None))
+
+    def test_invalida_whitelabel_limpa_o_cache(self):
+        headers = {"AUTHORIZATION": "chave_whitelabel chave-wl"}
+        self.autenticacao.autentica_whitelabel(headers)
+        self.autenticacao.invalida_whitelabel('chave-wl')
+        self.get_mock.side_effect = ContratoNaoExiste
+        self.autenticacao.autentica_whitelabel(headers).should.be.equal((401, None))
+
+    def test_tamanho_zero_desliga_o_cache(self):
+        self.autenticacao.define_cache_autorizacao(tamanho_maximo=0)
+        self.autenticacao.cache_autorizacao.should.be.none
+
+
+class TestCacheWhitelabelCompartilhado(TestWhitelabelBase):
+    def setUp(self):
+        super(TestCacheWhitelabelCompartilhado, self).setUp()
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio)
+        self.caminho = os.path.join(self.diretorio, 'whitelabel.cache')
+        self.autenticacao.define_cache_whitelabel_compartilhado(self.caminho, capacidade=64)
+        self.addCleanup(self.autenticacao.cache_whitelabel.fecha)
+
+    def test_consulta_feita_por_um_processo_vale_para_outro(self):
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        outro_worker = autenticador.Autenticacao()
+        outro_worker.define_cache_whitelabel_compartilhado(self.caminho, capacidade=64)
+        self.addCleanup(outro_worker.cache_whitelabel.fecha)
+        outro_worker.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.equal(42)
+        self.get_mock.call_count.should.be.equal(1)
+
+    def test_invalida_whitelabel_no_cache_compartilhado(self):
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.autenticacao.invalida_whitelabel('chave-wl').should.be.true
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.get_mock.call_count.should.be.equal(2)
+
+
+class TestTokenRequerido(TestBase):
+    def setUp(self):
+        super(TestTokenRequerido, self).setUp()
+        self.autenticacao.define_segredo('s1', 'segredo-1')
+
+    def test_autentica_token_valido(self):
+        token = self.autenticacao.gera_token_whitelabel(42)
+        headers = {"AUTHORIZATION": "token_whitelabel {}".format(token)}
+        self.autenticacao.autentica_token(headers).should.be.equal((200, 42))
+
+    def test_autentica_token_invalido(self):
+        self.autenticacao.autentica_token({"AUTHORIZATION": "token_whitelabel v1.42.1.s1.x"}).should.be.equal((401, None))
+
+    def test_autentica_sem_token(self):
+        self.autenticacao.autentica_token({"AUTHORIZATION": "chave_whitelabel chave-wl"}).should.be.equal((400, None))
+
+    def test_remove_segredo(self):
+        token = self.autenticacao.gera_token_whitelabel(42)
+        self.autenticacao.remove_segredo('s1')
+        headers = {"AUTHORIZATION": "token_whitelabel {}".format(token)}
+        self.autenticacao.autentica_token(headers).should.be.equal((401, None))
+
+    @patch("autenticacao_api.autenticador.Contrato")
+    def test_decorator_passa_contrato_id_sem_consultar_o_banco(self, contrato_mock):
+        token = self.autenticacao.gera_token_whitelabel(42)
+
+        class RequestMockToken(object):
+            headers = {"AUTHORIZATION": "token_whitelabel {}".format(token)}
+
+        @self.autenticacao.token_requerido
+        def requer_autenticacao(contrato_id):
+            return contrato_id
+
+        with patch("autenticacao_api.autenticador.request", RequestMockToken):
+            requer_autenticacao().should.be.equal(42)
+        contrato_mock.objects.only.called.should.be.false
+
+    @patch("autenticacao_api.autenticador.request", RequestMockSemAuthorization)
+    @patch("autenticacao_api.autenticador.make_response")
+    def test_decorator_retorna_400_sem_token(self, response_mock):
+        response_mock.return_value = 'ERRO 400'
+
+        @self.autenticacao.token_requerido
+        def requer_autenticacao(contrato_id):
+            return contrato_id
+
+        requer_autenticacao().should.be.equal('ERRO 400')
+        response_mock.call_args[0][0].should.contain('token_whitelabel XXXXXXXX')
+
+
+class TestImportacaoAdiada(unittest.TestCase):
+    def test_so_importa_no_primeiro_acesso(self):
+        adiado = autenticador.ImportacaoAdiada('modulo_que_nao_existe')
+        (lambda: adiado.qualquer_coisa).should.throw(ImportError)
+
+    def test_acessa_atributo_do_modulo(self):
+        adiado = autenticador.ImportacaoAdiada('os.path')
+        adiado.join('a', 'b').should.be.equal(os.path.join('a', 'b'))
+
+    def test_acessa_atributo_de_nome_dentro_do_modulo(self):
+        adiado = autenticador.ImportacaoAdiada('collections', 'OrderedDict')
+        adiado.fromkeys(['a']).should.be.equal({'a': None})
+
+    def test_importar_o_pacote_nao_carrega_django_nem_li_common(self):
+        codigo = (
+            "import sys\n"
+            "import autenticacao_api\n"
+            "print(','.join(sorted(m for m in sys.modules if m.split('.')[0] in ('django', 'li_common', 'repositories'))))\n"
+        )
+        saida = subprocess.check_output([sys.executable, '-c', codigo])
+        saida.strip().should.be.equal(b'')
+
+    def test_politica_nao_carrega_li_common(self):
+        codigo = (
+            "import sys\n"
+            "from autenticacao_api import autenticador\n"
+            "autenticacao = autenticador.Autenticacao()\n"
+            "autenticacao.define_valor('chave_api', 'valor')\n"
+            "autenticacao.politica(['chave_api'])\n"
+            "print(','.join(sorted(m for m in sys.modules if m.split('.')[0] == 'li_common')))\n"
+        )
+        saida = subprocess.check_output([sys.executable, '-c', codigo])
+        saida.strip().should.be.equal(b'')
+
+
+class TestRetornaWhitelabelIds(TestWhitelabelBase):
+    def setUp(self):
+        super(TestRetornaWhitelabelIds, self).setUp()
+        self.values_list_mock = self.contrato_mock.objects.filter.return_value.values_list
+        self.values_list_mock.return_value = [('chave-1', 1), ('chave-2', 2)]
+
+    def test_resolve_todas_as_chaves_com_uma_consulta(self):
+        ids = self.autenticacao.retorna_whitelabel_ids(['chave-1', 'chave-2', 'chave-3', 'chave-1'])
+        ids.should.be.equal({'chave-1': 1, 'chave-2': 2, 'chave-3': None})
+        self.contrato_mock.objects.filter.call_count.should.be.equal(1)
+        sorted(self.contrato_mock.objects.filter.call_args[1]['chave__in']).should.be.equal(['chave-1', 'chave-2', 'chave-3'])
+        self.values_list_mock.assert_called_with('chave', 'id')
+
+    def test_consulta_em_lotes(self):
+        self.autenticacao.retorna_whitelabel_ids(['chave-{}'.format(indice) for indice in range(5)], tamanho_lote=2)
+        self.contrato_mock.objects.filter.call_count.should.be.equal(3)
+
+    def test_nao_consulta_chaves_em_memoria(self):
+        self.autenticacao.define_cache_whitelabel()
+        self.autenticacao.retorna_whitelabel_ids(['chave-1', 'chave-3'])
+        self.contrato_mock.objects.filter.reset_mock()
+        self.autenticacao.retorna_whitelabel_ids(['chave-1', 'chave-3']).should.be.equal({'chave-1': 1, 'chave-3': None})
+        self.contrato_mock.objects.filter.called.should.be.false
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-1'}).should.be.equal(1)
+        self.get_mock.called.should.be.false
+
+    def test_falha_na_consulta_rejeita_o_lote_sem_guardar(self):
+        self.values_list_mock.side_effect = Exception('banco fora')
+        self.autenticacao.retorna_whitelabel_ids(['chave-1']).should.be.equal({'chave-1': None})
+        len(self.autenticacao.cache_negativo_whitelabel).should.be.equal(0)
+
+    def test_chave_vazia_e_rejeitada(self):
+        self.autenticacao.retorna_whitelabel_ids(['']).should.be.equal({'': None})
+
+
+class TestValidaLote(TestWhitelabelBase):
+    def setUp(self):
+        super(TestValidaLote, self).setUp()
+        self.contrato_mock.objects.filter.return_value.values_list.return_value = [('chave-1', 1)]
+
+    def test_valida_lote_de_whitelabel(self):
+        self.autenticacao.valida_lote([
+            'chave_whitelabel chave-1',
+            'chave_whitelabel chave-2',
+            None,
+            'chave_whitelabel chave-1',
+        ]).should.be.equal([(200, 1), (401, None), (400, None), (200, 1)])
+        self.contrato_mock.objects.filter.call_count.should.be.equal(1)
+
+    def test_valida_lote_do_requerido(self):
+        self.autenticacao.define_valor('chave_api', 'a-chave-api-eh-essa')
+        self.autenticacao.valida_lote(
+            ['chave_api a-chave-api-eh-essa', 'chave_api outra'], tipo='requerido'
+        ).should.be.equal([(200, None), (401, None)])
+
+    def test_valida_lote_de_tokens(self):
+        self.autenticacao.define_segredo('s1', 'segredo')
+        token = self.autenticacao.gera_token_whitelabel(3)
+        self.autenticacao.valida_lote(['token_whitelabel {}'.format(token)], tipo='token').should.be.equal([(200, 3)])
+
+    def test_tipo_desconhecido(self):
+        self.autenticacao.valida_lote.when.called_with([], tipo='outro').should.throw(ValueError)
+
+
+class TestValidaLoteComBanco(TestBase):
+    def test_valida_lote_com_contratos_no_sqlite(self):
+        with patch("autenticacao_api.autenticador.Contrato", contrato_sqlite.cria_contrato(1000)):
+            resultados = self.autenticacao.valida_lote(
+                ['chave_whitelabel chave-{}'.format(indice) for indice in range(995, 1005)], tamanho_lote=3)
+        resultados.should.be.equal([(200, indice + 1) for indice in range(995, 1000)] + [(401, None)] * 5)
+
+
+class TestMetricasDaAutenticacao(TestWhitelabelBase):
+    def setUp(self):
+        super(TestMetricasDaAutenticacao, self).setUp()
+        self.autenticacao.define_valor('chave_api', 'a-chave-api-eh-essa')
+        self.metricas = metricas.Metricas()
+        self.autenticacao.define_metricas(self.metricas)
+
+    def test_desligadas_por_padrao_sem_substituir_metodos(self):
+        autenticacao = autenticador.Autenticacao()
+        autenticacao.metricas.should.be.none
+        autenticacao.__dict__.should_not.contain('extrai_chaves')
+        autenticacao.__dict__.should_not.contain('autentica')
+
+    def test_conta_resultados_e_mede_estagios(self):
+        self.autenticacao.autentica({"AUTHORIZATION": "chave_api a-chave-api-eh-essa"})
+        self.autenticacao.autentica({"AUTHORIZATION": "chave_api outra"})
+        self.autenticacao.autentica({})
+        self.metricas.contadores.should.be.equal({'resultado.ok': 1, 'resultado.401': 1, 'resultado.400': 1})
+        self.metricas.histograma('extrai_chaves').total.should.be.equal(3)
+        self.metricas.histograma('chaves_validas').total.should.be.equal(2)
+
+    def test_conta_excecao_na_consulta_do_contrato(self):
+        self.get_mock.side_effect = Exception('banco fora')
+        self.autenticacao.autentica_whitelabel({"AUTHORIZATION": "chave_whitelabel chave-wl"}).should.be.equal((401, None))
+        self.metricas.contadores['consulta.excecao'].should.be.equal(1)
+        self.metricas.histograma('retorna_whitelabel_id').total.should.be.equal(1)
+
+    @patch("autenticacao_api.autenticador.serializacao.ResultadoDeApi.resposta")
+    def test_mede_montagem_dos_erros(self, resposta_mock):
+        resposta_mock.return_value = ('CONTEUDO 401', 401)
+        self.autenticacao.erros_http().resposta_wsgi(401)
+        self.metricas.histograma('erros_http').total.should.be.equal(1)
+
+    def test_instantaneo_tem_razao_de_acertos_do_cache_whitelabel(self):
+        self.autenticacao.define_cache_whitelabel()
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.metricas.instantaneo()['caches']['cache_whitelabel']['razao_acertos'].should.be.equal(0.5)
+
+    def test_desligar_volta_aos_metodos_originais(self):
+        self.autenticacao.define_metricas(None)
+        self.autenticacao.__dict__.should_not.contain('extrai_chaves')
+        self.autenticacao.autentica({})
+        self.metricas.contadores.should.be.empty
+
+
+class TestLimiteRequisicoes(TestBase):
+    def setUp(self):
+        super(TestLimiteRequisicoes, self).setUp()
+        self.autenticacao.define_valor('chave_api', 'a-chave-api-eh-essa')
+        self.autenticacao.define_limite_requisicoes(taxa=1, rajada=2)
+
+    def test_desligado_por_padrao(self):
+        autenticador.Autenticacao().limite_requisicoes.should.be.none
+
+    def test_none_desliga_o_limite(self):
+        self.autenticacao.define_limite_requisicoes(None)
+        self.autenticacao.limite_requisicoes.should.be.none
+
+    @patch("autenticacao_api.autenticador.request", RequestMock)
+    @patch("autenticacao_api.autenticador.make_response")
+    def test_requerido_retorna_429_acima_do_limite(self, response_mock):
+        response_mock.return_value = 'ERRO 429'
+
+        @self.autenticacao.requerido
+        def requer_autenticacao():
+            return 'ok'
+
+        [requer_autenticacao() for _ in range(3)].should.be.equal(['ok', 'ok', 'ERRO 429'])
+        response_mock.assert_called_with(
+            '{"metadados": {"versao": "0.0.1", "resultado": "limite_excedido", "api": "Autenticador"}, "limite_excedido": {"mensagem": "Limite de requisi\\u00e7\\u00f5es excedido. Tente novamente em alguns instantes."}}',
+            429,
+            {'Content-Type': 'text/json; charset=utf-8'}
+        )
+
+    def test_limite_por_contrato_no_token_requerido(self):
+        self.autenticacao.define_segredo('s1', 'segredo-1')
+        tokens = [self.autenticacao.gera_token_whitelabel(contrato_id) for contrato_id in (1, 1, 1, 2)]
+        [self.autenticacao.autentica_token({"AUTHORIZATION": "token_whitelabel {}".format(token)})
+         for token in tokens].should.be.equal([(200, 1), (200, 1), (429, 1), (200, 2)])
+
+    def test_limite_pela_credencial_e_nao_pelo_texto_do_cabecalho(self):
+        self.autenticacao.define_valor('outra_chave', 'outro-valor')
+        cabecalhos = [
+            "chave_api a-chave-api-eh-essa outra_chave outro-valor",
+            "outra_chave outro-valor chave_api a-chave-api-eh-essa",
+            "chave_api  a-chave-api-eh-essa   outra_chave outro-valor",
+        ]
+        [self.autenticacao.autentica({"AUTHORIZATION": authorization})[0]
+         for authorization in cabecalhos].should.be.equal([200, 200, 429])
+
+    def test_limite_pelo_hash_da_credencial_com_identidade_dicionario(self):
+        repositorio = repositorio_chaves.RepositorioChavesMemoria(['chave_api'])
+        repositorio.adiciona({'chave_api': 'loja-1'}, {'loja_id': 1})
+        repositorio.adiciona({'chave_api': 'loja-2'}, {'loja_id': 2})
+        self.autenticacao.define_repositorio_chaves(repositorio)
+        resultados = [self.autenticacao.autentica({"AUTHORIZATION": "chave_api {}".format(chave)})
+                      for chave in ('loja-1', 'loja-1', 'loja-1', 'loja-2')]
+        resultados.should.be.equal([(200, {'loja_id': 1}), (200, {'loja_id': 1}), (429, {'loja_id': 1}),
+                                    (200, {'loja_id': 2})])
+
+    def test_limite_vale_no_cache_de_autorizacao(self):
+        self.autenticacao.define_cache_autorizacao()
+        headers = {"AUTHORIZATION": "chave_api a-chave-api-eh-essa"}
+        [self.autenticacao.autentica(headers)[0] for _ in range(3)].should.be.equal([200, 200, 429])
+
+    def test_limite_nao_vale_na_validacao_em_lote(self):
+        self.autenticacao.valida_lote(['chave_api a-chave-api-eh-essa', 'chave_api  a-chave-api-eh-essa',
+                                       'chave_api   a-chave-api-eh-essa'], tipo='requerido').should.be.equal(
+            [(200, None), (200, None), (200, None)])
+
+    def test_conta_um_resultado_por_requisicao_nas_metricas(self):
+        registro = metricas.Metricas()
+        self.autenticacao.define_metricas(registro)
+        for _ in range(3):
+            self.autenticacao.autentica({"AUTHORIZATION": "chave_api a-chave-api-eh-essa"})
+        registro.contadores.should.be.equal({'resultado.ok': 2, 'resultado.429': 1})
+
+
+class TestRevalidacaoWhitelabel(TestWhitelabelBase):
+    def setUp(self):
+        super(TestRevalidacaoWhitelabel, self).setUp()
+        self.autenticacao.define_cache_whitelabel(ttl=0)
+        self.autenticacao.define_revalidacao_whitelabel()
+        self.chaves = {'chave_whitelabel': 'chave-wl'}
+
+    def espera_revalidacao(self):
+        while self.autenticacao._revalidando:
+            threading.Event().wait(0.001)
+
+    def test_desligada_por_padrao(self):
+        autenticador.Autenticacao().cache_obsoleto_whitelabel.should.be.none
+
+    def test_serve_contrato_expirado_e_revalida_em_segundo_plano(self):
+        self.autenticacao.retorna_whitelabel_id(self.chaves).should.be.equal(42)
+        ContratoMock.id = 43
+        self.addCleanup(setattr, ContratoMock, 'id', 42)
+        self.autenticacao.retorna_whitelabel_id(self.chaves).should.be.equal(42)
+        self.espera_revalidacao()
+        self.get_mock.call_count.should.be.equal(2)
+        self.autenticacao.obsoletas_servidas.should.be.equal(1)
+        self.autenticacao.busca_whitelabel_obsoleto('chave-wl').should.be.equal(43)
+
+    def test_serve_contrato_expirado_com_o_banco_fora(self):
+        self.autenticacao.retorna_whitelabel_id(self.chaves)
+        self.get_mock.side_effect = Exception('banco fora')
+        self.autenticacao.retorna_whitelabel_id(self.chaves).should.be.equal(42)
+        self.espera_revalidacao()
+        self.autenticacao.retorna_whitelabel_id(self.chaves).should.be.equal(42)
+        self.espera_revalidacao()
+
+    def test_contrato_desativado_deixa_de_ser_servido(self):
+        self.autenticacao.retorna_whitelabel_id(self.chaves)
+        self.get_mock.side_effect = ContratoNaoExiste
+        self.autenticacao.retorna_whitelabel_id(self.chaves)
+        self.espera_revalidacao()
+        self.autenticacao.retorna_whitelabel_id(self.chaves).should.be.none
+
+    def test_contrato_desativado_sai_do_cache_de_autorizacao(self):
+        self.autenticacao.define_cache_autorizacao()
+        headers = {'AUTHORIZATION': 'chave_whitelabel chave-wl'}
+        self.autenticacao.autentica_whitelabel(headers).should.be.equal((200, 42))
+        self.autenticacao.cache_autorizacao.limpa()
+        self.get_mock.side_effect = ContratoNaoExiste
+        self.autenticacao.autentica_whitelabel(headers).should.be.equal((200, 42))
+        self.espera_revalidacao()
+        self.autenticacao.autentica_whitelabel(headers).should.be.equal((401, None))
+
+    def test_muitas_chaves_expiradas_usam_poucas_threads(self):
+        chaves = ['chave-{}'.format(indice) for indice in range(20)]
+        for chave in chaves:
+            self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': chave})
+        for chave in chaves:
+            self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': chave}).should.be.equal(42)
+        self.espera_revalidacao()
+        self.get_mock.call_count.should.be.equal(40)
+        len(self.autenticacao._threads_revalidacao).should.be.equal(2)
+
+    def test_descarta_revalidacoes_acima_do_maximo(self):
+        self.autenticacao.define_revalidacao_whitelabel(threads=0, maximo_pendentes=3)
+        chaves = ['chave-{}'.format(indice) for indice in range(5)]
+        for chave in chaves:
+            self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': chave})
+        for chave in chaves:
+            self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': chave}).should.be.equal(42)
+        len(self.autenticacao._revalidando).should.be.equal(3)
+
+    def test_lote_usa_contrato_expirado_se_a_consulta_falhar(self):
+        self.autenticacao.retorna_whitelabel_id(self.chaves)
+        self.contrato_mock.objects.filter.side_effect = Exception('banco fora')
+        self.autenticacao.retorna_whitelabel_ids(['chave-wl', 'outra']).should.be.equal({'chave-wl': 42, 'outra': None})
+
+
+class TestDisjuntorWhitelabel(TestWhitelabelBase):
+    def setUp(self):
+        super(TestDisjuntorWhitelabel, self).setUp()
+        self.autenticacao.define_cache_whitelabel(ttl_negativo=0)
+        self.autenticacao.define_disjuntor_whitelabel(falhas_maximas=2, tempo_espera=60)
+        self.get_mock.side_effect = Exception('banco fora')
+
+    def test_desligado_por_padrao(self):
+        autenticador.Autenticacao().disjuntor_whitelabel.should.be.none
+
+    def test_para_de_consultar_depois_de_falhas_seguidas(self):
+        for _ in range(5):
+            self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.none
+        self.get_mock.call_count.should.be.equal(2)
+        self.autenticacao.disjuntor_whitelabel.estado.should.be.equal('aberto')
+
+    def test_aberto_ainda_serve_o_cache(self):
+        self.get_mock.side_effect = None
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.get_mock.side_effect = Exception('banco fora')
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'outra'})
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'mais-uma'})
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.equal(42)
+
+    def test_chave_inexistente_nao_e_falha(self):
+        self.get_mock.side_effect = ContratoNaoExiste
+        for _ in range(3):
+            self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.autenticacao.disjuntor_whitelabel.estado.should.be.equal('fechado')
+
+    def test_conta_mudancas_de_estado_nas_metricas(self):
+        registro = metricas.Metricas()
+        self.autenticacao.define_metricas(registro)
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'a'})
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'b'})
+        registro.contadores['disjuntor.fechado_aberto'].should.be.equal(1)
+
+    def test_conta_uma_falha_por_consulta_lenta(self):
+        self.autenticacao.define_tempo_limite_whitelabel(0.01)
+        liberada = threading.Event()
+        self.get_mock.side_effect = lambda **kwargs: liberada.wait(5) and ContratoMock
+        lider = threading.Thread(target=self.autenticacao.retorna_whitelabel_id, args=({'chave_whitelabel': 'lenta'},))
+        lider.start()
+        while not self.autenticacao.voo_unico_whitelabel._chamadas:
+            threading.Event().wait(0.001)
+        for _ in range(3):
+            self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'lenta'}).should.be.none
+        self.autenticacao.disjuntor_whitelabel.falhas_seguidas.should.be.equal(1)
+        self.autenticacao.disjuntor_whitelabel.estado.should.be.equal('fechado')
+        liberada.set()
+        lider.join()
+
+    def test_sucesso_de_consulta_anterior_nao_fecha_o_disjuntor(self):
+        disjuntor_whitelabel = self.autenticacao.disjuntor_whitelabel
+        permissao = disjuntor_whitelabel.permite()
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'a'})
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'b'})
+        disjuntor_whitelabel.estado.should.be.equal('aberto')
+        disjuntor_whitelabel.sucesso(permissao)
+        disjuntor_whitelabel.estado.should.be.equal('aberto')
+
+    def test_lote_nao_consulta_com_o_disjuntor_aberto(self):
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'a'})
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'b'})
+        self.autenticacao.retorna_whitelabel_ids(['c']).should.be.equal({'c': None})
+        self.contrato_mock.objects.filter.called.should.be.false
+
+
+class TestIndiceWhitelabel(TestBase):
+    def setUp(self):
+        super(TestIndiceWhitelabel, self).setUp()
+        self.contrato = contrato_sqlite.cria_contrato(100)
+        patcher = patch("autenticacao_api.autenticador.Contrato", self.contrato)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.autenticacao.desliga_indice_whitelabel)
+
+    def altera(self, sql, *parametros):
+        self.contrato.conexao.execute(sql, parametros)
+        self.contrato.conexao.commit()
+
+    def test_carrega_contratos_ativos_e_nao_consulta_o_banco(self):
+        self.autenticacao.define_indice_whitelabel(intervalo_sincronizacao=None)
+        with patch.object(self.autenticacao, 'consulta_contrato_id') as consulta_mock:
+            self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-10'}).should.be.equal(11)
+            self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'nao-existe'}).should.be.none
+            consulta_mock.called.should.be.false
+
+    def test_carrega_com_django_sem_chunk_size(self):
+        with patch.object(contrato_sqlite.ValoresContrato, 'iterator', lambda valores: iter(valores)):
+            self.autenticacao.define_indice_whitelabel(intervalo_sincronizacao=None)
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-10'}).should.be.equal(11)
+
+    def test_estatisticas(self):
+        self.autenticacao.estatisticas_indice_whitelabel().should.be.none
+        self.autenticacao.define_indice_whitelabel(intervalo_sincronizacao=None)
+        estatisticas = self.autenticacao.estatisticas_indice_whitelabel()
+        estatisticas['quantidade'].should.be.equal(100)
+        estatisticas['memoria'].should.be.equal(2400)
+        estatisticas['tempo_carga'].should.be.a(float)
+
+    def test_sincroniza_relendo_todos_os_contratos(self):
+        self.autenticacao.define_indice_whitelabel(intervalo_sincronizacao=None)
+        self.altera("UPDATE contrato SET ativo = 0 WHERE chave = 'chave-10'")
+        self.altera("INSERT INTO contrato (id, chave, tipo, ativo) VALUES (500, 'nova', 'whitelabel', 1)")
+        self.autenticacao.sincroniza_indice_whitelabel()
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-10'}).should.be.none
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'nova'}).should.be.equal(500)
+
+    def test_sincroniza_so_os_contratos_alterados(self):
+        self.autenticacao.define_indice_whitelabel(intervalo_sincronizacao=None, campo_alteracao='alterado_em')
+        self.altera("UPDATE contrato SET ativo = 0, alterado_em = 5 WHERE chave = 'chave-10'")
+        self.altera("INSERT INTO contrato (id, chave, tipo, ativo, alterado_em) VALUES (500, 'nova', 'whitelabel', 1, 5)")
+        with patch.object(self.autenticacao.indice_whitelabel, 'substitui') as substitui_mock:
+            self.autenticacao.sincroniza_indice_whitelabel()
+            substitui_mock.called.should.be.false
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-10'}).should.be.none
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'nova'}).should.be.equal(500)
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-11'}).should.be.equal(12)
+
+    def test_sincronizacao_tira_do_cache_de_autorizacao(self):
+        self.autenticacao.define_cache_autorizacao()
+        self.autenticacao.define_indice_whitelabel(intervalo_sincronizacao=None, campo_alteracao='alterado_em')
+        headers = {'AUTHORIZATION': 'chave_whitelabel chave-10'}
+        self.autenticacao.autentica_whitelabel(headers).should.be.equal((200, 11))
+        self.altera("UPDATE contrato SET ativo = 0, alterado_em = 5 WHERE id = 11")
+        self.autenticacao.sincroniza_indice_whitelabel()
+        self.autenticacao.autentica_whitelabel(headers).should.be.equal((401, None))
+
+    def test_recarga_tira_do_cache_de_autorizacao(self):
+        self.autenticacao.define_cache_autorizacao()
+        self.autenticacao.define_indice_whitelabel(intervalo_sincronizacao=None)
+        headers = {'AUTHORIZATION': 'chave_whitelabel chave-10'}
+        self.autenticacao.autentica_whitelabel(headers).should.be.equal((200, 11))
+        self.altera("DELETE FROM contrato WHERE id = 11")
+        self.autenticacao.sincroniza_indice_whitelabel()
+        self.autenticacao.autentica_whitelabel(headers).should.be.equal((401, None))
+
+    def test_sincroniza_troca_de_chave_e_de_tipo(self):
+        self.autenticacao.define_indice_whitelabel(intervalo_sincronizacao=None, campo_alteracao='alterado_em')
+        self.altera("UPDATE contrato SET chave = 'chave-nova', alterado_em = 5 WHERE id = 11")
+        self.altera("UPDATE contrato SET tipo = 'outro', alterado_em = 5 WHERE id = 12")
+        self.autenticacao.sincroniza_indice_whitelabel()
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-10'}).should.be.none
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-nova'}).should.be.equal(11)
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-11'}).should.be.none
+
+    def falha_no_meio(self, linhas):
+        def pares_contratos(filtros, campos):
+            for linha in linhas:
+                yield linha
+            raise RuntimeError('conexão perdida')
+        return patch.object(self.autenticacao, '_pares_contratos', side_effect=pares_contratos)
+
+    def test_sincronizacao_interrompida_nao_avanca_a_marca(self):
+        self.autenticacao.define_indice_whitelabel(intervalo_sincronizacao=None, campo_alteracao='alterado_em')
+        self.altera("UPDATE contrato SET ativo = 0, alterado_em = 5 WHERE id = 11")
+        self.altera("UPDATE contrato SET ativo = 0, alterado_em = 9 WHERE id = 12")
+        with self.falha_no_meio([(12, 'chave-11', 'whitelabel', 0, 9)]):
+            self.autenticacao.sincroniza_indice_whitelabel.when.called_with().should.throw(RuntimeError)
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-11'}).should.be.equal(12)
+        self.autenticacao.sincroniza_indice_whitelabel()
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-10'}).should.be.none
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-11'}).should.be.none
+
+    def test_carga_interrompida_mantem_o_indice_e_a_marca(self):
+        self.autenticacao.define_indice_whitelabel(intervalo_sincronizacao=None, campo_alteracao='alterado_em')
+        self.altera("UPDATE contrato SET alterado_em = 5 WHERE id = 11")
+        self.autenticacao.sincroniza_indice_whitelabel()
+        with self.falha_no_meio([('chave-0', 1, 0)]):
+            self.autenticacao.carrega_indice_whitelabel.when.called_with().should.throw(RuntimeError)
+        self.autenticacao._marca_sincronizacao.should.be.equal(5)
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-50'}).should.be.equal(51)
+
+    def test_sincronizacao_manual_espera_a_em_segundo_plano(self):
+        self.autenticacao.define_indice_whitelabel(intervalo_sincronizacao=None)
+        with self.autenticacao._trava_sincronizacao:
+            thread = threading.Thread(target=self.autenticacao.sincroniza_indice_whitelabel)
+            thread.start()
+            thread.join(0.05)
+            self.autenticacao.sincronizacoes_indice.should.be.equal(0)
+        thread.join()
+        self.autenticacao.sincronizacoes_indice.should.be.equal(1)
+
+    @patch("autenticacao_api.autenticador.time")
+    def test_recarga_completa_remove_contratos_apagados(self, time_mock):
+        time_mock.time.return_value = 1000.0
+        self.autenticacao.define_indice_whitelabel(
+            intervalo_sincronizacao=None, campo_alteracao='alterado_em', intervalo_recarga=3600)
+        self.altera("DELETE FROM contrato WHERE id = 11")
+        self.autenticacao.sincroniza_indice_whitelabel()
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-10'}).should.be.equal(11)
+        time_mock.time.return_value = 1000.0 + 3600
+        self.autenticacao.sincroniza_indice_whitelabel()
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-10'}).should.be.none
+
+    def test_sincroniza_em_segundo_plano(self):
+        self.autenticacao.define_indice_whitelabel(intervalo_sincronizacao=0.01)
+        self.altera("INSERT INTO contrato (id, chave, tipo, ativo) VALUES (500, 'nova', 'whitelabel', 1)")
+        for _ in range(500):
+            if self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'nova'}) is not None:
+                break
+            threading.Event().wait(0.01)
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'nova'}).should.be.equal(500)
+
+    def test_desliga_volta_a_consultar_o_banco(self):
+        self.autenticacao.define_indice_whitelabel(intervalo_sincronizacao=None)
+        self.autenticacao.desliga_indice_whitelabel()
+        self.autenticacao.indice_whitelabel.should.be.none
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-10'}).should.be.equal(11)
+
+
+class TestCacheDistribuido(TestWhitelabelBase):
+    def setUp(self):
+        super(TestCacheDistribuido, self).setUp()
+        self.autenticacao = autenticador.Autenticacao('loja')
+        self.backend = cache_distribuido.BackendMemoria()
+        self.autenticacao.define_cache_distribuido(self.backend)
+        self.values_list_mock = self.contrato_mock.objects.filter.return_value.values_list
+        self.values_list_mock.return_value = [('chave-1', 1), ('chave-2', 2)]
+        self.repositorio = repositorio_chaves.RepositorioChavesMemoria(['chave_api', 'chave_loja'])
+        self.chaves = {'chave_api': 'a-chave-api-eh-essa', 'chave_loja': 'a-chave-da-loja-1'}
+        self.repositorio.adiciona(self.chaves, {'loja_id': 1})
+
+    def outra_instancia(self, nome_api='loja', **opcoes):
+        outra = autenticador.Autenticacao(nome_api)
+        outra.define_cache_distribuido(self.backend, **opcoes)
+        return outra
+
+    def test_contrato_consultado_por_uma_instancia_vale_para_outra(self):
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.equal(42)
+        self.outra_instancia().retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.equal(42)
+        self.get_mock.call_count.should.be.equal(1)
+
+    def test_chave_rejeitada_vale_para_outra_instancia(self):
+        self.get_mock.side_effect = ContratoNaoExiste
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.none
+        self.outra_instancia().retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'}).should.be.none
+        self.get_mock.call_count.should.be.equal(1)
+
+    def test_namespace_pelo_nome_da_api(self):
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.outra_instancia('pedido').retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.get_mock.call_count.should.be.equal(2)
+        digest = hashlib.sha256(b'chave-wl').hexdigest()
+        sorted(self.backend._itens).should.be.equal([
+            'autenticacao_api:loja:whitelabel:' + digest, 'autenticacao_api:pedido:whitelabel:' + digest])
+
+    def test_invalida_whitelabel_remove_do_compartilhado(self):
+        self.autenticacao.retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.autenticacao.invalida_whitelabel('chave-wl').should.be.true
+        self.outra_instancia().retorna_whitelabel_id({'chave_whitelabel': 'chave-wl'})
+        self.get_mock.call_count.should.be.equal(2)
+
+    def test_lote_busca_os_caches_de_uma_vez(self):
+        self.autenticacao.retorna_whitelabel_ids(['chave-1', 'chave-2', 'chave-3'])
+        outra = self.outra_instancia(tamanho_l1=0)
+        with patch.object(self.backend, 'obtem_varios', wraps=self.backend.obtem_varios) as obtem_mock:
+            outra.retorna_whitelabel_ids(['chave-1', 'chave-2', 'chave-3']).should.be.equal(
+                {'chave-1': 1, 'chave-2': 2, 'chave-3': None})
+            obtem_mock.call_count.should.be.equal(2)
+        self.contrato_mock.objects.filter.call_count.should.be.equal(1)
+
+    def test_sem_l1_usa_so_o_compartilhado(self):
+        outra = self.outra_instancia(tamanho_l1=0)
+        outra.cache_whitelabel.should.be.a(cache_distribuido.CacheDistribuido)
+        self.autenticacao.cache_whitelabel.should.be.a(cache_distribuido.CacheDuasCamadas)
+
+    def test_credencial_validada_por_uma_instancia_vale_para_outra(self):
+        self.autenticacao.define_repositorio_chaves(self.repositorio)
+        self.autenticacao.retorna_identidade(self.chaves).should.be.equal({'loja_id': 1})
+        outra = self.outra_instancia()
+        outra.define_repositorio_chaves(repositorio_chaves.RepositorioChavesMemoria(['chave_api', 'chave_loja']))
+        self.autenticacao.retorna_identidade(self.chaves)
+        with patch.object(self.repositorio, 'busca_por_digest') as busca_mock:
+            outra.retorna_identidade(self.chaves).should.be.equal({'loja_id': 1})
+            outra.chaves_validas(self.chaves).should.be.true
+            busca_mock.called.should.be.false
+
+    def test_credencial_guardada_pelo_hash(self):
+        self.autenticacao.define_repositorio_chaves(self.repositorio)
+        self.autenticacao.retorna_identidade(self.chaves)
+        chave, = [chave for chave in self.backend._itens if ':credencial:' in chave]
+        digest = self.repositorio.digest(self.chaves).encode('utf-8')
+        chave.should.be.equal('autenticacao_api:loja:credencial:{}'.format(hashlib.sha256(digest).hexdigest()))
+
+    def test_credencial_desconhecida_nao_e_guardada(self):
+        self.autenticacao.define_repositorio_chaves(self.repositorio)
+        self.autenticacao.chaves_validas({'chave_api': 'a-chave-api-eh-essa', 'chave_loja': 'outra'}).should.be.false
+        self.autenticacao.cache_credenciais.estatisticas()['l2']['falhas'].should.be.equal(1)
+        [chave for chave in self.backend._itens if ':credencial:' in chave].should.be.empty
+
+    def test_invalida_credencial(self):
+        self.autenticacao.define_repositorio_chaves(self.repositorio)
+        self.autenticacao.retorna_identidade(self.chaves)
+        self.repositorio.remove(self.chaves)
+        self.autenticacao.invalida_credencial(self.chaves).should.be.true
+        self.autenticacao.retorna_identidade(self.chaves).should.be.none
+
+    def test_ttl_credencial_zero_desliga_o_cache_de_credenciais(self):
+        self.outra_instancia(ttl_credencial=0).cache_credenciais.should.be.none
+
+
+class RequestMockComRotacao(object):
+    headers = {"AUTHORIZATION": "chave_api a-chave-api-nova"}
+
+
+class TestPoliticaPorRota(TestBase):
+    def setUp(self):
+        super(TestPoliticaPorRota, self).setUp()
+        self.autenticacao.define_valor('chave_api', 'a-chave-api-eh-essa')
+        self.autenticacao.define_valor('chave_loja', 'a-chave-da-loja-1')
+
+    def cria_view(self, **opcoes):
+        @self.autenticacao.requerido(**opcoes)
+        def view(**kwargs):
+            return 'ok'
+
+        return view
+
+    @patch("autenticacao_api.autenticador.request", RequestMock)
+    def test_rota_exige_so_as_chaves_da_politica(self):
+        self.cria_view(chaves=['chave_api'])().should.be.equal('ok')
+
+    @patch("autenticacao_api.autenticador.request", RequestMock)
+    @patch("autenticacao_api.autenticador.make_response")
+    def test_rota_com_todas_as_chaves_retorna_400(self, response_mock):
+        response_mock.return_value = 'ERRO 400'
+        self.cria_view()().should.be.equal('ERRO 400')
+        response_mock.call_args[0][1].should.be.equal(400)
+
+    @patch("autenticacao_api.autenticador.request", RequestMockSemAuthorization)
+    @patch("autenticacao_api.autenticador.make_response")
+    def test_400_cita_so_as_chaves_da_rota(self, response_mock):
+        response_mock.return_value = 'ERRO 400'
+        self.cria_view(chaves=['chave_api'])().should.be.equal('ERRO 400')
+        response_mock.call_args[0][0].should.contain('Authorization com chave_api para')
+
+    def test_mensagem_do_400_e_montada_na_decoracao_e_serializada_no_erro(self):
+        self.cria_view(chaves=['chave_loja'])
+        erros = self.autenticacao.erros_http()
+        erros._mensagens_400.should.contain(('chave_loja',))
+        erros._conteudos_400.shouldnt.contain(('chave_loja',))
+
+    @patch("autenticacao_api.autenticador.request", RequestMockComRotacao)
+    @patch("autenticacao_api.autenticador.make_response")
+    def test_aceita_valor_durante_a_rotacao(self, response_mock):
+        response_mock.return_value = 'ERRO 401'
+        view = self.cria_view(chaves=['chave_api'])
+        view().should.be.equal('ERRO 401')
+        self.autenticacao.aceita_valor('chave_api', 'a-chave-api-nova')
+        view().should.be.equal('ok')
+        self.cria_view(chaves=['chave_api'], aceita_rotacao=False)().should.be.equal('ERRO 401')
+        self.autenticacao.remove_valor_aceito('chave_api', 'a-chave-api-nova').should.be.true
+        view().should.be.equal('ERRO 401')
+
+    @patch("autenticacao_api.autenticador.request", RequestMock)
+    @patch("autenticacao_api.autenticador.make_response")
+    def test_politica_acompanha_o_define_valor(self, response_mock):
+        response_mock.return_value = 'ERRO 401'
+        view = self.cria_view(chaves=['chave_api'])
+        self.autenticacao.define_valor('chave_api', 'outra')
+        view().should.be.equal('ERRO 401')
+
+    def test_aceita_valor_exige_chave_definida(self):
+        self.autenticacao.aceita_valor.when.called_with('chave_pedido', 'x').should.throw(ValueError)
+
+    def test_chaves_validas_aceita_valor_em_rotacao(self):
+        self.autenticacao.aceita_valor('chave_api', 'a-chave-api-nova')
+        self.autenticacao.chaves_validas(
+            {'chave_api': 'a-chave-api-nova', 'chave_loja': 'a-chave-da-loja-1'}).should.be.true
+
+    def test_remove_valor_que_nao_era_aceito(self):
+        self.autenticacao.remove_valor_aceito('chave_api', 'nunca-aceito').should.be.false
+
+    @patch("autenticacao_api.autenticador.request", RequestMockComLoja)
+    def test_politica_com_repositorio_passa_identidade(self):
+        repositorio = repositorio_chaves.RepositorioChavesMemoria(['chave_api', 'chave_loja'])
+        repositorio.adiciona({'chave_api': 'a-chave-api-eh-essa', 'chave_loja': 'a-chave-da-loja-1'}, {'loja_id': 1})
+        self.autenticacao.define_repositorio_chaves(repositorio)
+
+        @self.autenticacao.requerido(chaves=['chave_api', 'chave_loja'])
+        def view(identidade):
+            return identidade
+
+        view().should.be.equal({'loja_id': 1})
+
+    @patch("autenticacao_api.autenticador.request", RequestMockComLoja)
+    def test_politica_sem_chaves_usa_as_chaves_do_repositorio(self):
+        autenticacao = autenticador.Autenticacao()
+        repositorio = repositorio_chaves.RepositorioChavesMemoria(['chave_api', 'chave_loja'])
+        repositorio.adiciona({'chave_api': 'a-chave-api-eh-essa', 'chave_loja': 'a-chave-da-loja-1'}, {'loja_id': 1})
+        autenticacao.define_repositorio_chaves(repositorio)
+
+        @autenticacao.requerido()
+        def view(identidade):
+            return identidade
+
+        view().should.be.equal({'loja_id': 1})
+
+
+class TestAuditoriaDaAutenticacao(TestWhitelabelBase):
+    def setUp(self):
+        super(TestAuditoriaDaAutenticacao, self).setUp()
+        self.autenticacao.define_valor('chave_api', 'a-chave-api-eh-essa')
+        self.saida = auditoria.SaidaMemoria()
+        self.auditoria = auditoria.Auditoria(self.saida, intervalo=None)
+        self.autenticacao.define_auditoria(self.auditoria)
+
+    def registros(self):
+        self.auditoria.descarrega()
+        return [(tipo, status, valor) for momento, tipo, credencial, status, valor in self.saida.registros]
+
+    def test_desligada_por_padrao(self):
+        autenticacao = autenticador.Autenticacao()
+        autenticacao.auditoria.should.be.none
+        autenticacao.__dict__.should_not.contain('autentica')
+
+    def test_registra_cada_decisao(self):
+        self.autenticacao.autentica({"AUTHORIZATION": "chave_api a-chave-api-eh-essa"})
+        self.autenticacao.autentica({"AUTHORIZATION": "chave_api outra"})
+        self.autenticacao.autentica({})
+        self.autenticacao.autentica_whitelabel({"AUTHORIZATION": "chave_whitelabel chave-wl"})
+        self.registros().should.be.equal([
+            ('requerido', 200, None), ('requerido', 401, None), ('requerido', 400, None), ('whitelabel', 200, 42)])
+
+    def test_nao_grava_a_chave(self):
+        self.autenticacao.autentica({"AUTHORIZATION": "chave_api a-chave-api-eh-essa"})
+        self.auditoria.descarrega()
+        repr(self.saida.registros).should_not.contain('a-chave-api-eh-essa')
+
+    def test_registra_429(self):
+        self.autenticacao.define_limite_requisicoes(taxa=1, rajada=1)
+        headers = {"AUTHORIZATION": "chave_whitelabel chave-wl"}
+        self.autenticacao.autentica_whitelabel(headers).should.be.equal((200, 42))
+        self.autenticacao.autentica_whitelabel(headers).should.be.equal((429, 42))
+        self.registros().should.be.equal([('whitelabel', 200, 42), ('whitelabel', 429, 42)])
+
+    def test_funciona_junto_com_as_metricas(self):
+        medidas = metricas.Metricas()
+        self.autenticacao.define_metricas(medidas)
+        self.autenticacao.autentica({})
+        self.autenticacao.define_metricas(None)
+        self.autenticacao.autentica({})
+        medidas.contadores.should.be.equal({'resultado.400': 1})
+        self.registros().should.be.equal([('requerido', 400, None), ('requerido', 400, None)])
+
+    def test_desligar_volta_aos_metodos_originais(self):
+        self.autenticacao.define_auditoria(None)
+        self.autenticacao.__dict__.should_not.contain('autentica')
+        self.autenticacao.autentica({})
+        self.registros().should.be.empty
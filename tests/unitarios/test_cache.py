@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from autenticacao_api import cache
+from tests.unitarios import base
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_cache(self):
+        arquivo = cache.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class TestCacheLRU(unittest.TestCase):
+    def setUp(self):
+        self.relogio = base.RelogioFalso()
+        self.cache = cache.CacheLRU(tamanho_maximo=2, ttl=10, relogio=self.relogio)
+
+    def test_retorna_valor_guardado(self):
+        self.cache.define('chave', 1)
+        self.cache.obtem('chave').should.be.equal(1)
+
+    def test_retorna_padrao_se_nao_existir(self):
+        self.cache.obtem('chave', None).should.be.none
+        self.cache.obtem('chave').should.be(cache.AUSENTE)
+
+    def test_expira_depois_do_ttl(self):
+        self.cache.define('chave', 1)
+        self.relogio.agora += 10
+        self.cache.obtem('chave', None).should.be.none
+
+    def test_ttl_pode_ser_passado_por_item(self):
+        self.cache.define('chave', 1, ttl=1)
+        self.relogio.agora += 2
+        self.cache.obtem('chave', None).should.be.none
+
+    def test_descarta_o_usado_ha_mais_tempo(self):
+        self.cache.define('a', 1)
+        self.cache.define('b', 2)
+        self.cache.obtem('a')
+        self.cache.define('c', 3)
+        self.cache.obtem('b', None).should.be.none
+        self.cache.obtem('a').should.be.equal(1)
+        self.cache.obtem('c').should.be.equal(3)
+        len(self.cache).should.be.equal(2)
+
+    def test_conta_acertos_e_falhas(self):
+        self.cache.define('a', 1)
+        self.cache.obtem('a')
+        self.cache.obtem('b', None)
+        self.cache.estatisticas().should.be.equal({'acertos': 1, 'falhas': 1, 'tamanho': 1})
+
+    def test_invalida_chave(self):
+        self.cache.define('a', 1)
+        self.cache.invalida('a').should.be.true
+        self.cache.invalida('a').should.be.false
+        self.cache.obtem('a', None).should.be.none
+
+    def test_tamanho_zero_nao_guarda_nada(self):
+        self.cache = cache.CacheLRU(tamanho_maximo=0)
+        self.cache.define('a', 1)
+        len(self.cache).should.be.equal(0)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import fcntl
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from mock import patch
+
+from autenticacao_api import cache
+from autenticacao_api import cache_compartilhado
+from tests.unitarios import base
+
+
+def trava_livre_em_outro_processo(arquivo):
+    try:
+        fcntl.lockf(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        os._exit(1)
+    os._exit(0)
+
+
+def preenche_em_outro_processo(caminho, capacidade, inicio, quantidade):
+    compartilhado = cache_compartilhado.CacheCompartilhado(caminho, capacidade)
+    for indice in range(inicio, inicio + quantidade):
+        compartilhado.define('chave-{}'.format(indice), indice)
+    compartilhado.fecha()
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_cache_compartilhado(self):
+        arquivo = cache_compartilhado.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class TestCacheCompartilhadoBase(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio)
+        self.caminho = os.path.join(self.diretorio, 'whitelabel.cache')
+        self.relogio = base.RelogioFalso()
+        self.cache = self.abre()
+
+    def abre(self, capacidade=64):
+        compartilhado = cache_compartilhado.CacheCompartilhado(self.caminho, capacidade, ttl=10, relogio=self.relogio)
+        self.addCleanup(compartilhado.fecha)
+        return compartilhado
+
+
+class TestCacheCompartilhado(TestCacheCompartilhadoBase):
+    def test_retorna_valor_guardado(self):
+        self.cache.define('chave', 42)
+        self.cache.obtem('chave').should.be.equal(42)
+
+    def test_retorna_padrao_se_nao_existir(self):
+        self.cache.obtem('chave').should.be(cache.AUSENTE)
+        self.cache.obtem('chave', None).should.be.none
+
+    def test_expira_depois_do_ttl(self):
+        self.cache.define('chave', 42)
+        self.relogio.agora += 10
+        self.cache.obtem('chave', None).should.be.none
+
+    def test_substitui_valor_da_chave(self):
+        self.cache.define('chave', 1)
+        self.cache.define('chave', 2)
+        self.cache.obtem('chave').should.be.equal(2)
+        self.cache.estatisticas()['tamanho'].should.be.equal(1)
+
+    def test_invalida_chave(self):
+        self.cache.define('chave', 42)
+        self.cache.invalida('chave').should.be.true
+        self.cache.invalida('chave').should.be.false
+        self.cache.obtem('chave', None).should.be.none
+
+    def test_limpa(self):
+        self.cache.define('chave', 42)
+        self.cache.limpa()
+        self.cache.obtem('chave', None).should.be.none
+
+    def test_conta_acertos_e_falhas(self):
+        self.cache.define('chave', 42)
+        self.cache.obtem('chave')
+        self.cache.obtem('outra')
+        self.cache.estatisticas().should.be.equal({'acertos': 1, 'falhas': 1, 'tamanho': 1})
+
+    def test_tabela_cheia_substitui_o_que_expira_primeiro(self):
+        pequeno = cache_compartilhado.CacheCompartilhado(os.path.join(self.diretorio, 'pequeno'), 2, ttl=10, relogio=self.relogio)
+        self.addCleanup(pequeno.fecha)
+        pequeno.define('a', 1, ttl=5)
+        pequeno.define('b', 2, ttl=20)
+        pequeno.define('c', 3)
+        pequeno.obtem('a', None).should.be.none
+        pequeno.obtem('b').should.be.equal(2)
+        pequeno.obtem('c').should.be.equal(3)
+
+    def test_outra_instancia_no_mesmo_arquivo_ve_os_valores(self):
+        self.cache.define('chave', 42)
+        self.abre().obtem('chave').should.be.equal(42)
+
+    def test_recusa_arquivo_com_outra_capacidade(self):
+        self.abre.when.called_with(128).should.throw(ValueError)
+
+
+class TestCacheCompartilhadoEntreProcessos(TestCacheCompartilhadoBase):
+    def test_valores_gravados_por_outros_processos_sao_vistos(self):
+        processos = [
+            multiprocessing.Process(target=preenche_em_outro_processo, args=(self.caminho, 64, inicio, 10))
+            for inicio in (0, 10, 20, 30)
+        ]
+        for processo in processos:
+            processo.start()
+        for processo in processos:
+            processo.join()
+            processo.exitcode.should.be.equal(0)
+        self.relogio.agora = 0
+        for indice in range(40):
+            self.cache.obtem('chave-{}'.format(indice)).should.be.equal(indice)
+
+    def test_trava_de_escrita_nao_e_compartilhada_com_processos_filhos(self):
+        with self.cache._trava_escrita():
+            pid = os.fork()
+            if pid == 0:
+                trava_livre_em_outro_processo(self.cache._arquivo)
+            _, status = os.waitpid(pid, 0)
+        os.WEXITSTATUS(status).should.be.equal(1)
+
+
+class TestImportacao(unittest.TestCase):
+    def test_importa_sem_fcntl(self):
+        with patch.dict(sys.modules, {'fcntl': None}):
+            del sys.modules['autenticacao_api.cache_compartilhado']
+            __import__('autenticacao_api.cache_compartilhado')
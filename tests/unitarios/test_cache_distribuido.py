@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+import fnmatch
+import hashlib
+import re
+import unittest
+
+from autenticacao_api import cache
+from autenticacao_api import cache_distribuido
+from tests.unitarios import base
+
+
+class PipelineFalso(object):
+    def __init__(self, redis):
+        self.redis = redis
+        self.comandos = []
+
+    def set(self, chave, valor, px=None):
+        self.comandos.append((chave, valor, px))
+
+    def execute(self):
+        self.redis.execucoes += 1
+        for chave, valor, px in self.comandos:
+            self.redis.set(chave, valor, px=px)
+
+
+class RedisFalso(object):
+    """
+    Servidor Redis em processo com os comandos usados pelo BackendRedis. Guarda e retorna bytes, como o redis-py
+    """
+
+    def __init__(self, relogio):
+        self.relogio = relogio
+        self.dados = {}
+        self.comandos = []
+        self.execucoes = 0
+        self.fora_do_ar = False
+
+    def _registra(self, comando):
+        if self.fora_do_ar:
+            raise IOError('Connection refused')
+        self.comandos.append(comando)
+
+    def _valor(self, chave):
+        valor, expira_em = self.dados.get(chave, (None, None))
+        if expira_em is not None and expira_em <= self.relogio():
+            del self.dados[chave]
+            return None
+        return valor
+
+    def mget(self, chaves):
+        self._registra('MGET')
+        return [self._valor(chave) for chave in chaves]
+
+    def set(self, chave, valor, px=None):
+        self.dados[chave] = (valor.encode('utf-8'), self.relogio() + px / 1000.0 if px else None)
+
+    def pipeline(self, transaction=True):
+        self._registra('PIPELINE')
+        return PipelineFalso(self)
+
+    def delete(self, *chaves):
+        self._registra('DEL')
+        for chave in chaves:
+            self.dados.pop(chave, None)
+
+    def scan_iter(self, match=None, count=None):
+        self._registra('SCAN')
+        # O fnmatch não entende o escape com a barra invertida do Redis: \* vira [*]
+        padrao = re.sub(r'\\(.)', r'[\1]', match)
+        return [chave for chave in list(self.dados) if fnmatch.fnmatchcase(chave, padrao)]
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_cache_distribuido(self):
+        arquivo = cache_distribuido.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class TestTextoChave(unittest.TestCase):
+    def test_converte_tuplas_e_bytes(self):
+        cache_distribuido.texto_chave(('requerido', b'\x01\xff')).should.be.equal('requerido:01ff')
+        cache_distribuido.texto_chave(u'chave-wl').should.be.equal(u'chave-wl')
+        cache_distribuido.texto_chave(42).should.be.equal(u'42')
+
+
+class ContratoCacheDistribuido(object):
+    def cria_backend(self):
+        raise NotImplementedError()
+
+    def setUp(self):
+        self.relogio = base.RelogioFalso()
+        self.backend = self.cria_backend()
+        self.cache = cache_distribuido.CacheDistribuido(self.backend, 'api:loja:whitelabel', ttl=10)
+
+    def test_guarda_e_retorna_valores_json(self):
+        self.cache.define('chave-wl', 42)
+        self.cache.define('outra', {'loja_id': 1})
+        self.cache.obtem('chave-wl').should.be.equal(42)
+        self.cache.obtem('outra').should.be.equal({'loja_id': 1})
+
+    def test_retorna_padrao_para_chave_ausente(self):
+        self.cache.obtem('nao-existe').should.be(cache.AUSENTE)
+        self.cache.obtem('nao-existe', None).should.be.none
+
+    def test_expira_pelo_ttl(self):
+        self.cache.define('chave-wl', 42)
+        self.cache.define('curta', 1, ttl=2)
+        self.relogio.agora += 5
+        self.cache.obtem('curta').should.be(cache.AUSENTE)
+        self.cache.obtem('chave-wl').should.be.equal(42)
+        self.relogio.agora += 10
+        self.cache.obtem('chave-wl').should.be(cache.AUSENTE)
+
+    def test_obtem_varios_retorna_so_as_encontradas(self):
+        self.cache.define_varios([('chave-1', 1), ('chave-2', 2)])
+        self.cache.obtem_varios(['chave-1', 'chave-2', 'chave-3']).should.be.equal({'chave-1': 1, 'chave-2': 2})
+        self.cache.estatisticas().should.be.equal({'acertos': 2, 'falhas': 1, 'erros': 0})
+
+    def test_namespaces_diferentes_nao_se_misturam(self):
+        outra_api = cache_distribuido.CacheDistribuido(self.backend, 'api:pedido:whitelabel')
+        self.cache.define('chave-wl', 42)
+        outra_api.obtem('chave-wl').should.be(cache.AUSENTE)
+
+    def test_invalida(self):
+        self.cache.define('chave-wl', 42)
+        self.cache.invalida('chave-wl').should.be.true
+        self.cache.invalida('chave-wl').should.be.false
+        self.cache.obtem('chave-wl').should.be(cache.AUSENTE)
+
+    def test_limpa_so_o_namespace(self):
+        outro = cache_distribuido.CacheDistribuido(self.backend, 'api:loja:whitelabel_negativo')
+        self.cache.define('chave-wl', 42)
+        outro.define('chave-wl', True)
+        self.cache.limpa()
+        self.cache.obtem('chave-wl').should.be(cache.AUSENTE)
+        outro.obtem('chave-wl').should.be.true
+
+    def test_ttl_zero_nao_guarda(self):
+        self.cache.define('chave-wl', 42, ttl=0)
+        self.cache.obtem('chave-wl').should.be(cache.AUSENTE)
+
+
+class TestCacheDistribuidoEmMemoria(ContratoCacheDistribuido, unittest.TestCase):
+    def cria_backend(self):
+        return cache_distribuido.BackendMemoria(relogio=self.relogio)
+
+
+class TestCacheDistribuidoRedis(ContratoCacheDistribuido, unittest.TestCase):
+    def cria_backend(self):
+        self.redis = RedisFalso(self.relogio)
+        return cache_distribuido.BackendRedis(self.redis)
+
+    def test_obtem_varios_usa_um_mget(self):
+        self.cache.define_varios([('chave-{}'.format(indice), indice) for indice in range(50)])
+        self.redis.execucoes.should.be.equal(1)
+        del self.redis.comandos[:]
+        len(self.cache.obtem_varios(['chave-{}'.format(indice) for indice in range(100)])).should.be.equal(50)
+        self.redis.comandos.should.be.equal(['MGET'])
+
+    def test_guarda_com_ttl_em_milissegundos(self):
+        self.cache.define('chave-wl', 42, ttl=1.5)
+        self.relogio.agora += 1.4
+        self.cache.obtem('chave-wl').should.be.equal(42)
+        self.relogio.agora += 0.2
+        self.cache.obtem('chave-wl').should.be(cache.AUSENTE)
+
+    def test_chaves_tem_o_namespace_e_o_hash(self):
+        self.cache.define(('requerido', b'\x01'), 'loja')
+        self.cache.define('chave-wl', 42)
+        sorted(self.redis.dados).should.be.equal(sorted([
+            'api:loja:whitelabel:' + hashlib.sha256(b'requerido:01').hexdigest(),
+            'api:loja:whitelabel:' + hashlib.sha256(b'chave-wl').hexdigest(),
+        ]))
+
+    def test_limpa_escapa_o_namespace(self):
+        curinga = cache_distribuido.CacheDistribuido(self.backend, 'api:l*[a-z]?')
+        outro = cache_distribuido.CacheDistribuido(self.backend, 'api:loja')
+        curinga.define('chave-wl', 1)
+        outro.define('chave-wl', 2)
+        curinga.limpa()
+        curinga.obtem('chave-wl').should.be(cache.AUSENTE)
+        outro.obtem('chave-wl').should.be.equal(2)
+
+    def test_erro_no_backend_e_falha_de_cache(self):
+        self.cache.define('chave-wl', 42)
+        self.redis.fora_do_ar = True
+        self.cache.obtem('chave-wl', None).should.be.none
+        self.cache.define('outra', 1)
+        self.cache.invalida('chave-wl').should.be.false
+        self.cache.limpa()
+        self.cache.estatisticas().should.be.equal({'acertos': 0, 'falhas': 1, 'erros': 4})
+
+
+class TestCacheDuasCamadas(unittest.TestCase):
+    def setUp(self):
+        self.relogio = base.RelogioFalso()
+        self.compartilhado = cache_distribuido.CacheDistribuido(
+            cache_distribuido.BackendMemoria(relogio=self.relogio), 'api:loja:whitelabel', ttl=300)
+        self.local = cache.CacheLRU(100, ttl=5, relogio=self.relogio)
+        self.cache = cache_distribuido.CacheDuasCamadas(self.local, self.compartilhado)
+
+    def test_acerto_no_compartilhado_preenche_o_local(self):
+        self.compartilhado.define('chave-wl', 42)
+        self.cache.obtem('chave-wl').should.be.equal(42)
+        self.local.obtem('chave-wl').should.be.equal(42)
+        self.cache.obtem('chave-wl').should.be.equal(42)
+        self.compartilhado.estatisticas()['acertos'].should.be.equal(1)
+
+    def test_local_expira_antes_do_compartilhado(self):
+        self.cache.define('chave-wl', 42)
+        self.relogio.agora += 10
+        self.local.obtem('chave-wl').should.be(cache.AUSENTE)
+        self.cache.obtem('chave-wl').should.be.equal(42)
+
+    def test_obtem_varios_so_busca_no_compartilhado_o_que_falta(self):
+        self.cache.define('chave-1', 1)
+        self.compartilhado.define('chave-2', 2)
+        self.cache.obtem_varios(['chave-1', 'chave-2', 'chave-3']).should.be.equal({'chave-1': 1, 'chave-2': 2})
+        self.compartilhado.estatisticas()['acertos'].should.be.equal(1)
+        self.compartilhado.estatisticas()['falhas'].should.be.equal(1)
+        self.local.obtem('chave-2').should.be.equal(2)
+
+    def test_invalida_nas_duas_camadas(self):
+        self.cache.define('chave-wl', 42)
+        self.cache.invalida('chave-wl').should.be.true
+        self.cache.obtem('chave-wl').should.be(cache.AUSENTE)
+
+    def test_estatisticas_das_duas_camadas(self):
+        self.cache.define('chave-wl', 42)
+        self.cache.obtem('chave-wl')
+        self.cache.obtem('nao-existe')
+        estatisticas = self.cache.estatisticas()
+        estatisticas['acertos'].should.be.equal(1)
+        estatisticas['falhas'].should.be.equal(1)
+        estatisticas['l1']['falhas'].should.be.equal(1)
+        estatisticas['l2']['falhas'].should.be.equal(1)
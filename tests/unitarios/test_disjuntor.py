@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from autenticacao_api import disjuntor
+from tests.unitarios import base
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_disjuntor(self):
+        arquivo = disjuntor.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class TestDisjuntor(unittest.TestCase):
+    def setUp(self):
+        self.relogio = base.RelogioFalso()
+        self.mudancas = []
+        self.disjuntor = disjuntor.Disjuntor(
+            falhas_maximas=2, tempo_espera=10, relogio=self.relogio,
+            ao_mudar=lambda anterior, estado: self.mudancas.append((anterior, estado)))
+
+    def abre(self):
+        self.disjuntor.falha()
+        self.disjuntor.falha()
+
+    def test_comeca_fechado(self):
+        self.disjuntor.estado.should.be.equal(disjuntor.FECHADO)
+        self.disjuntor.permite().should.be.true
+
+    def test_abre_depois_de_falhas_seguidas(self):
+        self.disjuntor.falha()
+        self.disjuntor.estado.should.be.equal(disjuntor.FECHADO)
+        self.disjuntor.falha()
+        self.disjuntor.estado.should.be.equal(disjuntor.ABERTO)
+        self.disjuntor.permite().should.be.false
+        self.disjuntor.rejeitadas.should.be.equal(1)
+
+    def test_sucesso_zera_as_falhas_seguidas(self):
+        self.disjuntor.falha()
+        self.disjuntor.sucesso()
+        self.disjuntor.falha()
+        self.disjuntor.estado.should.be.equal(disjuntor.FECHADO)
+
+    def test_permite_uma_consulta_de_teste_depois_da_espera(self):
+        self.abre()
+        self.relogio.agora += 10
+        self.disjuntor.permite().should.be.true
+        self.disjuntor.estado.should.be.equal(disjuntor.MEIO_ABERTO)
+        self.disjuntor.permite().should.be.false
+
+    def test_fecha_se_o_teste_der_certo(self):
+        self.abre()
+        self.relogio.agora += 10
+        self.disjuntor.permite()
+        self.disjuntor.sucesso()
+        self.disjuntor.estado.should.be.equal(disjuntor.FECHADO)
+        self.mudancas.should.be.equal([('fechado', 'aberto'), ('aberto', 'meio_aberto'), ('meio_aberto', 'fechado')])
+
+    def test_abre_de_novo_se_o_teste_falhar(self):
+        self.abre()
+        self.relogio.agora += 10
+        self.disjuntor.permite()
+        self.disjuntor.falha()
+        self.disjuntor.estado.should.be.equal(disjuntor.ABERTO)
+        self.disjuntor.permite().should.be.false
+        self.disjuntor.estatisticas()['transicoes'].should.be.equal({'fechado_aberto': 1, 'aberto_meio_aberto': 1, 'meio_aberto_aberto': 1})
+
+    def test_consulta_de_teste_travada_abre_de_novo(self):
+        self.abre()
+        self.relogio.agora += 10
+        permissao = self.disjuntor.permite()
+        self.relogio.agora += 9
+        self.disjuntor.permite().should.be.false
+        self.relogio.agora += 1
+        self.disjuntor.permite().should.be.false
+        self.disjuntor.estado.should.be.equal(disjuntor.ABERTO)
+        self.disjuntor.sucesso(permissao)
+        self.disjuntor.estado.should.be.equal(disjuntor.ABERTO)
+        self.relogio.agora += 10
+        self.disjuntor.permite().should.be.true
+        self.disjuntor.estado.should.be.equal(disjuntor.MEIO_ABERTO)
+
+    def test_tempo_teste_menor_que_a_espera(self):
+        self.disjuntor.tempo_teste = 2
+        self.abre()
+        self.relogio.agora += 10
+        self.disjuntor.permite()
+        self.relogio.agora += 2
+        self.disjuntor.permite().should.be.false
+        self.disjuntor.estado.should.be.equal(disjuntor.ABERTO)
+
+    def test_ignora_resultado_de_consulta_permitida_antes_de_abrir(self):
+        permissao = self.disjuntor.permite()
+        self.abre()
+        self.disjuntor.sucesso(permissao)
+        self.disjuntor.estado.should.be.equal(disjuntor.ABERTO)
+        self.relogio.agora += 10
+        teste = self.disjuntor.permite()
+        self.disjuntor.falha(permissao)
+        self.disjuntor.estado.should.be.equal(disjuntor.MEIO_ABERTO)
+        self.disjuntor.sucesso(teste)
+        self.disjuntor.estado.should.be.equal(disjuntor.FECHADO)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from autenticacao_api import filtro_bloom
+from tests.unitarios import base
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_filtro_bloom(self):
+        arquivo = filtro_bloom.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class TestFiltroBloom(unittest.TestCase):
+    def setUp(self):
+        self.chaves = ['chave-{}'.format(indice) for indice in range(1000)]
+        self.filtro = filtro_bloom.FiltroBloom.com_chaves(self.chaves, 0.01)
+
+    def test_reconhece_todas_as_chaves_adicionadas(self):
+        for chave in self.chaves:
+            (chave in self.filtro).should.be.true
+
+    def test_rejeita_a_maior_parte_das_chaves_desconhecidas(self):
+        aceitas = sum(1 for indice in range(10000) if 'outra-{}'.format(indice) in self.filtro)
+        aceitas.should.be.lower_than(300)
+
+    def test_estima_taxa_de_falso_positivo_proxima_da_configurada(self):
+        self.filtro.taxa_falso_positivo().should.be.lower_than(0.02)
+
+    def test_conta_chaves_adicionadas(self):
+        self.filtro.quantidade.should.be.equal(1000)
+        self.filtro.adiciona(u'chave-com-acentuação')
+        self.filtro.quantidade.should.be.equal(1001)
+        (u'chave-com-acentuação' in self.filtro).should.be.true
+
+    def test_filtro_vazio_nao_aceita_nada(self):
+        filtro = filtro_bloom.FiltroBloom.com_chaves([])
+        ('chave' in filtro).should.be.false
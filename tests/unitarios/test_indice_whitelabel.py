@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from autenticacao_api import indice_whitelabel
+from tests.unitarios import base
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_indice_whitelabel(self):
+        arquivo = indice_whitelabel.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class TestIndiceWhitelabel(unittest.TestCase):
+    def setUp(self):
+        self.indice = indice_whitelabel.IndiceWhitelabel(('chave-{}'.format(indice), indice + 1) for indice in range(1000))
+
+    def test_encontra_contrato_da_chave(self):
+        len(self.indice).should.be.equal(1000)
+        self.indice.obtem('chave-0').should.be.equal(1)
+        self.indice.obtem('chave-999').should.be.equal(1000)
+
+    def test_retorna_none_para_chave_desconhecida(self):
+        self.indice.obtem('chave-1000').should.be.none
+        self.indice.obtem(u'chavé').should.be.none
+
+    def test_aplica_alteracoes(self):
+        self.indice.aplica({1: None, 2: 'chave-1', 2000: 'nova'})
+        self.indice.obtem('chave-0').should.be.none
+        self.indice.obtem('chave-1').should.be.equal(2)
+        self.indice.obtem('nova').should.be.equal(2000)
+        len(self.indice).should.be.equal(1000)
+
+    def test_aplica_remove_a_chave_antiga_do_contrato(self):
+        self.indice.aplica({5: 'chave-trocada'})
+        self.indice.obtem('chave-4').should.be.none
+        self.indice.obtem('chave-trocada').should.be.equal(5)
+        len(self.indice).should.be.equal(1000)
+
+    def test_substitui_conteudo(self):
+        self.indice.substitui(iter([('outra', 7)]))
+        len(self.indice).should.be.equal(1)
+        self.indice.obtem('outra').should.be.equal(7)
+        self.indice.obtem('chave-0').should.be.none
+
+    def test_memoria_compacta(self):
+        self.indice.memoria().should.be.lower_than(30 * 1000)
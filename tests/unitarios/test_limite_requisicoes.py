@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from autenticacao_api import limite_requisicoes
+from tests.unitarios import base
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_limite_requisicoes(self):
+        arquivo = limite_requisicoes.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class TestLimiteRequisicoes(unittest.TestCase):
+    def setUp(self):
+        self.relogio = base.RelogioFalso()
+        self.limite = limite_requisicoes.LimiteRequisicoes(taxa=2, rajada=3, capacidade=2, relogio=self.relogio)
+
+    def test_aceita_a_rajada_e_rejeita_depois(self):
+        [self.limite.permite('a') for _ in range(3)].should.be.equal([True, True, True])
+        self.limite.permite('a').should.be.false
+        self.limite.rejeitadas.should.be.equal(1)
+
+    def test_repoe_fichas_na_taxa(self):
+        for _ in range(3):
+            self.limite.permite('a')
+        self.relogio.agora += 0.5
+        self.limite.permite('a').should.be.true
+        self.limite.permite('a').should.be.false
+
+    def test_nao_acumula_mais_que_a_rajada(self):
+        self.limite.permite('a')
+        self.relogio.agora += 100
+        [self.limite.permite('a') for _ in range(4)].should.be.equal([True, True, True, False])
+
+    def test_taxa_menor_que_uma_por_segundo(self):
+        limite = limite_requisicoes.LimiteRequisicoes(taxa=0.5, relogio=self.relogio)
+        limite.rajada.should.be.equal(1.0)
+        [limite.permite('a') for _ in range(2)].should.be.equal([True, False])
+        self.relogio.agora += 2
+        limite.permite('a').should.be.true
+
+    def test_rajada_menor_que_um_e_invalida(self):
+        (lambda: limite_requisicoes.LimiteRequisicoes(taxa=0.5, rajada=0.5)).should.throw(ValueError)
+
+    def test_clientes_tem_baldes_separados(self):
+        for _ in range(3):
+            self.limite.permite('a')
+        self.limite.permite('a').should.be.false
+        self.limite.permite('b').should.be.true
+
+    def test_descarta_o_cliente_parado_ha_mais_tempo(self):
+        for _ in range(3):
+            self.limite.permite('a')
+        self.limite.permite('b')
+        self.limite.permite('a').should.be.false
+        self.limite.permite('c').should.be.true
+        len(self.limite).should.be.equal(2)
+        self.limite.estatisticas().should.be.equal({'clientes': 2, 'rejeitadas': 1, 'descartados': 1})
+        self.limite.permite('a').should.be.false
+        self.limite.permite('b').should.be.true
+
+    def test_memoria_limitada_pela_capacidade(self):
+        limite = limite_requisicoes.LimiteRequisicoes(taxa=1, capacidade=100, relogio=self.relogio)
+        for cliente in range(10000):
+            limite.permite(cliente)
+        len(limite).should.be.equal(100)
+        len(limite._fichas).should.be.equal(100)
+        limite.descartados.should.be.equal(9900)
+
+    def test_taxa_deve_ser_positiva(self):
+        limite_requisicoes.LimiteRequisicoes.when.called_with(0).should.throw(ValueError)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from autenticacao_api import metricas
+from tests.unitarios import base
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_metricas(self):
+        arquivo = metricas.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class TestHistograma(unittest.TestCase):
+    def test_registra_na_faixa_certa(self):
+        histograma = metricas.Histograma((0.1, 1.0))
+        histograma.registra(0.05)
+        histograma.registra(0.1)
+        histograma.registra(0.5)
+        histograma.registra(5)
+        histograma.contagens.should.be.equal([2, 1, 1])
+        histograma.total.should.be.equal(4)
+
+    def test_acumulado_termina_na_faixa_infinita(self):
+        histograma = metricas.Histograma((0.1, 1.0))
+        histograma.registra(0.05)
+        histograma.registra(0.5)
+        histograma.acumulado().should.be.equal([(0.1, 1), (1.0, 2), (float('inf'), 2)])
+
+
+class TestMetricas(unittest.TestCase):
+    def setUp(self):
+        self.metricas = metricas.Metricas(faixas=(0.5, 2.0), relogio=base.RelogioFalso(0.0, passo=1.0))
+
+    def test_cronometra_registra_o_tempo_da_chamada(self):
+        soma = self.metricas.cronometra('soma', lambda a, b: a + b)
+        soma(1, 2).should.be.equal(3)
+        histograma = self.metricas.histograma('soma')
+        histograma.total.should.be.equal(1)
+        histograma.soma.should.be.equal(1.0)
+
+    def test_cronometra_registra_mesmo_com_excecao(self):
+        def falha():
+            raise ValueError()
+        falha = self.metricas.cronometra('falha', falha)
+        falha.when.called_with().should.throw(ValueError)
+        self.metricas.histograma('falha').total.should.be.equal(1)
+
+    def test_conta_excecoes_e_propaga(self):
+        def falha():
+            raise ValueError()
+        falha = self.metricas.conta_excecoes('erros', falha)
+        falha.when.called_with().should.throw(ValueError)
+        self.metricas.contadores.should.be.equal({'erros': 1})
+
+    def test_conta_resultados(self):
+        autentica = self.metricas.conta_resultados(lambda status: (status, None))
+        autentica(200)
+        autentica(401)
+        autentica(401)
+        self.metricas.contadores.should.be.equal({'resultado.ok': 1, 'resultado.401': 2})
+
+    def test_instantaneo_calcula_razao_de_acertos(self):
+        self.metricas.adiciona_fonte('cache', lambda: {'acertos': 3, 'falhas': 1})
+        self.metricas.adiciona_fonte('desligado', lambda: None)
+        self.metricas.instantaneo()['caches'].should.be.equal({'cache': {'acertos': 3, 'falhas': 1, 'razao_acertos': 0.75}})
+
+    def test_publica_nas_saidas(self):
+        saida = metricas.SaidaMemoria()
+        self.metricas.saidas.append(saida)
+        self.metricas.conta('a')
+        self.metricas.publica()
+        saida.ultimo['contadores'].should.be.equal({'a': 1})
+
+
+class TestSaidaStatsD(unittest.TestCase):
+    def setUp(self):
+        self.enviadas = []
+        self.saida = metricas.SaidaStatsD(prefixo='api', envia=self.enviadas.append)
+        self.metricas = metricas.Metricas(faixas=(0.5,), saidas=[self.saida], relogio=base.RelogioFalso(0.0, passo=0.002))
+
+    def test_envia_diferencas_desde_a_ultima_publicacao(self):
+        self.metricas.conta('resultado.ok', 3)
+        self.metricas.publica()
+        self.metricas.conta('resultado.ok', 2)
+        self.metricas.publica()
+        self.enviadas.should.be.equal([['api.resultado.ok:3|c'], ['api.resultado.ok:2|c']])
+
+    def test_envia_media_do_estagio_em_milissegundos(self):
+        self.metricas.cronometra('extrai_chaves', lambda: None)()
+        self.metricas.publica()
+        self.enviadas.should.be.equal([['api.estagio.extrai_chaves.chamadas:1|c', 'api.estagio.extrai_chaves:2.0000|ms']])
+
+    def test_nao_envia_nada_sem_mudancas(self):
+        self.metricas.publica()
+        self.enviadas.should.be.empty
+
+
+class TestSaidaPrometheus(unittest.TestCase):
+    def test_formata_histograma_contadores_e_caches(self):
+        saida = metricas.SaidaPrometheus(prefixo='api')
+        registro = metricas.Metricas(faixas=(0.5,), saidas=[saida], relogio=base.RelogioFalso(0.0, passo=1.0))
+        registro.cronometra('extrai_chaves', lambda: None)()
+        registro.conta('resultado.ok')
+        registro.adiciona_fonte('cache_whitelabel', lambda: {'acertos': 1, 'falhas': 1})
+        registro.publica()
+        saida.texto.should.be.equal(
+            '# TYPE api_estagio_segundos histogram\n'
+            'api_estagio_segundos_bucket{estagio="extrai_chaves",le="0.5"} 0\n'
+            'api_estagio_segundos_bucket{estagio="extrai_chaves",le="+Inf"} 1\n'
+            'api_estagio_segundos_sum{estagio="extrai_chaves"} 1.0\n'
+            'api_estagio_segundos_count{estagio="extrai_chaves"} 1\n'
+            '# TYPE api_eventos_total counter\n'
+            'api_eventos_total{evento="resultado.ok"} 1\n'
+            '# TYPE api_cache_razao_acertos gauge\n'
+            'api_cache_razao_acertos{cache="cache_whitelabel"} 0.5\n'
+        )
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from mock import patch
+
+from autenticacao_api import autenticador
+from autenticacao_api import metricas
+from autenticacao_api import middleware
+from tests.unitarios import base
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_middleware(self):
+        arquivo = middleware.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class AppFalso(object):
+    def __init__(self):
+        self.environ = None
+
+    def __call__(self, environ, start_response):
+        self.environ = environ
+        start_response('200 OK', [])
+        return [b'ok']
+
+
+class StartResponse(object):
+    def __init__(self):
+        self.status = None
+        self.cabecalhos = None
+
+    def __call__(self, status, cabecalhos):
+        self.status = status
+        self.cabecalhos = cabecalhos
+
+
+class TestMiddlewareAutenticacao(unittest.TestCase):
+    def setUp(self):
+        self.autenticacao = autenticador.Autenticacao()
+        self.autenticacao.define_valor('chave_api', 'a-chave-api-eh-essa')
+        self.app = AppFalso()
+        self.start_response = StartResponse()
+
+    def chama(self, app, caminho='/recurso', authorization=None):
+        environ = {'PATH_INFO': caminho}
+        if authorization is not None:
+            environ['HTTP_AUTHORIZATION'] = authorization
+        return app(environ, self.start_response)
+
+    def test_repassa_requisicao_autenticada(self):
+        app = self.autenticacao.como_middleware(self.app)
+        self.chama(app, authorization='chave_api a-chave-api-eh-essa').should.be.equal([b'ok'])
+        self.app.environ[middleware.CHAVE_IDENTIDADE].should.be.none
+
+    def test_retorna_400_sem_entrar_no_app(self):
+        app = self.autenticacao.como_middleware(self.app)
+        corpo = self.chama(app)
+        self.start_response.status.should.be.equal('400 BAD REQUEST')
+        corpo.should.be.equal([self.autenticacao.erros_http().conteudo_400(['chave_api']).encode('utf-8')])
+        dict(self.start_response.cabecalhos).should.be.equal({
+            'Content-Type': 'text/json; charset=utf-8',
+            'Content-Length': str(len(corpo[0]))
+        })
+        self.app.environ.should.be.none
+
+    def test_retorna_401_sem_entrar_no_app(self):
+        app = self.autenticacao.como_middleware(self.app)
+        corpo = self.chama(app, authorization='chave_api outra')
+        self.start_response.status.should.be.equal('401 UNAUTHORIZED')
+        corpo.should.be.equal([self.autenticacao.erros_http().conteudo_401().encode('utf-8')])
+        self.app.environ.should.be.none
+
+    def test_reaproveita_a_resposta_de_erro(self):
+        app = self.autenticacao.como_middleware(self.app)
+        corpo = self.chama(app)
+        self.chama(app)[0].should.be(corpo[0])
+
+    def test_rota_fora_da_lista_nao_exige_autenticacao(self):
+        app = self.autenticacao.como_middleware(self.app, rotas=['/api/'])
+        self.chama(app, caminho='/saude').should.be.equal([b'ok'])
+        self.chama(app, caminho='/api/recurso')
+        self.start_response.status.should.be.equal('400 BAD REQUEST')
+
+    def test_usa_a_regra_do_prefixo_mais_longo(self):
+        app = self.autenticacao.como_middleware(self.app, rotas={'/api/': 'requerido', '/api/whitelabel/': 'token'})
+        app.regra('/api/whitelabel/pedidos').prefixo.should.be.equal('/api/whitelabel/')
+        app.regra('/api/pedidos').prefixo.should.be.equal('/api/')
+        app.regra('/outra').should.be.none
+
+    def test_prefixo_vale_por_segmentos_do_caminho(self):
+        app = self.autenticacao.como_middleware(self.app, rotas={'/api': 'requerido', '/admin/': 'token'})
+        app.regra('/api').prefixo.should.be.equal('/api')
+        app.regra('/api/pedidos').prefixo.should.be.equal('/api')
+        app.regra('/apiv2/pedidos').should.be.none
+        app.regra('/admin').prefixo.should.be.equal('/admin/')
+        app.regra('/administrador').should.be.none
+
+    def test_sem_rotas_todos_os_caminhos_exigem_autenticacao(self):
+        app = self.autenticacao.como_middleware(self.app)
+        app.regra('/qualquer/caminho').tipo.should.be.equal('requerido')
+        app.regra('').tipo.should.be.equal('requerido')
+
+    def test_passa_contrato_do_token_no_environ(self):
+        self.autenticacao.define_segredo('s1', 'segredo')
+        token = self.autenticacao.gera_token_whitelabel(42)
+        app = self.autenticacao.como_middleware(self.app, rotas={'/whitelabel/': 'token'})
+        self.chama(app, caminho='/whitelabel/x', authorization='token_whitelabel {}'.format(token))
+        self.app.environ[middleware.CHAVE_CONTRATO_ID].should.be.equal(42)
+
+    @patch("autenticacao_api.autenticador.Contrato")
+    def test_passa_contrato_do_whitelabel_no_environ(self, contrato_mock):
+        contrato_mock.objects.only.return_value.get.return_value.id = 7
+        app = self.autenticacao.como_middleware(self.app, rotas={'/whitelabel/': 'whitelabel'})
+        self.chama(app, caminho='/whitelabel/x', authorization='chave_whitelabel chave-wl')
+        self.app.environ[middleware.CHAVE_CONTRATO_ID].should.be.equal(7)
+
+    def test_tipo_desconhecido(self):
+        self.autenticacao.como_middleware.when.called_with(self.app, {'/': 'outro'}).should.throw(ValueError)
+
+    def test_usa_metricas_ligadas_depois_de_criado(self):
+        app = self.autenticacao.como_middleware(self.app)
+        registro = metricas.Metricas()
+        self.autenticacao.define_metricas(registro)
+        self.chama(app, authorization='chave_api a-chave-api-eh-essa')
+        registro.contadores.should.be.equal({'resultado.ok': 1})
+
+    def test_retorna_429_acima_do_limite(self):
+        self.autenticacao.define_limite_requisicoes(taxa=1, rajada=1)
+        app = self.autenticacao.como_middleware(self.app)
+        self.chama(app, authorization='chave_api a-chave-api-eh-essa').should.be.equal([b'ok'])
+        corpo = self.chama(app, authorization='chave_api a-chave-api-eh-essa')
+        self.start_response.status.should.be.equal('429 TOO MANY REQUESTS')
+        corpo.should.be.equal([self.autenticacao.erros_http().conteudo_429().encode('utf-8')])
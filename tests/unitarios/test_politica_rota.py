@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from autenticacao_api import politica_rota
+from tests.unitarios import base
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_politica_rota(self):
+        arquivo = politica_rota.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class TestPoliticaRota(unittest.TestCase):
+    def setUp(self):
+        self.valores = {'chave_api': 'api-1', 'chave_loja': 'loja-1', 'chave_usuario': 'usuario-1'}
+        self.aceitos = {'chave_api': ('api-2',)}
+        self.politica = politica_rota.PoliticaRota(['chave_api', 'chave_loja'])
+        self.politica.compila(self.valores, self.aceitos)
+
+    def test_nomes_das_chaves_da_politica(self):
+        self.politica.chaves.should.be.equal(('chave_api', 'chave_loja'))
+        self.politica.nomes.should.be.equal(frozenset(['chave_api', 'chave_loja']))
+
+    def test_valida_valores_aceitos(self):
+        self.politica.valida({'chave_api': 'api-1', 'chave_loja': 'loja-1'}).should.be.true
+        self.politica.valida({'chave_api': 'api-2', 'chave_loja': 'loja-1'}).should.be.true
+        self.politica.valida({'chave_api': 'api-3', 'chave_loja': 'loja-1'}).should.be.false
+
+    def test_sem_rotacao_aceita_so_o_valor_definido(self):
+        politica = politica_rota.PoliticaRota(['chave_api'], aceita_rotacao=False)
+        politica.compila(self.valores, self.aceitos)
+        politica.valida({'chave_api': 'api-1'}).should.be.true
+        politica.valida({'chave_api': 'api-2'}).should.be.false
+
+    def test_chave_sem_valor_definido_nunca_e_valida(self):
+        politica = politica_rota.PoliticaRota(['chave_pedido'])
+        politica.compila(self.valores, self.aceitos)
+        politica.valida({'chave_pedido': 'qualquer'}).should.be.false
+
+    def test_sem_chaves_segue_todas_as_chaves_definidas(self):
+        politica = politica_rota.PoliticaRota()
+        politica.compila({'chave_api': 'api-1'}, {})
+        politica.chaves.should.be.equal(('chave_api',))
+        politica.compila(self.valores, {})
+        sorted(politica.chaves).should.be.equal(['chave_api', 'chave_loja', 'chave_usuario'])
+
+    def test_sem_chaves_segue_as_chaves_do_repositorio(self):
+        politica = politica_rota.PoliticaRota()
+        politica.compila({}, {}, ('chave_loja', 'chave_usuario'))
+        politica.chaves.should.be.equal(('chave_loja', 'chave_usuario'))
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from mock import MagicMock
+
+from autenticacao_api import repositorio_chaves
+from tests.unitarios import base
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_repositorio_chaves(self):
+        arquivo = repositorio_chaves.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class TestDigestCredencial(unittest.TestCase):
+    def test_mesmos_valores_geram_mesmo_digest(self):
+        nomes = ('chave_api', 'chave_loja')
+        digest = repositorio_chaves.digest_credencial(nomes, {'chave_api': 'a', 'chave_loja': 'b'})
+        digest.should.be.equal(repositorio_chaves.digest_credencial(nomes, {'chave_loja': 'b', 'chave_api': 'a'}))
+        digest.should.have.length_of(64)
+
+    def test_valores_diferentes_geram_digest_diferente(self):
+        nomes = ('chave_api', 'chave_loja')
+        digest = repositorio_chaves.digest_credencial(nomes, {'chave_api': 'ab', 'chave_loja': 'c'})
+        digest.shouldnt.be.equal(repositorio_chaves.digest_credencial(nomes, {'chave_api': 'a', 'chave_loja': 'bc'}))
+
+    def test_retorna_none_se_faltar_chave(self):
+        repositorio_chaves.digest_credencial(('chave_api', 'chave_loja'), {'chave_api': 'a'}).should.be.none
+
+
+class TestRepositorioChavesMemoria(unittest.TestCase):
+    def setUp(self):
+        self.repositorio = repositorio_chaves.RepositorioChavesMemoria(['chave_loja', 'chave_api'])
+        self.repositorio.adiciona({'chave_api': 'api', 'chave_loja': 'loja-1'}, {'loja_id': 1})
+
+    def test_ordena_os_nomes(self):
+        self.repositorio.nomes.should.be.equal(('chave_api', 'chave_loja'))
+
+    def test_busca_identidade_da_credencial(self):
+        self.repositorio.busca({'chave_api': 'api', 'chave_loja': 'loja-1'}).should.be.equal({'loja_id': 1})
+
+    def test_busca_credencial_inexistente(self):
+        self.repositorio.busca({'chave_api': 'api', 'chave_loja': 'loja-2'}).should.be.none
+
+    def test_busca_com_chave_faltando(self):
+        self.repositorio.busca({'chave_api': 'api'}).should.be.none
+
+    def test_adiciona_com_chave_faltando(self):
+        self.repositorio.adiciona.when.called_with({'chave_api': 'api'}, {'loja_id': 2}).should.throw(ValueError)
+        len(self.repositorio).should.be.equal(1)
+
+    def test_remove_credencial(self):
+        self.repositorio.remove({'chave_api': 'api', 'chave_loja': 'loja-1'}).should.be.true
+        self.repositorio.busca({'chave_api': 'api', 'chave_loja': 'loja-1'}).should.be.none
+        len(self.repositorio).should.be.equal(0)
+
+
+class TestRepositorioChavesArquivo(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio)
+        self.caminho = os.path.join(self.diretorio, 'chaves.json')
+
+    def test_salva_e_carrega_credenciais(self):
+        repositorio = repositorio_chaves.RepositorioChavesArquivo(['chave_api'], self.caminho)
+        repositorio.adiciona({'chave_api': 'api'}, 10)
+        repositorio.salva()
+        carregado = repositorio_chaves.RepositorioChavesArquivo(['chave_api'], self.caminho)
+        carregado.busca({'chave_api': 'api'}).should.be.equal(10)
+        os.listdir(self.diretorio).should.be.equal(['chaves.json'])
+
+    def test_comeca_vazio_sem_arquivo(self):
+        len(repositorio_chaves.RepositorioChavesArquivo(['chave_api'], self.caminho)).should.be.equal(0)
+
+
+class TestRepositorioChavesDjango(unittest.TestCase):
+    def setUp(self):
+        self.modelo = MagicMock()
+        self.values_list = self.modelo.objects.filter.return_value.values_list
+        self.repositorio = repositorio_chaves.RepositorioChavesDjango(['chave_api'], self.modelo, campo_identidade='loja_id')
+
+    def test_busca_pelo_digest(self):
+        self.values_list.return_value = [7]
+        self.repositorio.busca({'chave_api': 'api'}).should.be.equal(7)
+        self.modelo.objects.filter.assert_called_with(digest=self.repositorio.digest({'chave_api': 'api'}))
+        self.values_list.assert_called_with('loja_id', flat=True)
+
+    def test_retorna_none_se_nao_encontrar(self):
+        self.values_list.return_value = []
+        self.repositorio.busca({'chave_api': 'api'}).should.be.none
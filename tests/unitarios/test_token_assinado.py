@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from autenticacao_api import token_assinado
+from tests.unitarios import base
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_token_assinado(self):
+        arquivo = token_assinado.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class TestVerificadorToken(unittest.TestCase):
+    def setUp(self):
+        self.relogio = base.RelogioFalso()
+        self.verificador = token_assinado.VerificadorToken(self.relogio)
+        self.verificador.adiciona_segredo('s1', 'segredo-1')
+
+    def test_gera_token_no_formato_esperado(self):
+        token = self.verificador.gera(42, 60)
+        token.should.match(r'^v1\.42\.1060\.s1\.[A-Za-z0-9_-]{43}$')
+
+    def test_verifica_token_valido(self):
+        self.verificador.verifica(self.verificador.gera(42, 60)).should.be.equal(42)
+
+    def test_rejeita_token_expirado(self):
+        token = self.verificador.gera(42, 60)
+        self.relogio.agora += 60
+        self.verificador.verifica(token).should.be.none
+
+    def test_rejeita_token_alterado(self):
+        token = self.verificador.gera(42, 60)
+        self.verificador.verifica(token.replace('v1.42.', 'v1.43.')).should.be.none
+
+    def test_rejeita_token_mal_formado(self):
+        self.verificador.verifica('qualquer-coisa').should.be.none
+        self.verificador.verifica('v2.42.1060.s1.assinatura').should.be.none
+        self.verificador.verifica('v1.42.1060.s9.assinatura').should.be.none
+
+    def test_rejeita_token_de_outro_segredo(self):
+        outro = token_assinado.VerificadorToken(self.relogio)
+        outro.adiciona_segredo('s1', 'outro-segredo')
+        self.verificador.verifica(outro.gera(42, 60)).should.be.none
+
+    def test_aceita_tokens_de_todos_os_segredos_ativos(self):
+        antigo = self.verificador.gera(42, 60)
+        self.verificador.adiciona_segredo('s2', 'segredo-2')
+        novo = self.verificador.gera(43, 60)
+        novo.should.contain('.s2.')
+        self.verificador.verifica(antigo).should.be.equal(42)
+        self.verificador.verifica(novo).should.be.equal(43)
+
+    def test_remove_segredo_invalida_seus_tokens(self):
+        token = self.verificador.gera(42, 60)
+        self.verificador.remove_segredo('s1')
+        self.verificador.verifica(token).should.be.none
+        self.verificador.gera.when.called_with(42, 60).should.throw(ValueError)
+
+    def test_id_do_segredo_nao_pode_ter_ponto(self):
+        self.verificador.adiciona_segredo.when.called_with('s.1', 'segredo').should.throw(ValueError)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+
+from autenticacao_api import voo_unico
+from tests.unitarios import base
+
+
+class ValidandoPython(base.ValidandoPython):
+    def test_valida_pep8_em_voo_unico(self):
+        arquivo = voo_unico.__file__.replace("pyc", "py")
+        self.validacao_pep8([arquivo])
+
+
+class TestVooUnico(unittest.TestCase):
+    def setUp(self):
+        self.voo = voo_unico.VooUnico(tempo_limite=5)
+        self.liberar = threading.Event()
+        self.chamadas = []
+
+    def consulta_lenta(self, valor):
+        self.chamadas.append(valor)
+        self.liberar.wait(5)
+        return valor * 2
+
+    def executa_em_threads(self, quantidade):
+        resultados = []
+
+        def executa():
+            resultados.append(self.voo.executa('chave', self.consulta_lenta, 21))
+
+        threads = [threading.Thread(target=executa) for _ in range(quantidade)]
+        for thread in threads:
+            thread.start()
+        while self.voo.coalescidas + self.voo.executadas < quantidade:
+            threading.Event().wait(0.001)
+        self.liberar.set()
+        for thread in threads:
+            thread.join()
+        return resultados
+
+    def test_executa_funcao_e_retorna_resultado(self):
+        self.liberar.set()
+        self.voo.executa('chave', self.consulta_lenta, 21).should.be.equal(42)
+
+    def test_chamadas_simultaneas_executam_uma_vez(self):
+        resultados = self.executa_em_threads(10)
+        resultados.should.be.equal([42] * 10)
+        self.chamadas.should.be.equal([21])
+        self.voo.estatisticas().should.be.equal({'executadas': 1, 'coalescidas': 9, 'tempos_esgotados': 0})
+
+    def test_chamadas_seguidas_executam_de_novo(self):
+        self.liberar.set()
+        self.voo.executa('chave', self.consulta_lenta, 21)
+        self.voo.executa('chave', self.consulta_lenta, 21)
+        self.chamadas.should.have.length_of(2)
+
+    def test_erro_e_repassado_para_quem_espera(self):
+        erros = []
+
+        def falha():
+            self.liberar.wait(5)
+            raise ValueError('falhou')
+
+        def executa():
+            try:
+                self.voo.executa('chave', falha)
+            except ValueError as erro:
+                erros.append(erro)
+
+        threads = [threading.Thread(target=executa) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while self.voo.coalescidas + self.voo.executadas < 3:
+            threading.Event().wait(0.001)
+        self.liberar.set()
+        for thread in threads:
+            thread.join()
+        erros.should.have.length_of(3)
+        self.voo._chamadas.should.be.empty
+
+    def test_espera_esgota_o_tempo_limite(self):
+        self.voo.tempo_limite = 0.01
+        lider = threading.Thread(target=self.voo.executa, args=('chave', self.consulta_lenta, 21))
+        lider.start()
+        while not self.voo.executadas:
+            threading.Event().wait(0.001)
+        self.voo.executa.when.called_with('chave', self.consulta_lenta, 21).should.throw(voo_unico.TempoEsgotado)
+        self.liberar.set()
+        lider.join()
+        self.voo.tempos_esgotados.should.be.equal(1)
+
+    def test_so_a_primeira_espera_esgotada_e_marcada(self):
+        self.voo.tempo_limite = 0.01
+        lider = threading.Thread(target=self.voo.executa, args=('chave', self.consulta_lenta, 21))
+        lider.start()
+        while not self.voo.executadas:
+            threading.Event().wait(0.001)
+        primeiras = []
+        for _ in range(3):
+            try:
+                self.voo.executa('chave', self.consulta_lenta, 21)
+            except voo_unico.TempoEsgotado as erro:
+                primeiras.append(erro.primeira)
+        self.liberar.set()
+        lider.join()
+        primeiras.should.be.equal([True, False, False])